@@ -0,0 +1,369 @@
+# ERGO_ID: ANOMALIES_KOS
+"""
+anomalies_kos.py
+================
+ERGO KOS_COMPTA — Statistiques historiques en flux et montants aberrants
+
+REGLES_BLOCAGE_ABSOLUES (KOS_COMPTA_Agentique.json) : « En cas de montant
+aberrant (> 10× la moyenne historique) → flag NIVEAU_RISQUE: ELEVE
+automatique ». Le LLM n'a pas d'historique : ce module le tient à jour.
+
+Pour chaque fournisseur et chaque compte de charge, une ligne SQLite (mode
+WAL) porte des statistiques mises à jour en O(1) après chaque verdict
+retenu (CONFORME ou AVERTISSEMENT — un REJET ne fait pas la norme) :
+
+    n, moyenne, m2   : moyenne et variance en ligne (algorithme de Welford)
+    min, max
+    digest           : t-digest (centroïdes [moyenne, poids], taille bornée
+                       par COMPRESSION) pour les quantiles p50 / p95
+
+agent_compliance interroge le fournisseur avant l'appel LLM (une lecture
+par clé primaire) et joint un indice compact au prompt ; router_verdict
+contrôle fournisseur et compte imputé et force niveau_risque = ELEVE si le
+montant dépasse KOS_ANOMALIE_FACTEUR × la moyenne, avec au moins
+KOS_ANOMALIE_HISTORIQUE_MIN montants connus. Montants TTC en centimes.
+
+Usage :
+    python anomalies_kos.py --afficher
+    python anomalies_kos.py --afficher --fournisseur Maison_Champagne_Dupont --json
+    python anomalies_kos.py --reconstruire        # reprise depuis AUDIT_LEDGER (ledger_audit.py)
+
+ERGO_REGISTRY:
+    role         : Statistiques en flux (Welford + t-digest) par fournisseur / compte ; flag des montants aberrants
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib), montants.py, ledger_audit.py (reconstruction)
+    entrees      : verdicts agent_compliance (frontmatter + imputation_recommandee)
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/STATS_KOS.sqlite3, niveau_risque force a ELEVE
+    variable_env : KOS_ANOMALIE_FACTEUR (optionnel, défaut 10), KOS_ANOMALIE_HISTORIQUE_MIN (optionnel, défaut 5)
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import montants
+
+
+STATS_DB = Path(__file__).parent / "logs" / "STATS_KOS.sqlite3"
+
+FACTEUR_ABERRANT = float(os.environ.get("KOS_ANOMALIE_FACTEUR", "10"))
+HISTORIQUE_MIN   = int(os.environ.get("KOS_ANOMALIE_HISTORIQUE_MIN", "5"))
+COMPRESSION      = 100        # t-digest : ~COMPRESSION centroïdes après compression
+VERDICTS_RETENUS = ("CONFORME", "AVERTISSEMENT")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS statistiques (
+    dimension  TEXT    NOT NULL,
+    cle        TEXT    NOT NULL,
+    n          INTEGER NOT NULL,
+    moyenne    REAL    NOT NULL,
+    m2         REAL    NOT NULL,
+    min        INTEGER NOT NULL,
+    max        INTEGER NOT NULL,
+    digest     TEXT    NOT NULL,
+    maj        TEXT    NOT NULL,
+    PRIMARY KEY (dimension, cle)
+) WITHOUT ROWID;
+"""
+
+
+def connecter(chemin: Path = None) -> sqlite3.Connection:
+    """Ouvre la base de statistiques (création du schéma au premier accès), en mode WAL.
+
+    Args:
+        chemin: Fichier SQLite (défaut : STATS_DB).
+
+    Returns:
+        Connexion sqlite3 (lignes accessibles par nom de colonne).
+    """
+    chemin = chemin or STATS_DB
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(chemin, timeout=30)
+    cnx.row_factory = sqlite3.Row
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    cnx.executescript(SCHEMA)
+    return cnx
+
+
+# ─────────────────────────────────────────────
+# T-DIGEST
+# ─────────────────────────────────────────────
+
+def _td_compresser(centroides: list[list[float]], compression: int = COMPRESSION) -> list[list[float]]:
+    """Fusionne les centroïdes voisins : poids max 4·N·q(1 − q)/compression (queues précises)."""
+    total = sum(w for _, w in centroides)
+    fusion = [list(centroides[0])]
+    cumul = 0.0
+    for moyenne, poids in centroides[1:]:
+        courant = fusion[-1]
+        q = (cumul + (courant[1] + poids) / 2) / total
+        if courant[1] + poids <= max(1.0, 4 * total * q * (1 - q) / compression):
+            courant[0] += (moyenne - courant[0]) * poids / (courant[1] + poids)
+            courant[1] += poids
+        else:
+            cumul += courant[1]
+            fusion.append([moyenne, poids])
+    return fusion
+
+
+def _td_ajouter(centroides: list[list[float]], valeur: float) -> list[list[float]]:
+    """Insère une valeur (centroïde de poids 1) ; compression au-delà de 2 × COMPRESSION centroïdes."""
+    bisect.insort(centroides, [valeur, 1.0])
+    return _td_compresser(centroides) if len(centroides) > 2 * COMPRESSION else centroides
+
+
+def _td_quantile(centroides: list[list[float]], q: float) -> Optional[float]:
+    """Quantile q (0-1) par interpolation linéaire entre centres de centroïdes."""
+    if not centroides:
+        return None
+    total = sum(w for _, w in centroides)
+    cible = q * total
+    cumul = 0.0
+    precedent = None
+    for moyenne, poids in centroides:
+        centre = cumul + poids / 2
+        if cible <= centre:
+            if precedent is None:
+                return moyenne
+            p_moyenne, p_centre = precedent
+            return p_moyenne + (moyenne - p_moyenne) * (cible - p_centre) / (centre - p_centre)
+        precedent = (moyenne, centre)
+        cumul += poids
+    return centroides[-1][0]
+
+
+# ─────────────────────────────────────────────
+# MISE À JOUR ET LECTURE
+# ─────────────────────────────────────────────
+
+def _ajouter(cnx: sqlite3.Connection, dimension: str, cle: str, centimes: int) -> None:
+    """Met à jour les statistiques d'une clé (Welford + t-digest), dans la transaction courante."""
+    ligne = cnx.execute(
+        "SELECT n, moyenne, m2, min, max, digest FROM statistiques WHERE dimension = ? AND cle = ?",
+        (dimension, cle),
+    ).fetchone()
+    if ligne is None:
+        n, moyenne, m2, minimum, maximum, digest = 0, 0.0, 0.0, centimes, centimes, []
+    else:
+        n, moyenne, m2 = ligne["n"], ligne["moyenne"], ligne["m2"]
+        minimum, maximum, digest = min(ligne["min"], centimes), max(ligne["max"], centimes), json.loads(ligne["digest"])
+    n += 1
+    ecart = centimes - moyenne
+    moyenne += ecart / n
+    m2 += ecart * (centimes - moyenne)
+    cnx.execute(
+        "INSERT OR REPLACE INTO statistiques (dimension, cle, n, moyenne, m2, min, max, digest, maj) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (dimension, cle, n, moyenne, m2, minimum, maximum,
+         json.dumps(_td_ajouter(digest, float(centimes)), separators=(",", ":")),
+         datetime.now().isoformat(timespec="seconds")),
+    )
+
+
+def statistiques(dimension: str, cle: Optional[str], cnx: sqlite3.Connection = None) -> Optional[dict]:
+    """Statistiques d'un fournisseur ou d'un compte (lecture par clé primaire).
+
+    Args:
+        dimension: "fournisseur" ou "compte".
+        cle:       Nom du fournisseur / numéro de compte.
+        cnx:       Connexion existante (défaut : ouverte pour l'appel).
+
+    Returns:
+        {"n", "moyenne", "ecart_type", "min", "max", "p50", "p95"} en centimes,
+        ou None si la clé est inconnue.
+    """
+    if not cle:
+        return None
+    if cnx is None:
+        with closing(connecter()) as cnx:
+            return statistiques(dimension, cle, cnx)
+    ligne = cnx.execute(
+        "SELECT n, moyenne, m2, min, max, digest FROM statistiques WHERE dimension = ? AND cle = ?",
+        (dimension, str(cle)),
+    ).fetchone()
+    if ligne is None:
+        return None
+    digest = json.loads(ligne["digest"])
+    return {
+        "n":          ligne["n"],
+        "moyenne":    round(ligne["moyenne"]),
+        "ecart_type": round(math.sqrt(ligne["m2"] / (ligne["n"] - 1))) if ligne["n"] > 1 else 0,
+        "min":        ligne["min"],
+        "max":        ligne["max"],
+        "p50":        round(_td_quantile(digest, 0.50)),
+        "p95":        round(_td_quantile(digest, 0.95)),
+    }
+
+
+def evaluer(dimension: str, cle: Optional[str], centimes: Optional[int], cnx: sqlite3.Connection = None) -> Optional[dict]:
+    """Compare un montant à l'historique d'une clé (règle du montant aberrant).
+
+    Args:
+        dimension: "fournisseur" ou "compte".
+        cle:       Nom du fournisseur / numéro de compte.
+        centimes:  Montant TTC du document.
+        cnx:       Connexion existante (défaut : ouverte pour l'appel).
+
+    Returns:
+        Statistiques de la clé enrichies de dimension, cle, montant, ratio
+        (montant / moyenne) et aberrant (bool) ; None sans historique ou sans montant.
+    """
+    stats = statistiques(dimension, cle, cnx)
+    if stats is None or centimes is None:
+        return None
+    ratio = centimes / stats["moyenne"] if stats["moyenne"] > 0 else None
+    return {
+        **stats, "dimension": dimension, "cle": str(cle), "montant": centimes,
+        "ratio": round(ratio, 1) if ratio is not None else None,
+        "aberrant": ratio is not None and stats["n"] >= HISTORIQUE_MIN and ratio > FACTEUR_ABERRANT,
+    }
+
+
+def montant_document(facture: dict, verdict: Optional[dict] = None) -> Optional[int]:
+    """Montant TTC d'un document en centimes : frontmatter, à défaut imputation LLM (None si illisible)."""
+    imputation = (verdict or {}).get("imputation_recommandee") or {}
+    for valeur in (facture["frontmatter"].get("montant_ttc"), imputation.get("montant_ttc")):
+        try:
+            centimes = montants.en_centimes(valeur)
+        except ValueError:
+            continue
+        if centimes:
+            return centimes
+    return None
+
+
+def indice_prompt(evaluation: Optional[dict]) -> str:
+    """Ligne d'historique fournisseur à joindre au prompt d'audit (chaîne vide sans historique)."""
+    if evaluation is None:
+        return ""
+    ligne = (f"Historique fournisseur : {evaluation['n']} document(s), moyenne "
+             f"{montants.formater(evaluation['moyenne'])}, p50 {montants.formater(evaluation['p50'])}, "
+             f"p95 {montants.formater(evaluation['p95'])}")
+    if evaluation["ratio"] is not None:
+        ligne += f" — montant = {evaluation['ratio']:g}× la moyenne"
+    if evaluation["aberrant"]:
+        ligne += f" (ABERRANT > {FACTEUR_ABERRANT:g}× : niveau_risque ELEVE)"
+    return ligne
+
+
+def controler_verdict(facture: dict, verdict: dict) -> Optional[str]:
+    """Force niveau_risque = ELEVE si le montant est aberrant pour le fournisseur ou le compte imputé.
+
+    Args:
+        facture: Dictionnaire produit par agent_compliance.lire_facture().
+        verdict: Verdict LLM (modifié en place : niveau_risque, anomalie_montant).
+
+    Returns:
+        Motif de l'anomalie, ou None si le montant est dans la norme.
+    """
+    centimes = montant_document(facture, verdict)
+    compte = (verdict.get("imputation_recommandee") or {}).get("compte_debit")
+    with closing(connecter()) as cnx:
+        evaluations = [evaluer("fournisseur", facture["frontmatter"].get("fournisseur"), centimes, cnx),
+                       evaluer("compte", compte, centimes, cnx)]
+    aberrantes = [e for e in evaluations if e and e["aberrant"]]
+    if not aberrantes:
+        return None
+    motif = "; ".join(
+        f"{montants.formater(e['montant'])} = {e['ratio']:g}× la moyenne historique du {e['dimension']} "
+        f"{e['cle']} ({montants.formater(e['moyenne'])}, n={e['n']})" for e in aberrantes
+    )
+    verdict["niveau_risque"] = "ELEVE"
+    verdict["anomalie_montant"] = f"Montant aberrant (> {FACTEUR_ABERRANT:g}× la moyenne) : {motif}"
+    return motif
+
+
+def enregistrer(facture: dict, verdict: dict) -> bool:
+    """Ajoute le montant d'un document retenu aux statistiques de son fournisseur et de son compte.
+
+    Args:
+        facture: Dictionnaire produit par agent_compliance.lire_facture().
+        verdict: Verdict final.
+
+    Returns:
+        True si les statistiques ont été mises à jour.
+    """
+    centimes = montant_document(facture, verdict)
+    if verdict.get("verdict") not in VERDICTS_RETENUS or centimes is None:
+        return False
+    fournisseur = facture["frontmatter"].get("fournisseur")
+    compte = (verdict.get("imputation_recommandee") or {}).get("compte_debit")
+    with closing(connecter()) as cnx, cnx:
+        cnx.execute("BEGIN IMMEDIATE")              # lecture-modification-écriture (watcher concurrent)
+        if fournisseur:
+            _ajouter(cnx, "fournisseur", str(fournisseur), centimes)
+        if compte:
+            _ajouter(cnx, "compte", str(compte), centimes)
+    return True
+
+
+def reconstruire() -> int:
+    """Recalcule les statistiques fournisseur depuis le registre des audits (reprise d'historique).
+
+    AUDIT_LEDGER ne conserve pas le compte imputé : seule la dimension
+    fournisseur est reprise ; la dimension compte se construit au fil des verdicts.
+
+    Returns:
+        Nombre de montants repris.
+    """
+    import ledger_audit
+    with closing(ledger_audit.connecter()) as registre:
+        lignes = registre.execute(
+            "SELECT fournisseur, montant_ttc_centimes FROM audits WHERE fournisseur IS NOT NULL "
+            f"AND montant_ttc_centimes > 0 AND verdict IN ({','.join('?' * len(VERDICTS_RETENUS))}) "
+            "ORDER BY date_audit", VERDICTS_RETENUS
+        ).fetchall()
+    with closing(connecter()) as cnx, cnx:
+        cnx.execute("DELETE FROM statistiques WHERE dimension = 'fournisseur'")
+        for ligne in lignes:
+            _ajouter(cnx, "fournisseur", ligne["fournisseur"], ligne["montant_ttc_centimes"])
+    return len(lignes)
+
+
+def main() -> None:
+    """Point d'entrée CLI : consultation et reprise des statistiques historiques."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Statistiques historiques et montants aberrants")
+    parser.add_argument("--afficher", action="store_true", help="Statistiques par fournisseur et par compte")
+    parser.add_argument("--fournisseur", help="Limiter à un fournisseur")
+    parser.add_argument("--compte", help="Limiter à un compte")
+    parser.add_argument("--reconstruire", action="store_true", help="Reprendre l'historique depuis AUDIT_LEDGER")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    if args.reconstruire:
+        print(f"  {reconstruire()} montant(s) repris dans {STATS_DB.name}")
+    if args.afficher:
+        with closing(connecter()) as cnx:
+            if args.fournisseur or args.compte:
+                cles = [("fournisseur", args.fournisseur)] if args.fournisseur else []
+                cles += [("compte", args.compte)] if args.compte else []
+            else:
+                cles = [(l["dimension"], l["cle"]) for l in
+                        cnx.execute("SELECT dimension, cle FROM statistiques ORDER BY dimension, cle")]
+            resultats = [{"dimension": d, "cle": c, **(statistiques(d, c, cnx) or {})} for d, c in cles]
+        if args.json:
+            print(json.dumps(resultats, ensure_ascii=False, indent=2))
+        for r in [] if args.json else resultats:
+            if "n" not in r:
+                print(f"  {r['dimension']:11} {r['cle']:30} — aucun historique")
+                continue
+            print(f"  {r['dimension']:11} {r['cle'][:30]:30} n={r['n']:<6} moyenne {montants.formater(r['moyenne']):>12}  "
+                  f"p50 {montants.formater(r['p50']):>12}  p95 {montants.formater(r['p95']):>12}  "
+                  f"seuil ×{FACTEUR_ABERRANT:g} {montants.formater(round(r['moyenne'] * FACTEUR_ABERRANT)):>14}")
+    if not (args.afficher or args.reconstruire):
+        parser.print_help()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# ERGO_ID: ARCHIVE_PARQUET
+"""
+archive_parquet.py
+==================
+ERGO KOS_COMPTA — Archive colonnaire (Parquet) des écritures exportées
+
+export_erp ajoute chaque lot d'écritures exportées (modèle formats_erp) à un
+dataset Parquet partitionné par exercice et par mois (partitionnement Hive) :
+
+    E4_AUDIT_ET_ROUTAGE/E4.3_Imports_ERP/ecritures/
+        exercice=2026/mois=03/<horodatage export>-<n° première écriture>.parquet
+
+Analyses, rapprochements et génération de FEC lisent ainsi des années
+d'écritures en ne chargeant que les colonnes utiles (lire()), sans reparser
+les CSV ni les payloads archivés. Le schéma est fixe (SCHEMA_ID) ; les
+montants sont en centimes entiers (montants.py).
+
+Chaque fichier est écrit atomiquement et son nom ne dépend que de l'export et
+du numéro de sa première écriture : un lot rejoué après reprise (checkpoint
+export_erp) remplace le fichier du lot interrompu, sans doublon.
+
+pyarrow est optionnel : sans lui, l'archive est désactivée (avertissement)
+et export_erp produit ses fichiers d'import comme avant.
+
+Usage :
+    python archive_parquet.py --resume
+    python archive_parquet.py --resume --exercice 2026
+
+ERGO_REGISTRY:
+    role         : Archive Parquet partitionnee (exercice / mois) des ecritures exportees
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : pyarrow (optionnel), montants.py
+    entrees      : ecritures formats_erp (via export_erp.py)
+    sorties      : E4_AUDIT_ET_ROUTAGE/E4.3_Imports_ERP/ecritures/exercice=*/mois=*/*.parquet
+    variable_env : KOS_ARCHIVE_PARQUET (optionnel, "off" pour désactiver),
+                   KOS_EXERCICE_DEBUT (optionnel, mois d'ouverture de l'exercice, défaut 1)
+"""
+
+import argparse
+import logging
+import os
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+import montants
+
+
+BASE_DIR    = Path(__file__).parent.parent
+ARCHIVE_DIR = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.3_Imports_ERP" / "ecritures"
+SCHEMA_ID   = "kos_compta/ecriture/1"
+
+log = logging.getLogger("archive_parquet")
+
+
+@lru_cache(maxsize=1)
+def _pyarrow():
+    """Importe pyarrow une seule fois ; None (avec avertissement) s'il n'est pas installé."""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        log.warning("pyarrow absent (pip install pyarrow) — archive Parquet des écritures désactivée")
+        return None
+    return pyarrow
+
+
+def actif() -> bool:
+    """Indique si l'archive Parquet doit être alimentée (pyarrow installé et KOS_ARCHIVE_PARQUET ≠ off)."""
+    if os.environ.get("KOS_ARCHIVE_PARQUET", "on").strip().lower() in ("off", "0", "false", "non"):
+        return False
+    return _pyarrow() is not None
+
+
+@lru_cache(maxsize=1)
+def schema():
+    """Schéma Arrow stable des écritures archivées (colonnes de partition exclues).
+
+    Returns:
+        pyarrow.Schema portant SCHEMA_ID dans ses métadonnées.
+    """
+    pa = _pyarrow()
+    return pa.schema([
+        ("numero",     pa.int64()),
+        ("date",       pa.date32()),
+        ("journal",    pa.string()),
+        ("compte",     pa.string()),
+        ("compte_lib", pa.string()),
+        ("sens",       pa.string()),
+        ("montant",    pa.int64()),
+        ("libelle",    pa.string()),
+        ("piece",      pa.string()),
+        ("date_piece", pa.date32()),
+        ("tiers",      pa.string()),
+        ("statut",     pa.string()),
+        ("source",     pa.string()),
+        ("export",     pa.string()),
+    ], metadata={"kos_schema": SCHEMA_ID, "montant": "centimes"})
+
+
+def exercice(jour: date) -> int:
+    """Exercice comptable d'une date, désigné par son année de clôture.
+
+    Avec KOS_EXERCICE_DEBUT=7 (exercice juillet → juin), le 15/09/2026
+    appartient à l'exercice 2027.
+
+    Args:
+        jour: Date d'écriture.
+
+    Returns:
+        Année de clôture de l'exercice.
+    """
+    debut = int(os.environ.get("KOS_EXERCICE_DEBUT", "1"))
+    return jour.year + 1 if debut > 1 and jour.month >= debut else jour.year
+
+
+def ajouter(ecritures: list[dict], export: str) -> int:
+    """Ajoute un lot d'écritures au dataset, un fichier par partition (exercice, mois).
+
+    Args:
+        ecritures: Écritures numérotées et datées (modèle formats_erp + "source" :
+                   nom du payload d'origine).
+        export:    Identifiant de l'export (horodatage des fichiers d'import).
+
+    Returns:
+        Nombre d'écritures archivées.
+    """
+    if not ecritures:
+        return 0
+    pa = _pyarrow()
+    partitions: dict[tuple[int, int], list[dict]] = {}
+    for e in ecritures:
+        jour = date.fromisoformat(e["date"])
+        partitions.setdefault((exercice(jour), jour.month), []).append(e)
+
+    for (annee, mois), lignes in partitions.items():
+        colonnes = {nom: [e.get(nom, "") for e in lignes] for nom in schema().names}
+        colonnes["date"]       = [date.fromisoformat(e["date"]) for e in lignes]
+        colonnes["date_piece"] = [date.fromisoformat(e["date_piece"]) if e.get("date_piece") else None
+                                  for e in lignes]
+        colonnes["export"]     = [export] * len(lignes)
+        table = pa.table(colonnes, schema=schema())
+
+        dossier = ARCHIVE_DIR / f"exercice={annee}" / f"mois={mois:02d}"
+        dossier.mkdir(parents=True, exist_ok=True)
+        cible = dossier / f"{export}-{lignes[0]['numero']:08d}.parquet"
+        tmp = dossier / f".{cible.name}.tmp"              # préfixe "." : ignoré par les lecteurs du dataset
+        pa.parquet.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, cible)
+    return len(ecritures)
+
+
+def lire(colonnes: list[str] | None = None, filtre=None):
+    """Lit le dataset archivé avec élagage de colonnes et de partitions.
+
+    Args:
+        colonnes: Colonnes à charger (None = toutes) ; "exercice" et "mois"
+                  sont disponibles comme colonnes de partition.
+        filtre:   Expression pyarrow.dataset (ex: ds.field("exercice") == 2026).
+
+    Returns:
+        pyarrow.Table, ou None si pyarrow est absent ou l'archive vide.
+    """
+    pa = _pyarrow()
+    if pa is None or not ARCHIVE_DIR.exists():
+        return None
+    dataset = pa.dataset.dataset(ARCHIVE_DIR, format="parquet", partitioning="hive", schema=pa.unify_schemas([
+        schema(), pa.schema([("exercice", pa.int32()), ("mois", pa.int32())])
+    ]))
+    return dataset.to_table(columns=colonnes, filter=filtre)
+
+
+def main() -> None:
+    """Point d'entrée CLI : totaux débit / crédit par exercice, mois et journal."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Archive Parquet des écritures exportées")
+    parser.add_argument("--resume", action="store_true", help="Totaux par exercice, mois et journal")
+    parser.add_argument("--exercice", type=int, help="Limiter à un exercice (année de clôture)")
+    args = parser.parse_args()
+    if not args.resume:
+        parser.print_help()
+        return
+
+    pa = _pyarrow()
+    filtre = pa.dataset.field("exercice") == args.exercice if pa is not None and args.exercice else None
+    table = lire(["exercice", "mois", "journal", "sens", "montant"], filtre)
+    if table is None or table.num_rows == 0:
+        print("  Archive vide.")
+        return
+    totaux = table.group_by(["exercice", "mois", "journal", "sens"]).aggregate([("montant", "sum")])
+    resume: dict[tuple, dict[str, int]] = {}
+    for ligne in totaux.to_pylist():
+        cle = (ligne["exercice"], ligne["mois"], ligne["journal"])
+        resume.setdefault(cle, {"D": 0, "C": 0})[ligne["sens"]] = ligne["montant_sum"]
+    for (annee, mois, journal), sens in sorted(resume.items()):
+        equilibre = "=" if sens["D"] == sens["C"] else "≠"
+        print(f"  {annee} / {mois:02d}  {journal:5}  Débit {montants.formater(sens['D']):>16} {equilibre} "
+              f"Crédit {montants.formater(sens['C']):>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+# ERGO_ID: BALANCE_KOS
+"""
+balance_kos.py
+==============
+ERGO KOS_COMPTA — Balance comptable incrémentale (compte / tiers / mois)
+
+Soldes débit / crédit matérialisés dans une base SQLite (mode WAL), mis à
+jour par export_erp à chaque lot écrit, en O(lignes du lot) : les écritures
+sont agrégées en mémoire par (compte, tiers, mois) puis ajoutées par UPSERT.
+Les questions « solde du 401 Dupont », « balance de mars » ou « montant moyen
+des pièces de ce fournisseur » (règle du montant aberrant > 10× la moyenne
+historique, REGLES_BLOCAGE_ABSOLUES) sont des lectures par clé primaire, sans
+relire les exports passés.
+
+    soldes    : (compte, tiers, mois) → débit, crédit, lignes, pièces
+    comptes   : compte → libellé, débit, crédit, lignes      (balance générale)
+    tiers     : tiers  → débit, crédit, pièces               (balance auxiliaire)
+    mouvements: deltas de chaque lot de l'export en cours (annulation à la reprise)
+
+Montants en centimes entiers (montants.py). Le tiers n'est porté que par la
+ligne fournisseur (401) : la balance auxiliaire totalise ces lignes, une
+pièce par ligne au crédit.
+
+Retour arrière :
+    - annuler_apres() : deltas des lots postérieurs au checkpoint d'export_erp
+    - instantane() / restaurer() : copie nommée des soldes (avant clôture,
+      avant une reprise d'historique…)
+
+Usage :
+    python balance_kos.py --balance
+    python balance_kos.py --balance --mois 2026-03 --json
+    python balance_kos.py --compte 44566
+    python balance_kos.py --tiers "Maison Champagne Dupont"
+    python balance_kos.py --instantane cloture_2026
+    python balance_kos.py --restaurer cloture_2026
+    python balance_kos.py --reconstruire          # depuis l'archive Parquet (archive_parquet.py)
+
+ERGO_REGISTRY:
+    role         : Balance generale et auxiliaire incrementale (SQLite) par compte, tiers et mois
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib), montants.py, archive_parquet.py (reconstruction)
+    entrees      : ecritures formats_erp (via export_erp.py), archive Parquet des ecritures
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/BALANCE_KOS.sqlite3
+    variable_env : (aucune)
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import montants
+
+
+BALANCE_DB = Path(__file__).parent / "logs" / "BALANCE_KOS.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS soldes (
+    compte  TEXT    NOT NULL,
+    tiers   TEXT    NOT NULL DEFAULT '',
+    mois    TEXT    NOT NULL,
+    debit   INTEGER NOT NULL DEFAULT 0,
+    credit  INTEGER NOT NULL DEFAULT 0,
+    lignes  INTEGER NOT NULL DEFAULT 0,
+    pieces  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (compte, tiers, mois)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS comptes (
+    compte      TEXT    PRIMARY KEY,
+    compte_lib  TEXT    NOT NULL DEFAULT '',
+    debit       INTEGER NOT NULL DEFAULT 0,
+    credit      INTEGER NOT NULL DEFAULT 0,
+    lignes      INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tiers (
+    tiers   TEXT    PRIMARY KEY,
+    debit   INTEGER NOT NULL DEFAULT 0,
+    credit  INTEGER NOT NULL DEFAULT 0,
+    pieces  INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mouvements (
+    export          TEXT    NOT NULL,
+    premiere_ligne  INTEGER NOT NULL,
+    compte          TEXT    NOT NULL,
+    compte_lib      TEXT    NOT NULL,
+    tiers           TEXT    NOT NULL,
+    mois            TEXT    NOT NULL,
+    debit           INTEGER NOT NULL,
+    credit          INTEGER NOT NULL,
+    lignes          INTEGER NOT NULL,
+    pieces          INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS instantanes (
+    nom     TEXT    NOT NULL,
+    date    TEXT    NOT NULL,
+    compte  TEXT    NOT NULL,
+    tiers   TEXT    NOT NULL,
+    mois    TEXT    NOT NULL,
+    debit   INTEGER NOT NULL,
+    credit  INTEGER NOT NULL,
+    lignes  INTEGER NOT NULL,
+    pieces  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_soldes_mois       ON soldes (mois);
+CREATE INDEX IF NOT EXISTS idx_mouvements_export ON mouvements (export, premiere_ligne);
+CREATE INDEX IF NOT EXISTS idx_instantanes_nom   ON instantanes (nom);
+"""
+
+_UPSERT_SOLDES = (
+    "INSERT INTO soldes (compte, tiers, mois, debit, credit, lignes, pieces) VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (compte, tiers, mois) DO UPDATE SET debit = debit + excluded.debit, "
+    "credit = credit + excluded.credit, lignes = lignes + excluded.lignes, pieces = pieces + excluded.pieces"
+)
+_UPSERT_COMPTES = (
+    "INSERT INTO comptes (compte, compte_lib, debit, credit, lignes) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (compte) DO UPDATE SET compte_lib = COALESCE(NULLIF(excluded.compte_lib, ''), compte_lib), "
+    "debit = debit + excluded.debit, credit = credit + excluded.credit, lignes = lignes + excluded.lignes"
+)
+_UPSERT_TIERS = (
+    "INSERT INTO tiers (tiers, debit, credit, pieces) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (tiers) DO UPDATE SET debit = debit + excluded.debit, "
+    "credit = credit + excluded.credit, pieces = pieces + excluded.pieces"
+)
+
+
+def connecter(chemin: Path = None) -> sqlite3.Connection:
+    """Ouvre la balance (création du schéma au premier accès), en mode WAL.
+
+    Args:
+        chemin: Fichier SQLite (défaut : BALANCE_DB).
+
+    Returns:
+        Connexion sqlite3 (lignes accessibles par nom de colonne).
+    """
+    chemin = chemin or BALANCE_DB
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(chemin, timeout=30)
+    cnx.row_factory = sqlite3.Row
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    cnx.executescript(SCHEMA)
+    return cnx
+
+
+def _agreger(ecritures: list[dict]) -> dict[tuple[str, str, str], list]:
+    """Agrège des écritures par (compte, tiers, mois) → [libellé, débit, crédit, lignes, pièces]."""
+    deltas: dict[tuple[str, str, str], list] = {}
+    for e in ecritures:
+        cle = (e["compte"], e.get("tiers") or "", e["date"][:7])
+        delta = deltas.get(cle)
+        if delta is None:
+            delta = deltas[cle] = [e.get("compte_lib") or "", 0, 0, 0, 0]
+        if e["sens"] == "D":
+            delta[1] += e["montant"]
+        else:
+            delta[2] += e["montant"]
+            if cle[1]:
+                delta[4] += 1
+        delta[3] += 1
+    return deltas
+
+
+def _reporter(cnx: sqlite3.Connection, deltas: dict[tuple[str, str, str], list], signe: int) -> None:
+    """Ajoute (signe=1) ou retranche (signe=-1) des deltas aux trois niveaux de balance."""
+    soldes, comptes, tiers = [], {}, {}
+    for (compte, nom_tiers, mois), (libelle, debit, credit, lignes, pieces) in deltas.items():
+        debit, credit, lignes, pieces = debit * signe, credit * signe, lignes * signe, pieces * signe
+        soldes.append((compte, nom_tiers, mois, debit, credit, lignes, pieces))
+        c = comptes.setdefault(compte, [libelle, 0, 0, 0])
+        c[0] = c[0] or libelle
+        c[1] += debit
+        c[2] += credit
+        c[3] += lignes
+        if nom_tiers:
+            t = tiers.setdefault(nom_tiers, [0, 0, 0])
+            t[0] += debit
+            t[1] += credit
+            t[2] += pieces
+    cnx.executemany(_UPSERT_SOLDES, soldes)
+    cnx.executemany(_UPSERT_COMPTES, [(compte, *valeurs) for compte, valeurs in comptes.items()])
+    cnx.executemany(_UPSERT_TIERS, [(nom, *valeurs) for nom, valeurs in tiers.items()])
+    if signe < 0:
+        cnx.execute("DELETE FROM soldes WHERE lignes = 0")
+
+
+def appliquer(cnx: sqlite3.Connection, export: str, premiere_ligne: int, ecritures: list[dict]) -> int:
+    """Reporte un lot d'écritures exportées dans la balance, en une transaction.
+
+    Les deltas du lot sont aussi conservés (table mouvements) jusqu'à clore()
+    pour pouvoir être annulés si l'export reprend avant ce lot.
+
+    Args:
+        cnx:            Connexion à la balance.
+        export:         Identifiant de l'export (horodatage export_erp).
+        premiere_ligne: Numéro de la première ligne du lot dans les fichiers d'import.
+        ecritures:      Écritures datées du lot (modèle formats_erp, montants en centimes).
+
+    Returns:
+        Nombre de clés (compte, tiers, mois) mises à jour.
+    """
+    deltas = _agreger(ecritures)
+    with cnx:
+        _reporter(cnx, deltas, 1)
+        cnx.executemany(
+            "INSERT INTO mouvements (export, premiere_ligne, compte, compte_lib, tiers, mois, debit, credit, "
+            "lignes, pieces) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(export, premiere_ligne, compte, libelle, tiers, mois, *totaux)
+             for (compte, tiers, mois), (libelle, *totaux) in deltas.items()],
+        )
+    return len(deltas)
+
+
+def annuler_apres(cnx: sqlite3.Connection, export: str, lignes: int) -> int:
+    """Retranche les lots d'un export postérieurs à `lignes` (reprise après crash).
+
+    Args:
+        cnx:    Connexion à la balance.
+        export: Identifiant de l'export repris.
+        lignes: Nombre de lignes conservées par le checkpoint.
+
+    Returns:
+        Nombre de lignes d'écriture retranchées.
+    """
+    with cnx:
+        lots = cnx.execute(
+            "SELECT compte, compte_lib, tiers, mois, debit, credit, lignes, pieces FROM mouvements "
+            "WHERE export = ? AND premiere_ligne > ?", (export, lignes)
+        ).fetchall()
+        deltas: dict[tuple[str, str, str], list] = {}
+        for m in lots:
+            delta = deltas.setdefault((m["compte"], m["tiers"], m["mois"]), [m["compte_lib"], 0, 0, 0, 0])
+            for i, colonne in enumerate(("debit", "credit", "lignes", "pieces"), start=1):
+                delta[i] += m[colonne]
+        _reporter(cnx, deltas, -1)
+        cnx.execute("DELETE FROM mouvements WHERE export = ? AND premiere_ligne > ?", (export, lignes))
+    return sum(delta[3] for delta in deltas.values())
+
+
+def clore(cnx: sqlite3.Connection, export: str) -> None:
+    """Supprime les deltas d'un export terminé (plus d'annulation possible)."""
+    with cnx:
+        cnx.execute("DELETE FROM mouvements WHERE export = ?", (export,))
+
+
+# ─────────────────────────────────────────────
+# INSTANTANÉS
+# ─────────────────────────────────────────────
+
+def instantane(cnx: sqlite3.Connection, nom: str) -> int:
+    """Enregistre une copie nommée des soldes (remplace un instantané de même nom).
+
+    Args:
+        cnx: Connexion à la balance.
+        nom: Nom de l'instantané (ex: "cloture_2026").
+
+    Returns:
+        Nombre de soldes copiés.
+    """
+    with cnx:
+        cnx.execute("DELETE FROM instantanes WHERE nom = ?", (nom,))
+        return cnx.execute(
+            "INSERT INTO instantanes SELECT ?, ?, compte, tiers, mois, debit, credit, lignes, pieces FROM soldes",
+            (nom, datetime.now().isoformat(timespec="seconds")),
+        ).rowcount
+
+
+def restaurer(cnx: sqlite3.Connection, nom: str) -> int:
+    """Ramène la balance à un instantané ; balances générale et auxiliaire recalculées.
+
+    Les deltas en attente (mouvements) sont abandonnés : ils ne s'appliquent
+    plus aux soldes restaurés.
+
+    Args:
+        cnx: Connexion à la balance.
+        nom: Nom de l'instantané.
+
+    Returns:
+        Nombre de soldes restaurés.
+
+    Raises:
+        ValueError: Si l'instantané n'existe pas.
+    """
+    if cnx.execute("SELECT 1 FROM instantanes WHERE nom = ? LIMIT 1", (nom,)).fetchone() is None:
+        raise ValueError(f"Instantané inconnu : {nom!r}")
+    with cnx:
+        cnx.execute("DELETE FROM soldes")
+        restaures = cnx.execute(
+            "INSERT INTO soldes SELECT compte, tiers, mois, debit, credit, lignes, pieces "
+            "FROM instantanes WHERE nom = ?", (nom,)
+        ).rowcount
+        cnx.execute("UPDATE comptes SET debit = 0, credit = 0, lignes = 0")
+        cnx.execute(
+            "INSERT INTO comptes (compte, debit, credit, lignes) "
+            "SELECT compte, SUM(debit), SUM(credit), SUM(lignes) FROM soldes WHERE true GROUP BY compte "
+            "ON CONFLICT (compte) DO UPDATE SET debit = excluded.debit, credit = excluded.credit, "
+            "lignes = excluded.lignes"
+        )
+        cnx.execute("DELETE FROM comptes WHERE lignes = 0")
+        cnx.execute("DELETE FROM tiers")
+        cnx.execute(
+            "INSERT INTO tiers SELECT tiers, SUM(debit), SUM(credit), SUM(pieces) FROM soldes "
+            "WHERE tiers != '' GROUP BY tiers"
+        )
+        cnx.execute("DELETE FROM mouvements")
+    return restaures
+
+
+def reconstruire(cnx: sqlite3.Connection) -> Optional[int]:
+    """Recalcule toute la balance depuis l'archive Parquet des écritures (reprise d'historique).
+
+    Seul parcours complet de l'historique : à faire une fois, avant le
+    premier export incrémental, ou après une restauration de l'archive.
+
+    Returns:
+        Nombre d'écritures reprises, None si l'archive est indisponible (pyarrow absent).
+    """
+    import archive_parquet
+    table = archive_parquet.lire(["date", "compte", "compte_lib", "tiers", "sens", "montant"])
+    if table is None:
+        return None
+    ecritures = table.to_pylist()
+    for e in ecritures:
+        e["date"] = e["date"].isoformat()
+    with cnx:
+        for nom_table in ("soldes", "comptes", "tiers", "mouvements"):
+            cnx.execute(f"DELETE FROM {nom_table}")
+        _reporter(cnx, _agreger(ecritures), 1)
+    return len(ecritures)
+
+
+# ─────────────────────────────────────────────
+# REQUÊTES
+# ─────────────────────────────────────────────
+
+def solde(cnx: sqlite3.Connection, compte: str, mois: Optional[str] = None) -> dict:
+    """Totaux d'un compte (tous tiers), cumulés ou pour un mois AAAA-MM.
+
+    Returns:
+        {"compte", "debit", "credit", "solde" (débit − crédit), "lignes"} en centimes.
+    """
+    if mois is None:
+        ligne = cnx.execute("SELECT debit, credit, lignes FROM comptes WHERE compte = ?", (compte,)).fetchone()
+    else:
+        ligne = cnx.execute(
+            "SELECT COALESCE(SUM(debit), 0) AS debit, COALESCE(SUM(credit), 0) AS credit, "
+            "COALESCE(SUM(lignes), 0) AS lignes FROM soldes WHERE compte = ? AND mois = ?", (compte, mois)
+        ).fetchone()
+    debit, credit, lignes = (ligne["debit"], ligne["credit"], ligne["lignes"]) if ligne else (0, 0, 0)
+    return {"compte": compte, "debit": debit, "credit": credit, "solde": debit - credit, "lignes": lignes}
+
+
+def solde_tiers(cnx: sqlite3.Connection, tiers: str) -> dict:
+    """Totaux d'un tiers (balance auxiliaire) et montant moyen de ses pièces.
+
+    Returns:
+        {"tiers", "debit", "credit", "solde" (crédit − débit), "pieces",
+         "moyenne_piece" (centimes, None sans pièce)}.
+    """
+    ligne = cnx.execute("SELECT debit, credit, pieces FROM tiers WHERE tiers = ?", (tiers,)).fetchone()
+    debit, credit, pieces = (ligne["debit"], ligne["credit"], ligne["pieces"]) if ligne else (0, 0, 0)
+    return {"tiers": tiers, "debit": debit, "credit": credit, "solde": credit - debit, "pieces": pieces,
+            "moyenne_piece": credit // pieces if pieces else None}
+
+
+def balance(cnx: sqlite3.Connection, mois: Optional[str] = None) -> dict:
+    """Balance générale (par compte), cumulée ou pour un mois, et contrôle de la partie double.
+
+    Returns:
+        {"comptes": [{compte, compte_lib, debit, credit, solde}], "debit", "credit",
+         "equilibre" (Σ débits = Σ crédits)}.
+    """
+    if mois is None:
+        lignes = cnx.execute("SELECT compte, compte_lib, debit, credit FROM comptes ORDER BY compte").fetchall()
+    else:
+        lignes = cnx.execute(
+            "SELECT s.compte, COALESCE(c.compte_lib, '') AS compte_lib, SUM(s.debit) AS debit, "
+            "SUM(s.credit) AS credit FROM soldes s LEFT JOIN comptes c ON c.compte = s.compte "
+            "WHERE s.mois = ? GROUP BY s.compte ORDER BY s.compte", (mois,)
+        ).fetchall()
+    comptes = [{**dict(l), "solde": l["debit"] - l["credit"]} for l in lignes]
+    debit, credit = sum(c["debit"] for c in comptes), sum(c["credit"] for c in comptes)
+    return {"comptes": comptes, "debit": debit, "credit": credit, "equilibre": debit == credit}
+
+
+def main() -> None:
+    """Point d'entrée CLI : balance, soldes, instantanés et reconstruction."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Balance comptable incrémentale")
+    parser.add_argument("--balance", action="store_true", help="Balance générale (cumulée ou --mois)")
+    parser.add_argument("--mois", help="Période AAAA-MM")
+    parser.add_argument("--compte", help="Solde d'un compte")
+    parser.add_argument("--tiers", help="Solde d'un tiers et montant moyen de ses pièces")
+    parser.add_argument("--instantane", metavar="NOM", help="Enregistrer un instantané des soldes")
+    parser.add_argument("--restaurer", metavar="NOM", help="Revenir à un instantané")
+    parser.add_argument("--reconstruire", action="store_true", help="Recalculer depuis l'archive Parquet")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    with closing(connecter()) as cnx:
+        if args.reconstruire:
+            reprises = reconstruire(cnx)
+            print("  Archive Parquet indisponible (pyarrow absent)." if reprises is None
+                  else f"  {reprises} écriture(s) reprise(s) dans {BALANCE_DB.name}")
+        if args.restaurer:
+            try:
+                print(f"  {restaurer(cnx, args.restaurer)} solde(s) restauré(s) depuis « {args.restaurer} »")
+            except ValueError as exc:
+                print(f"  ✗ {exc}")
+                sys.exit(1)
+        if args.instantane:
+            print(f"  {instantane(cnx, args.instantane)} solde(s) copié(s) dans « {args.instantane} »")
+
+        resultats = []
+        if args.compte:
+            resultats.append(solde(cnx, args.compte, args.mois))
+        if args.tiers:
+            resultats.append(solde_tiers(cnx, args.tiers))
+        if args.balance:
+            resultats.append(balance(cnx, args.mois))
+
+    if args.json:
+        for resultat in resultats:
+            print(json.dumps(resultat, ensure_ascii=False, indent=2))
+    else:
+        for resultat in resultats:
+            if "comptes" in resultat:
+                for c in resultat["comptes"]:
+                    print(f"  {c['compte']:10} {c['compte_lib'][:30]:30} {montants.formater(c['debit']):>16} "
+                          f"{montants.formater(c['credit']):>16} {montants.formater(c['solde']):>16}")
+                print(f"  {'TOTAL':41} {montants.formater(resultat['debit']):>16} "
+                      f"{montants.formater(resultat['credit']):>16}  {'✓ équilibrée' if resultat['equilibre'] else '✗ déséquilibrée'}")
+            else:
+                cle = resultat.get("compte") or resultat.get("tiers")
+                details = f"  moyenne/pièce {montants.formater(resultat['moyenne_piece'])}" \
+                    if resultat.get("moyenne_piece") is not None else ""
+                print(f"  {cle} : débit {montants.formater(resultat['debit'])}  crédit "
+                      f"{montants.formater(resultat['credit'])}  solde {montants.formater(resultat['solde'])}{details}")
+    if not (args.balance or args.compte or args.tiers or args.instantane or args.restaurer or args.reconstruire):
+        parser.print_help()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,879 @@
+# ERGO_ID: BENCHMARK_KOS
+"""
+benchmark_kos.py
+================
+ERGO KOS_COMPTA — Banc de performance hors ligne (sans crédit API)
+
+Génère un lot de factures synthétiques (PDF natif, XML UBL, Markdown ; taille,
+type et tags variables) dans une arborescence temporaire, puis exécute la
+chaîne complète sur chaque document :
+
+    extract (pdf_extractor) → detect → audit (agent_compliance) → route
+    puis journalisation de l'itération et export ERP (export_erp)
+
+L'API Messages est remplacée par un serveur local (wsgiref) dont la latence,
+la gigue et le taux d'erreurs 529/500 sont paramétrables ; le client Anthropic
+y est redirigé par ANTHROPIC_BASE_URL. Les verdicts simulés sont déterministes
+(graine) : ligne "cadeau client" → REJET, une part d'AVERTISSEMENT, le reste CONFORME avec
+une imputation équilibrée (HT + TVA = TTC) exploitable par export_erp.
+
+Rapport : débit, latence par document p50 / p95 / p99 (globale et par format),
+temps par étape (instrumentation), durée de l'export ERP, mémoire (RSS max,
+pic tracemalloc en option). Les dépôts réels (E3, E4, logs, registry) ne sont
+jamais touchés : les constantes de chemins des modules sont redirigées.
+
+Usage :
+    python benchmark_kos.py
+    python benchmark_kos.py --documents 200 --formats pdf,xml --latence-ms 800 --gigue-ms 300
+    python benchmark_kos.py --taux-erreur 0.05 --doublons 0.1 --tracemalloc
+    python benchmark_kos.py --json bench.json --seuil-p95 1500     # code retour 1 si régression
+    python benchmark_kos.py --panne-anthropic                      # repli Ollama, disjoncteur
+    python benchmark_kos.py --packing                              # audit groupé (requêtes/doc)
+    python benchmark_kos.py --parquet                              # export avec archive Parquet
+
+En mode --packing, les montants des factures sont tirés sous le plafond
+KOS_PACKING_MONTANT_MAX : tous les documents sont groupables et les lots se
+forment réellement (sinon est_groupable() écarte presque tout le corpus).
+
+ERGO_REGISTRY:
+    role         : Banc de charge hors ligne — factures synthétiques + mock API Messages, p50/p95/p99
+    version      : 1.3.6
+    auteur       : ERGO Capital / Adam
+    dependances  : pdf_extractor.py, detect_document_type.py, agent_compliance.py, export_erp.py,
+                   dedup_ingress.py, journal_kos.py, ledger_audit.py, sequence_kos.py, instrumentation.py,
+                   budget_kos.py, fournisseurs_llm.py, index_export.py,
+                   anomalies_kos.py, balance_kos.py, archive_parquet.py
+    entrees      : paramètres CLI (volume, formats, latence, erreurs, graine)
+    sorties      : rapport console, --json (optionnel) ; arborescence temporaire (--conserver)
+    variable_env : ANTHROPIC_BASE_URL / ANTHROPIC_API_KEY / OLLAMA_HOST / KOS_LLM_CHAINE (positionnées
+                   par le banc), KOS_ARCHIVE_PARQUET (positionnée selon --parquet), KOS_DEDUP
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+from typing import Optional
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import agent_compliance
+import anomalies_kos
+import archive_parquet
+import balance_kos
+import budget_kos
+import dedup_ingress
+import export_erp
+import fournisseurs_llm
+import index_export
+import instrumentation
+import journal_kos
+import ledger_audit
+import pdf_extractor
+import sequence_kos
+from detect_document_type import lire_frontmatter, detecter_type
+
+
+FORMATS = ("md", "xml", "pdf")
+TAILLES = (("petit", 0.6, (1, 3)), ("moyen", 0.3, (8, 25)), ("grand", 0.1, (80, 200)))
+TYPES_MD = ("soumission_facture", "facture_fournisseur", "note_de_frais")
+
+FOURNISSEURS = ("Bureau_Vallee", "OVH_Cloud", "Total_Energies", "Maison_Champagne_Dupont",
+                "Restaurant_Le_Colbert", "Orange_Business", "Lyreco_France", "SNCF_Connect")
+ARTICLES = (
+    ("Ramette papier A4", ("fournitures", "bureau")),
+    ("Abonnement serveur dedie", ("informatique", "abonnement")),
+    ("Carburant gazole", ("carburant", "vehicule")),
+    ("Repas d'affaires", ("repas", "reception")),
+    ("Forfait telephonie mobile", ("telecom", "abonnement")),
+    ("Billet train Paris-Lyon", ("deplacement", "transport")),
+    ("Licence logiciel comptable", ("informatique", "licence")),
+)
+TAUX_TVA = (Decimal("20"), Decimal("20"), Decimal("20"), Decimal("10"), Decimal("5.5"))
+ARTICLE_CADEAU = ("Coffret champagne cadeau client", ("cadeau", "champagne"))
+TAUX_CADEAU    = 0.1        # part des factures portant une ligne cadeau (→ REJET simulé)
+COMPTES_CHARGE = ("606400", "615600", "606110", "623400", "625700", "626000", "625100", "651100")
+
+CENTIME = Decimal("0.01")
+
+
+# ─────────────────────────────────────────────
+# GÉNÉRATION DU CORPUS SYNTHÉTIQUE
+# ─────────────────────────────────────────────
+
+def _tirer_taille(rng: random.Random) -> tuple[str, int]:
+    """Tire une classe de taille (petit / moyen / grand) et un nombre de lignes."""
+    seuil, cumul = rng.random(), 0.0
+    for nom, poids, (mini, maxi) in TAILLES:
+        cumul += poids
+        if seuil <= cumul:
+            return nom, rng.randint(mini, maxi)
+    nom, _, (mini, maxi) = TAILLES[-1]
+    return nom, rng.randint(mini, maxi)
+
+
+def generer_facture(rng: random.Random, numero: int, format_: str, montant_max: Optional[Decimal] = None) -> dict:
+    """Tire le contenu d'une facture synthétique (lignes, totaux, tags).
+
+    Args:
+        rng:         Générateur pseudo-aléatoire (graine du banc).
+        numero:      Numéro séquentiel, garantit l'unicité (pas de doublon involontaire).
+        format_:     "md" | "xml" | "pdf".
+        montant_max: Plafond TTC de la facture (mode --packing) ; None = montants libres.
+
+    Returns:
+        Facture {numero, format, taille, type, fournisseur, date, echeance,
+        lignes, montant_ht, montant_tva, montant_ttc, tags}.
+    """
+    taille, nb_lignes = _tirer_taille(rng)
+    articles = [rng.choice(ARTICLES) for _ in range(nb_lignes)]
+    if rng.random() < TAUX_CADEAU:
+        articles[-1] = ARTICLE_CADEAU
+    lignes: list[dict] = []
+    tags: set[str] = {"achat"}
+    if montant_max is not None:
+        # PU HT par ligne (quantité 1) tel que Σ TTC ≤ plafond, arrondi de TVA (½ centime / ligne) compris
+        centimes_max = max(1, int((montant_max * 100 - nb_lignes) / Decimal("1.2") / nb_lignes))
+    for designation, tags_article in articles:
+        if montant_max is None:
+            quantite = rng.randint(1, 12)
+            pu_ht    = (Decimal(rng.randint(150, 50000)) / 100).quantize(CENTIME)
+        else:
+            quantite = 1
+            pu_ht    = (Decimal(rng.randint(1, centimes_max)) / 100).quantize(CENTIME)
+        taux     = rng.choice(TAUX_TVA)
+        total_ht = (pu_ht * quantite).quantize(CENTIME)
+        lignes.append({"designation": designation, "quantite": quantite, "pu_ht": pu_ht,
+                       "taux_tva": taux, "total_ht": total_ht,
+                       "tva": (total_ht * taux / 100).quantize(CENTIME, ROUND_HALF_UP)})
+        tags.update(tags_article)
+    montant_ht  = sum((l["total_ht"] for l in lignes), Decimal("0"))
+    montant_tva = sum((l["tva"] for l in lignes), Decimal("0"))
+    emission = date(2026, 1, 1) + timedelta(days=rng.randint(0, 270))
+    return {
+        "numero":      f"BENCH-{numero:06d}",
+        "format":      format_,
+        "taille":      taille,
+        "type":        rng.choice(TYPES_MD),
+        "fournisseur": rng.choice(FOURNISSEURS),
+        "date":        emission.isoformat(),
+        "echeance":    (emission + timedelta(days=30)).isoformat(),
+        "lignes":      lignes,
+        "montant_ht":  montant_ht,
+        "montant_tva": montant_tva,
+        "montant_ttc": montant_ht + montant_tva,
+        "tags":        sorted(tags),
+    }
+
+
+def _fr(montant: Decimal) -> str:
+    """Formate un montant à la française ("1234,56")."""
+    return f"{montant:.2f}".replace(".", ",")
+
+
+def facture_markdown(f: dict) -> str:
+    """Sérialise une facture au format dropzone E3.1 (frontmatter + tableau Markdown)."""
+    lignes = "\n".join(
+        f"| {l['designation']} | {l['quantite']} | {_fr(l['pu_ht'])} € | {l['taux_tva']} % | {_fr(l['total_ht'])} € |"
+        for l in f["lignes"]
+    )
+    return (
+        "---\n"
+        f"type: {f['type']}\n"
+        f"id: {f['numero']}\n"
+        "statut: en_attente_audit\n"
+        f"date_soumission: {f['date']}\n"
+        "soumis_par: benchmark_kos\n"
+        f"tags: [{', '.join(f['tags'])}]\n"
+        f"numero_facture: {f['numero']}\n"
+        f"montant_ht: {f['montant_ht']}\n"
+        f"montant_tva: {f['montant_tva']}\n"
+        f"montant_ttc: {f['montant_ttc']}\n"
+        f"fournisseur: {f['fournisseur']}\n"
+        "---\n\n"
+        f"# Facture {f['numero']} — {f['fournisseur']}\n\n"
+        "## Détail commande\n\n"
+        "| Désignation | Qté | PU HT | TVA | Total HT |\n"
+        "|---|---|---|---|---|\n"
+        f"{lignes}\n\n"
+        f"**Total HT :** {_fr(f['montant_ht'])} €  \n"
+        f"**TVA :** {_fr(f['montant_tva'])} €  \n"
+        f"**Total TTC :** {_fr(f['montant_ttc'])} €  \n"
+    )
+
+
+def facture_ubl(f: dict) -> str:
+    """Sérialise une facture en XML UBL 2.1 (lu par facturx_parser)."""
+    lignes = "".join(
+        f"<cac:InvoiceLine><cbc:ID>{i}</cbc:ID>"
+        f"<cbc:InvoicedQuantity unitCode=\"C62\">{l['quantite']}</cbc:InvoicedQuantity>"
+        f"<cbc:LineExtensionAmount currencyID=\"EUR\">{l['total_ht']}</cbc:LineExtensionAmount>"
+        f"<cac:Item><cbc:Name>{l['designation']}</cbc:Name>"
+        f"<cac:ClassifiedTaxCategory><cbc:ID>S</cbc:ID><cbc:Percent>{l['taux_tva']}</cbc:Percent>"
+        f"</cac:ClassifiedTaxCategory></cac:Item>"
+        f"<cac:Price><cbc:PriceAmount currencyID=\"EUR\">{l['pu_ht']}</cbc:PriceAmount></cac:Price>"
+        f"</cac:InvoiceLine>"
+        for i, l in enumerate(f["lignes"], start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"'
+        ' xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"'
+        ' xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">'
+        f"<cbc:ID>{f['numero']}</cbc:ID><cbc:IssueDate>{f['date']}</cbc:IssueDate>"
+        f"<cbc:DueDate>{f['echeance']}</cbc:DueDate><cbc:InvoiceTypeCode>380</cbc:InvoiceTypeCode>"
+        "<cbc:DocumentCurrencyCode>EUR</cbc:DocumentCurrencyCode>"
+        f"<cac:AccountingSupplierParty><cac:Party><cac:PartyName><cbc:Name>{f['fournisseur']}</cbc:Name>"
+        "</cac:PartyName><cac:PartyTaxScheme><cbc:CompanyID>FR00123456789</cbc:CompanyID>"
+        "<cac:TaxScheme><cbc:ID>VAT</cbc:ID></cac:TaxScheme></cac:PartyTaxScheme></cac:Party>"
+        "</cac:AccountingSupplierParty>"
+        "<cac:AccountingCustomerParty><cac:Party><cac:PartyName><cbc:Name>ERGO Capital</cbc:Name>"
+        "</cac:PartyName></cac:Party></cac:AccountingCustomerParty>"
+        f"<cac:TaxTotal><cbc:TaxAmount currencyID=\"EUR\">{f['montant_tva']}</cbc:TaxAmount></cac:TaxTotal>"
+        "<cac:LegalMonetaryTotal>"
+        f"<cbc:TaxExclusiveAmount currencyID=\"EUR\">{f['montant_ht']}</cbc:TaxExclusiveAmount>"
+        f"<cbc:TaxInclusiveAmount currencyID=\"EUR\">{f['montant_ttc']}</cbc:TaxInclusiveAmount>"
+        f"<cbc:PayableAmount currencyID=\"EUR\">{f['montant_ttc']}</cbc:PayableAmount>"
+        "</cac:LegalMonetaryTotal>"
+        f"{lignes}</Invoice>\n"
+    )
+
+
+def _texte_pdf(x: float, y: float, texte: str, corps: int = 9) -> str:
+    """Opérateurs PDF d'affichage d'une chaîne (Helvetica, WinAnsi)."""
+    echappe = texte.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"BT /F1 {corps} Tf {x:.1f} {y:.1f} Td ({echappe}) Tj ET\n"
+
+
+def facture_pdf(f: dict, lignes_par_page: int = 40) -> bytes:
+    """Produit un PDF natif (texte + tableau réglé) lisible par pdfplumber.
+
+    Chaque page porte le tableau des lignes avec son en-tête, tracé avec des
+    filets pour que extract_tables() le reconnaisse ; l'en-tête et les totaux
+    sont en texte libre (champs "Fournisseur :", "Total TTC :"…).
+
+    Args:
+        f:               Facture produite par generer_facture().
+        lignes_par_page: Nombre de lignes de tableau par page A4.
+
+    Returns:
+        Contenu binaire du fichier PDF.
+    """
+    colonnes = (50, 280, 320, 400, 450, 545)
+    entete = ("Designation", "Qte", "PU HT", "Taux TVA", "Total HT")
+    pages_lignes = [f["lignes"][i:i + lignes_par_page]
+                    for i in range(0, len(f["lignes"]), lignes_par_page)] or [[]]
+    flux: list[str] = []
+    for n, lot in enumerate(pages_lignes):
+        ops = ""
+        y = 800
+        if n == 0:
+            for texte in (f"FACTURE {f['numero']}", f"Fournisseur : {f['fournisseur']}",
+                          f"Numero : {f['numero']}", f"Date facture : {f['date']}",
+                          f"Echeance : {f['echeance']}", "Client : ERGO Capital"):
+                ops += _texte_pdf(50, y, texte, 11 if texte.startswith("FACTURE") else 9)
+                y -= 14
+            y -= 10
+        rangees = [entete] + [(l["designation"], str(l["quantite"]), _fr(l["pu_ht"]),
+                               f"{l['taux_tva']} %", _fr(l["total_ht"])) for l in lot]
+        haut = y
+        for rangee in rangees:
+            for x, cellule in zip(colonnes, rangee):
+                ops += _texte_pdf(x + 3, y - 11, cellule)
+            y -= 15
+        for yy in range(haut, y - 1, -15):
+            ops += f"{colonnes[0]} {yy} m {colonnes[-1]} {yy} l S\n"
+        for x in colonnes:
+            ops += f"{x} {haut} m {x} {y} l S\n"
+        if n == len(pages_lignes) - 1:
+            y -= 20
+            for texte in (f"Total HT : {_fr(f['montant_ht'])}", f"Total TVA : {_fr(f['montant_tva'])}",
+                          f"Total TTC : {_fr(f['montant_ttc'])}"):
+                ops += _texte_pdf(360, y, texte, 10)
+                y -= 14
+        flux.append("0.5 w\n" + ops)
+
+    objets: list[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    pages_ids: list[int] = []
+    for contenu in flux:
+        donnees = contenu.encode("cp1252", errors="replace")
+        objets.append(b"<< /Length %d >>\nstream\n" % len(donnees) + donnees + b"\nendstream")
+        objets.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                      b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objets)))
+        pages_ids.append(len(objets))
+    kids = " ".join(f"{i} 0 R" for i in pages_ids).encode()
+    objets[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(pages_ids)
+
+    sortie = bytearray(b"%PDF-1.4\n")
+    positions: list[int] = []
+    for i, obj in enumerate(objets, start=1):
+        positions.append(len(sortie))
+        sortie += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(sortie)
+    sortie += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objets) + 1)
+    sortie += b"".join(b"%010d 00000 n \n" % p for p in positions)
+    sortie += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objets) + 1, xref)
+    return bytes(sortie)
+
+
+def generer_corpus(racine: Path, documents: int, formats: tuple, doublons: float, graine: int,
+                   montant_max: Optional[Decimal] = None) -> list[dict]:
+    """Dépose le lot synthétique : .md dans la dropzone, .xml / .pdf dans input/.
+
+    Args:
+        racine:      Racine de l'arborescence temporaire.
+        documents:   Nombre de documents à générer (doublons compris).
+        formats:     Formats tirés uniformément parmi FORMATS.
+        doublons:    Proportion de copies renommées d'un document déjà généré.
+        graine:      Graine pseudo-aléatoire (corpus reproductible).
+        montant_max: Plafond TTC par facture (mode --packing), voir generer_facture().
+
+    Returns:
+        Liste [{chemin, format, taille, doublon}] dans l'ordre de traitement.
+    """
+    rng = random.Random(graine)
+    corpus: list[dict] = []
+    for numero in range(1, documents + 1):
+        if corpus and rng.random() < doublons:
+            original = rng.choice(corpus)
+            copie = original["chemin"].with_name(f"copie_{numero:06d}{original['chemin'].suffix}")
+            shutil.copyfile(original["chemin"], copie)
+            corpus.append({**original, "chemin": copie, "doublon": True})
+            continue
+        format_ = rng.choice(formats)
+        f = generer_facture(rng, numero, format_, montant_max)
+        nom = f"bench_{numero:06d}_{f['taille']}"
+        if format_ == "md":
+            chemin = pdf_extractor.DROPZONE / f"{nom}.md"
+            chemin.write_text(facture_markdown(f), encoding="utf-8")
+        elif format_ == "xml":
+            chemin = pdf_extractor.INPUT_DIR / f"{nom}.xml"
+            chemin.write_text(facture_ubl(f), encoding="utf-8")
+        else:
+            chemin = pdf_extractor.INPUT_DIR / f"{nom}.pdf"
+            chemin.write_bytes(facture_pdf(f))
+        corpus.append({"chemin": chemin, "format": format_, "taille": f["taille"], "doublon": False})
+    return corpus
+
+
+# ─────────────────────────────────────────────
+# MOCK API MESSAGES
+# ─────────────────────────────────────────────
+
+def _extraire_champ(message: str, prefixe: str) -> str:
+    """Valeur d'une ligne "Prefixe : valeur" du message utilisateur."""
+    for ligne in message.splitlines():
+        if ligne.startswith(prefixe):
+            return ligne[len(prefixe):].strip()
+    return ""
+
+
+def verdict_simule(message: str, rng: random.Random) -> dict:
+    """Verdict déterministe pour un prompt d'audit (cf. analyser_avec_claude).
+
+    Args:
+        message: Contenu du message utilisateur (normes + document).
+        rng:     Générateur du mock (part d'AVERTISSEMENT).
+
+    Returns:
+        Verdict JSON au format attendu par router_verdict().
+    """
+    document = message.split("## DOCUMENT\nFichier :", 1)[-1].lower()
+    try:
+        ttc = Decimal(_extraire_champ(message, "Montant TTC :").strip('"').replace(",", "."))
+    except ArithmeticError:
+        ttc = Decimal("0")
+    ht  = (ttc / Decimal("1.2")).quantize(CENTIME, ROUND_HALF_UP)
+    imputation = {
+        "compte_debit": rng.choice(COMPTES_CHARGE), "compte_credit": "401000",
+        "montant_ht": float(ht), "tva_deductible": float(ttc - ht),
+        "tva_non_deductible": 0.0, "montant_ttc": float(ttc),
+    }
+    if "cadeau client" in document:
+        return {"verdict": "REJET", "motif": "Cadeau client : TVA non déductible (CGI art. 206 IV 2 3° d)",
+                "articles_appliques": ["CGI Annexe II art. 206"], "niveau_risque": "ELEVE",
+                "corrections_requises": ["Imputer la TVA en charge (6234)"],
+                "imputation_recommandee": {**imputation, "tva_deductible": 0.0,
+                                           "tva_non_deductible": float(ttc - ht)},
+                "action_erp": "BLOQUER", "confiance": 0.95}
+    if rng.random() < 0.1:
+        return {"verdict": "AVERTISSEMENT", "motif": "Justificatif incomplet (mentions obligatoires)",
+                "articles_appliques": ["CGI art. 242 nonies A"], "niveau_risque": "MOYEN",
+                "corrections_requises": ["Demander une facture rectificative"],
+                "imputation_recommandee": imputation, "action_erp": "REVUE_HUMAINE", "confiance": 0.7}
+    return {"verdict": "CONFORME", "motif": "Facture conforme, TVA déductible",
+            "articles_appliques": ["CGI art. 271"], "niveau_risque": "FAIBLE",
+            "corrections_requises": [], "imputation_recommandee": imputation, "action_erp": "INJECTER",
+            "confiance": round(rng.uniform(0.7, 1.0), 2)}
+
+
+def reponse_simulee(message: str, rng: random.Random) -> dict | list:
+    """Réponse simulée : un verdict, ou un tableau indexé par document_id (audit groupé).
+
+    Args:
+        message: Contenu du message utilisateur.
+        rng:     Générateur du mock.
+
+    Returns:
+        Verdict (analyser_avec_claude) ou tableau de verdicts (analyser_lot).
+    """
+    blocs = message.split("## DOCUMENT — document_id : ")
+    if len(blocs) == 1:
+        return verdict_simule(message, rng)
+    verdicts = []
+    for bloc in blocs[1:]:
+        document_id, _, contenu = bloc.partition("\n")
+        verdicts.append({"document_id": document_id.strip(), **verdict_simule(f"## DOCUMENT\n{contenu}", rng)})
+    return verdicts
+
+
+def application_mock(
+    latence_ms: float, gigue_ms: float, taux_erreur: float, graine: int, panne_anthropic: bool = False
+):
+    """Construit l'application WSGI simulant POST /v1/messages et un serveur Ollama local.
+
+    Le serveur répond aussi à GET /api/tags et POST /api/chat (format Ollama),
+    substitut local du fournisseur de repli "ollama" (fournisseurs_llm).
+
+    Args:
+        latence_ms:  Latence moyenne simulée par requête.
+        gigue_ms:    Amplitude de la gigue uniforme (±) autour de la latence.
+        taux_erreur: Probabilité d'une erreur 529 (overloaded) ou 500 (api_error).
+        graine:      Graine du générateur (verdicts et erreurs reproductibles).
+        panne_anthropic: Toute requête /v1/messages reçoit une 529 (panne du fournisseur principal).
+
+    Returns:
+        Tuple (application WSGI, compteurs {requetes, erreurs, ollama}).
+    """
+    rng = random.Random(graine)
+    verrou = threading.Lock()
+    compteurs = Counter()
+
+    def application(environ, start_response):
+        entetes = [("Content-Type", "application/json")]
+        chemin  = environ.get("PATH_INFO", "")
+        if chemin == "/api/tags":
+            start_response("200 OK", entetes)
+            return [json.dumps({"models": [{"name": "benchmark", "model": "benchmark"}]}).encode()]
+        ollama = chemin == "/api/chat"
+        if not (ollama or chemin.endswith("/v1/messages")):
+            start_response("404 Not Found", entetes)
+            return [b'{"type":"error","error":{"type":"not_found_error","message":"benchmark"}}']
+
+        taille = int(environ.get("CONTENT_LENGTH") or 0)
+        corps = json.loads(environ["wsgi.input"].read(taille) or b"{}")
+        with verrou:
+            compteurs["ollama" if ollama else "requetes"] += 1
+            attente = max(0.0, latence_ms + rng.uniform(-gigue_ms, gigue_ms)) / 1000
+            en_erreur = (panne_anthropic and not ollama) or rng.random() < taux_erreur
+            if panne_anthropic and not ollama:
+                statut = "529 Overloaded"
+            else:
+                statut = rng.choice(("529 Overloaded", "500 Internal Server Error"))
+            message = "".join(
+                bloc.get("text", "") if isinstance(bloc, dict) else str(bloc)
+                for m in corps.get("messages", []) if m.get("role") != "system"
+                for bloc in (m["content"] if isinstance(m["content"], list) else [m["content"]])
+            )
+            verdict = reponse_simulee(message, rng)
+        time.sleep(attente)
+
+        if en_erreur:
+            with verrou:
+                compteurs["erreurs"] += 1
+            type_ = "overloaded_error" if statut.startswith("529") else "api_error"
+            start_response(statut, entetes)
+            return [json.dumps({"type": "error", "error": {"type": type_, "message": "mock"}}).encode()]
+
+        outils = corps.get("tools") or []
+        if isinstance(verdict, list) and (outils or isinstance(corps.get("format"), dict)):
+            verdict = {"verdicts": verdict}      # sortie structurée : l'entrée d'outil est un objet
+        texte = json.dumps(verdict, ensure_ascii=False)
+        systeme = corps.get("system", "") + json.dumps(outils)
+        if ollama:
+            reponse = {
+                "model": corps.get("model", "mock"), "created_at": datetime.now().isoformat(), "done": True,
+                "message": {"role": "assistant", "content": texte},
+                "prompt_eval_count": len(message) // 4, "eval_count": max(1, len(texte) // 4),
+            }
+            start_response("200 OK", entetes)
+            return [json.dumps(reponse, ensure_ascii=False).encode("utf-8")]
+        reponse = {
+            "id": f"msg_bench_{compteurs['requetes']:06d}", "type": "message", "role": "assistant",
+            "model": corps.get("model", "mock"), "stop_reason": "tool_use" if outils else "end_turn",
+            "stop_sequence": None,
+            "content": ([{"type": "tool_use", "id": f"toolu_bench_{compteurs['requetes']:06d}",
+                          "name": outils[0]["name"], "input": verdict}] if outils
+                        else [{"type": "text", "text": texte}]),
+            "usage": {"input_tokens": (len(message) + len(str(systeme))) // 4,
+                      "output_tokens": max(1, len(texte) // 4)},
+        }
+        start_response("200 OK", entetes)
+        return [json.dumps(reponse, ensure_ascii=False).encode("utf-8")]
+
+    return application, compteurs
+
+
+def demarrer_mock(
+    latence_ms: float, gigue_ms: float, taux_erreur: float, graine: int, panne_anthropic: bool = False
+) -> tuple:
+    """Démarre le mock sur un port libre de 127.0.0.1 dans un thread démon.
+
+    Returns:
+        Tuple (serveur, url de base, compteurs).
+    """
+    application, compteurs = application_mock(latence_ms, gigue_ms, taux_erreur, graine, panne_anthropic)
+    handler = type("GestionnaireSilencieux", (WSGIRequestHandler,), {"log_message": lambda *a: None})
+    serveur = make_server("127.0.0.1", 0, application, handler_class=handler)
+    threading.Thread(target=serveur.serve_forever, name="mock-anthropic", daemon=True).start()
+    return serveur, f"http://127.0.0.1:{serveur.server_port}", compteurs
+
+
+# ─────────────────────────────────────────────
+# EXÉCUTION
+# ─────────────────────────────────────────────
+
+def rediriger_chemins(racine: Path) -> None:
+    """Redirige les constantes de chemins des modules vers l'arborescence du banc.
+
+    Le corpus légal E1/E2 reste celui du dépôt (lecture seule, fallback substring :
+    KOS_DB est absent sous la racine temporaire, comme en CI).
+
+    Args:
+        racine: Racine temporaire (équivalent de BASE_DIR).
+    """
+    dropzone = racine / "E3_INTERFACES_ACTEURS" / "E3.1_Dropzone_Factures"
+    e4       = racine / "E4_AUDIT_ET_ROUTAGE"
+    logs     = racine / "E0_MOTEUR_AGENTIQUE" / "logs"
+    redirections = {
+        pdf_extractor:    {"BASE_DIR": racine, "INPUT_DIR": dropzone / "input", "DROPZONE": dropzone},
+        agent_compliance: {"BASE_DIR": racine, "E3_DROPZONE": dropzone,
+                           "E4_RAPPORTS": e4 / "E4.1_Rapports_Conformite",
+                           "E4_PAYLOADS": e4 / "E4.2_Payloads_ERP"},
+        export_erp:       {"BASE_DIR": racine, "PAYLOADS_DIR": e4 / "E4.2_Payloads_ERP",
+                           "EXPORT_DIR": e4 / "E4.3_Imports_ERP",
+                           "ARCHIVE_DIR": e4 / "E4.2_Payloads_ERP" / "archive",
+                           "CHECKPOINT_FILE": logs / "export_erp.checkpoint.json"},
+        ledger_audit:     {"BASE_DIR": racine, "E4_RAPPORTS": e4 / "E4.1_Rapports_Conformite",
+                           "LEDGER_DB": logs / "AUDIT_LEDGER.sqlite3"},
+        dedup_ingress:    {"DEDUP_DB": logs / "DEDUP_INDEX.sqlite3",
+                           "DEDUP_INDEX": racine / "E0_MOTEUR_AGENTIQUE" / "registry" / "DEDUP_INDEX.json"},
+        journal_kos:      {"LOGS_DIR": logs, "JOURNAL_DIR": logs / "journal"},
+        sequence_kos:     {"SEQUENCES_DB": logs / "SEQUENCES.sqlite3"},
+        budget_kos:       {"BUDGET_DB": logs / "BUDGET.sqlite3"},
+        archive_parquet:  {"BASE_DIR": racine, "ARCHIVE_DIR": e4 / "E4.3_Imports_ERP" / "ecritures"},
+        balance_kos:      {"BALANCE_DB": logs / "BALANCE_KOS.sqlite3"},
+        anomalies_kos:    {"STATS_DB": logs / "STATS_KOS.sqlite3"},
+        index_export:     {"INDEX_DB": logs / "EXPORT_INDEX.sqlite3", "PAYLOADS_DIR": e4 / "E4.2_Payloads_ERP",
+                           "EXPORT_DIR": e4 / "E4.3_Imports_ERP"},
+        instrumentation:  {"TELEMETRIE_DIR": logs / "telemetrie"},
+    }
+    for module, constantes in redirections.items():
+        for nom, chemin in constantes.items():
+            setattr(module, nom, chemin)
+    for dossier in (dropzone / "input", e4 / "E4.1_Rapports_Conformite", e4 / "E4.2_Payloads_ERP",
+                    e4 / "E4.3_Imports_ERP", logs, racine / "E0_MOTEUR_AGENTIQUE" / "registry"):
+        dossier.mkdir(parents=True, exist_ok=True)
+
+
+def percentile(valeurs: list[float], p: float) -> float:
+    """Percentile par rang le plus proche (p dans [0, 100])."""
+    if not valeurs:
+        return 0.0
+    ordonnees = sorted(valeurs)
+    return ordonnees[max(0, math.ceil(p / 100 * len(ordonnees)) - 1)]
+
+
+def _distribution(valeurs: list[float]) -> dict:
+    """Résumé n / moyenne / p50 / p95 / p99 / max (ms)."""
+    return {
+        "n":       len(valeurs),
+        "moyenne": round(sum(valeurs) / len(valeurs), 1) if valeurs else 0.0,
+        "p50":     round(percentile(valeurs, 50), 1),
+        "p95":     round(percentile(valeurs, 95), 1),
+        "p99":     round(percentile(valeurs, 99), 1),
+        "max":     round(max(valeurs, default=0.0), 1),
+    }
+
+
+def traiter_source(item: dict, auditer: bool = True) -> dict:
+    """Exécute extract → detect → audit → route pour un document du corpus.
+
+    Args:
+        item:    Entrée de generer_corpus().
+        auditer: False en mode --packing : l'audit est fait ensuite par auditer_par_lots().
+
+    Returns:
+        Mesure {format, taille, latence_ms, cpu_ms, resultat, erreur, markdown}.
+    """
+    t0, c0 = time.perf_counter(), time.thread_time()
+    resultat, erreur, chemin = None, None, None
+    try:
+        chemin = item["chemin"]
+        if item["format"] != "md":
+            chemin = pdf_extractor.traiter_fichier(chemin)
+        if chemin is not None:
+            detecter_type(lire_frontmatter(chemin))
+            if auditer:
+                resultat = agent_compliance.traiter_document(chemin)
+    except Exception as exc:
+        erreur = f"{type(exc).__name__}: {exc}"
+    return {
+        "format":     item["format"],
+        "taille":     item["taille"],
+        "latence_ms": (time.perf_counter() - t0) * 1000,
+        "cpu_ms":     (time.thread_time() - c0) * 1000,
+        "resultat":   resultat,
+        "erreur":     erreur,
+        "markdown":   None if auditer or erreur else chemin,
+    }
+
+
+def auditer_par_lots(mesures: list[dict]) -> None:
+    """Audite en une passe groupée (agent_compliance.traiter_lot) les documents extraits.
+
+    La durée de la passe est répartie à parts égales sur les documents audités.
+
+    Args:
+        mesures: Mesures de traiter_source(auditer=False), complétées sur place.
+    """
+    a_auditer = [m for m in mesures if m["markdown"] is not None]
+    if not a_auditer:
+        return
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+        resultats = agent_compliance.traiter_lot([m["markdown"] for m in a_auditer])
+    except Exception as exc:
+        resultats = [None] * len(a_auditer)
+        for m in a_auditer:
+            m["erreur"] = f"{type(exc).__name__}: {exc}"
+    wall_ms = (time.perf_counter() - t0) * 1000 / len(a_auditer)
+    cpu_ms  = (time.thread_time() - c0) * 1000 / len(a_auditer)
+    for m, resultat in zip(a_auditer, resultats):
+        m["resultat"]    = resultat
+        m["latence_ms"] += wall_ms
+        m["cpu_ms"]     += cpu_ms
+
+
+def executer(args, racine: Path) -> dict:
+    """Génère le corpus, démarre le mock, exécute la chaîne et mesure.
+
+    Args:
+        args:   Arguments CLI.
+        racine: Racine temporaire du banc.
+
+    Returns:
+        Rapport de performance (sérialisable JSON).
+    """
+    rediriger_chemins(racine)
+    formats = tuple(f.strip() for f in args.formats.split(",") if f.strip() in FORMATS) or FORMATS
+    plafond = Decimal(str(agent_compliance.PACKING_MONTANT_MAX)) if args.packing else None
+    corpus  = generer_corpus(racine, args.documents, formats, args.doublons, args.graine, plafond)
+
+    serveur, url, compteurs = demarrer_mock(
+        args.latence_ms, args.gigue_ms, args.taux_erreur, args.graine, args.panne_anthropic
+    )
+    os.environ["ANTHROPIC_BASE_URL"] = url
+    os.environ["ANTHROPIC_API_KEY"]  = "sk-ant-benchmark"
+    os.environ["OLLAMA_HOST"]        = url
+    os.environ["KOS_LLM_CHAINE"]     = "anthropic,ollama"
+    os.environ["KOS_ARCHIVE_PARQUET"] = "on" if args.parquet else "off"
+    fournisseurs_llm.client_anthropic.cache_clear()
+    instrumentation.vider()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    sortie = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    mesures: list[dict] = []
+    debut = time.perf_counter()
+    try:
+        with sortie:
+            for item in corpus:
+                mesures.append(traiter_source(item, auditer=not args.packing))
+            if args.packing:
+                auditer_par_lots(mesures)
+            duree_chaine = time.perf_counter() - debut
+            t0 = time.perf_counter()
+            resultats = [m["resultat"] for m in mesures if m["resultat"] and not m["resultat"].get("reporte")]
+            reportes  = [m["resultat"]["facture"]["fichier"] for m in mesures
+                         if m["resultat"] and m["resultat"].get("reporte")]
+            if resultats or reportes:
+                agent_compliance.log_iteration("benchmark", _horodatage_iso(debut), resultats, reportes)
+            duree_journal = time.perf_counter() - t0
+            spans = instrumentation.vider()
+            t0 = time.perf_counter()
+            export_erp.main()
+            duree_export = time.perf_counter() - t0
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
+    pic_tracemalloc = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    latences = [m["latence_ms"] for m in mesures if not m["erreur"]]
+    return {
+        "parametres": {
+            "documents": args.documents, "formats": list(formats), "doublons": args.doublons,
+            "latence_ms": args.latence_ms, "gigue_ms": args.gigue_ms,
+            "taux_erreur": args.taux_erreur, "graine": args.graine,
+            "panne_anthropic": args.panne_anthropic, "packing": args.packing, "parquet": args.parquet,
+            "packing_montant_max": float(plafond) if plafond is not None else None, "dedup": dedup_ingress.mode_dedup(),
+        },
+        "documents":        len(mesures),
+        "erreurs":          [f"{m['format']}: {m['erreur']}" for m in mesures if m["erreur"]],
+        "duree_chaine_s":   round(duree_chaine, 3),
+        "debit_docs_s":     round(len(mesures) / duree_chaine, 2) if duree_chaine else 0.0,
+        "latence_ms":       _distribution(latences),
+        "cpu_ms":           _distribution([m["cpu_ms"] for m in mesures if not m["erreur"]]),
+        "par_format":       {f: _distribution([m["latence_ms"] for m in mesures
+                                               if m["format"] == f and not m["erreur"]]) for f in formats},
+        "par_taille":       {t: _distribution([m["latence_ms"] for m in mesures
+                                               if m["taille"] == t and not m["erreur"]])
+                             for t, _, _ in TAILLES},
+        "journalisation_ms": round(duree_journal * 1000, 1),
+        "export_erp_ms":    round(duree_export * 1000, 1),
+        "etapes":           instrumentation.resumer(spans),
+        "verdicts":         dict(Counter(_verdict(m["resultat"]) for m in mesures if not m["erreur"])),
+        "mock":             dict(compteurs),
+        "fournisseurs":     dict(Counter(m["resultat"]["verdict"]["_meta"]["fournisseur"] for m in mesures
+                                         if m["resultat"] and "_meta" in m["resultat"].get("verdict", {}))),
+        "memoire": {
+            "rss_max_mo":         _rss_max_mo(),
+            "tracemalloc_pic_mo": round(pic_tracemalloc / 1024 ** 2, 1) if pic_tracemalloc else None,
+        },
+    }
+
+
+def _verdict(resultat: Optional[dict]) -> str:
+    """Verdict d'un résultat de traiter_document() (ECARTE : doublon à l'ETL)."""
+    if resultat is None:
+        return "ECARTE"
+    return "REPORTE" if resultat.get("reporte") else resultat["verdict"].get("verdict", "ERREUR")
+
+
+def _horodatage_iso(debut_perf: float) -> str:
+    """Horodatage ISO 8601 correspondant à un instant perf_counter passé."""
+    return datetime.fromtimestamp(time.time() - (time.perf_counter() - debut_perf)).isoformat()
+
+
+def _rss_max_mo() -> Optional[float]:
+    """Pic de mémoire résidente du processus (Mo), None hors POSIX."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+# ─────────────────────────────────────────────
+# RAPPORT
+# ─────────────────────────────────────────────
+
+def afficher_rapport(r: dict) -> None:
+    """Affiche le rapport de performance en console."""
+    p = r["parametres"]
+    print("═" * 68)
+    print(" ⏱  KOS_COMPTA — BANC DE PERFORMANCE HORS LIGNE")
+    print("═" * 68)
+    print(f"  Lot          : {r['documents']} documents ({', '.join(p['formats'])}), "
+          f"doublons {p['doublons']:.0%}, dedup={p['dedup']}"
+          + (", packing" if p.get("packing") else ""))
+    print(f"  Mock API     : {p['latence_ms']:.0f} ± {p['gigue_ms']:.0f} ms, erreurs {p['taux_erreur']:.0%} "
+          f"— {r['mock'].get('requetes', 0)} requêtes, {r['mock'].get('erreurs', 0)} erreurs injectées"
+          + (f", {r['mock']['ollama']} requêtes ollama" if r["mock"].get("ollama") else ""))
+    print(f"  Débit        : {r['debit_docs_s']} docs/s ({r['duree_chaine_s']} s de chaîne)")
+    lat = r["latence_ms"]
+    print(f"  Latence doc  : p50 {lat['p50']} ms | p95 {lat['p95']} ms | p99 {lat['p99']} ms | max {lat['max']} ms")
+    print(f"  CPU doc      : p50 {r['cpu_ms']['p50']} ms | p95 {r['cpu_ms']['p95']} ms")
+    for groupe in ("par_format", "par_taille"):
+        for cle, d in r[groupe].items():
+            if d["n"]:
+                print(f"    {cle:10} n={d['n']:<5} p50 {d['p50']:>8} ms  p95 {d['p95']:>8} ms  p99 {d['p99']:>8} ms")
+    print(f"  Journal      : {r['journalisation_ms']} ms   Export ERP : {r['export_erp_ms']} ms")
+    mem = r["memoire"]
+    print(f"  Mémoire      : RSS max {mem['rss_max_mo']} Mo"
+          + (f" | pic tracemalloc {mem['tracemalloc_pic_mo']} Mo" if mem["tracemalloc_pic_mo"] else ""))
+    print(f"  Verdicts     : {r['verdicts']}")
+    if p.get("panne_anthropic") or set(r["fournisseurs"]) - {"anthropic"}:
+        print(f"  Fournisseurs : {r['fournisseurs']}")
+    print("─" * 68)
+    for etape, e in sorted(r["etapes"].items(), key=lambda kv: -kv[1]["wall_ms"]):
+        print(f"  {etape:18} ×{e['appels']:<5} {e['wall_ms']:>10.1f} ms réel {e['cpu_ms']:>10.1f} ms CPU")
+    if r["erreurs"]:
+        print("─" * 68)
+        print(f"  ⚠️  {len(r['erreurs'])} document(s) en erreur :")
+        for erreur in r["erreurs"][:10]:
+            print(f"    - {erreur}")
+    print("═" * 68)
+
+
+# ─────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="ERGO KOS_COMPTA — Banc de performance hors ligne (mock API Messages)"
+    )
+    parser.add_argument("--documents",   type=int,   default=50, help="Nombre de documents (défaut: 50)")
+    parser.add_argument("--formats",     type=str,   default="md,xml,pdf", help="Formats tirés (md,xml,pdf)")
+    parser.add_argument("--doublons",    type=float, default=0.0, help="Proportion de doublons (0-1)")
+    parser.add_argument("--latence-ms",  type=float, default=200.0, help="Latence simulée de l'API")
+    parser.add_argument("--gigue-ms",    type=float, default=50.0, help="Gigue ± de la latence")
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="Part de réponses 529/500 (0-1)")
+    parser.add_argument("--panne-anthropic", action="store_true",
+                        help="Le mock refuse /v1/messages (529) : audit par le repli Ollama simulé")
+    parser.add_argument("--packing",     action="store_true",
+                        help="Audit groupé (agent_compliance.traiter_lot), montants sous KOS_PACKING_MONTANT_MAX")
+    parser.add_argument("--parquet",     action="store_true",
+                        help="Alimenter l'archive Parquet des écritures pendant l'export (défaut : désactivée)")
+    parser.add_argument("--graine",      type=int,   default=42, help="Graine (corpus et mock reproductibles)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mesurer le pic d'allocations Python")
+    parser.add_argument("--json",        type=str,   help="Écrire le rapport JSON dans ce fichier")
+    parser.add_argument("--seuil-p95",   type=float, help="Code retour 1 si la latence p95 (ms) dépasse ce seuil")
+    parser.add_argument("--conserver",   type=str,   help="Racine à conserver (défaut: dossier temporaire supprimé)")
+    parser.add_argument("--verbose",     action="store_true", help="Conserver les sorties des modules")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    if args.conserver:
+        racine = Path(args.conserver).resolve()
+        racine.mkdir(parents=True, exist_ok=True)
+        rapport = executer(args, racine)
+    else:
+        with tempfile.TemporaryDirectory(prefix="kos_bench_") as tmp:
+            rapport = executer(args, Path(tmp).resolve())
+
+    afficher_rapport(rapport)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rapport, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"  Rapport JSON : {args.json}")
+
+    if args.seuil_p95 is not None and rapport["latence_ms"]["p95"] > args.seuil_p95:
+        print(f"  [REGRESSION] p95 {rapport['latence_ms']['p95']} ms > seuil {args.seuil_p95} ms")
+        sys.exit(1)
+    sys.exit(1 if rapport["erreurs"] else 0)
+
+
+if __name__ == "__main__":
+    main()
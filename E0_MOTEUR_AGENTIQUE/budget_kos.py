@@ -0,0 +1,338 @@
+# ERGO_ID: BUDGET_KOS
+"""
+budget_kos.py
+=============
+ERGO KOS_COMPTA — Gouverneur de budget LLM (coût et tokens)
+
+Avant chaque appel LLM, agent_compliance réserve une estimation du coût du
+document ; après l'appel, la réservation est soldée avec les valeurs réelles
+de `_meta` (input_tokens, output_tokens, cout_estime_eur). Réservations et
+consommations vivent dans une base SQLite partagée : la vérification des
+plafonds et la réservation se font dans une même transaction `BEGIN IMMEDIATE`,
+de sorte que des workers concurrents (jobs CI parallèles, watcher + batch) ne
+dépassent jamais ensemble un plafond.
+
+Plafonds (variables d'environnement, vides = illimité) :
+    KOS_BUDGET_RUN_EUR          coût max d'un run (CI_PIPELINE_ID, ou processus local)
+    KOS_BUDGET_JOUR_EUR         coût max par jour, tous clients
+    KOS_BUDGET_CLIENT_JOUR_EUR  coût max par jour et par client
+    KOS_BUDGET_JOUR_TOKENS      tokens (entrée + sortie) max par jour
+
+Un document refusé n'est pas audité : il reste dans E3.1 et sera repris au run
+suivant. Les documents sont priorisés (KOS_BUDGET_PRIORITE) pour que le budget
+disponible serve d'abord les factures échues puis les plus gros montants.
+
+Usage :
+    python budget_kos.py --etat                  # consommation du jour vs plafonds
+    python budget_kos.py --etat --jour 2026-03-10
+
+ERGO_REGISTRY:
+    role         : Gouverneur budget LLM — réservation atomique, plafonds run/jour/client, priorisation
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib), detect_document_type.py, lignes_facture.py,
+                   kos/KOS_COMPTA_Client_Log.json (client_id par défaut)
+    entrees      : _meta des verdicts agent_compliance, frontmatter E3.1
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/BUDGET.sqlite3
+    variable_env : KOS_BUDGET_RUN_EUR, KOS_BUDGET_JOUR_EUR, KOS_BUDGET_CLIENT_JOUR_EUR,
+                   KOS_BUDGET_JOUR_TOKENS, KOS_BUDGET_ESTIMATION_EUR, KOS_BUDGET_PRIORITE,
+                   KOS_CLIENT_ID, CI_PIPELINE_ID
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from detect_document_type import lire_frontmatter
+from lignes_facture import parser_montant
+
+
+BUDGET_DB  = Path(__file__).parent / "logs" / "BUDGET.sqlite3"
+CLIENT_LOG = Path(__file__).parent / "kos" / "KOS_COMPTA_Client_Log.json"
+
+RUN_ID = os.environ.get("CI_PIPELINE_ID") or f"local_{os.getpid()}_{datetime.now():%Y%m%d%H%M%S}"
+
+ESTIMATION_DEFAUT_EUR    = 0.03     # coût d'un audit sans historique (~5 000 tokens sonnet)
+ESTIMATION_DEFAUT_TOKENS = 6000
+HISTORIQUE_ESTIMATION    = 50       # derniers audits soldés servant à l'estimation
+DUREE_RESERVATION        = timedelta(minutes=15)   # réservation d'un worker interrompu ignorée au-delà
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS consommations (
+    id            INTEGER PRIMARY KEY,
+    run_id        TEXT NOT NULL,
+    jour          TEXT NOT NULL,
+    client        TEXT NOT NULL,
+    document      TEXT NOT NULL,
+    statut        TEXT NOT NULL CHECK (statut IN ('reserve', 'consomme')),
+    tokens        INTEGER NOT NULL DEFAULT 0,
+    tokens_input  INTEGER,
+    tokens_output INTEGER,
+    cout_eur      REAL NOT NULL DEFAULT 0,
+    horodatage    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conso_jour_client ON consommations (jour, client);
+CREATE INDEX IF NOT EXISTS idx_conso_run         ON consommations (run_id);
+"""
+
+log = logging.getLogger("budget_kos")
+
+
+# ─────────────────────────────────────────────
+# CONFIGURATION
+# ─────────────────────────────────────────────
+
+def _plafond(variable: str) -> Optional[float]:
+    """Lit un plafond numérique (None si absent, vide ou invalide)."""
+    valeur = os.environ.get(variable, "").strip()
+    try:
+        return float(valeur) if valeur else None
+    except ValueError:
+        log.warning("%s ignoré : valeur non numérique %r", variable, valeur)
+        return None
+
+
+def plafonds() -> dict:
+    """Plafonds actifs lus dans l'environnement (None = illimité).
+
+    Returns:
+        {run_eur, jour_eur, client_jour_eur, jour_tokens}.
+    """
+    return {
+        "run_eur":         _plafond("KOS_BUDGET_RUN_EUR"),
+        "jour_eur":        _plafond("KOS_BUDGET_JOUR_EUR"),
+        "client_jour_eur": _plafond("KOS_BUDGET_CLIENT_JOUR_EUR"),
+        "jour_tokens":     _plafond("KOS_BUDGET_JOUR_TOKENS"),
+    }
+
+
+@lru_cache(maxsize=1)
+def _client_par_defaut() -> str:
+    """client_id du profil client (KOS_COMPTA_Client_Log.json), sinon "CLIENT_001"."""
+    try:
+        profil = json.loads(CLIENT_LOG.read_text(encoding="utf-8")).get("PROFIL_CLIENT", {})
+        return str(profil.get("client_id") or "CLIENT_001")
+    except (OSError, json.JSONDecodeError):
+        return "CLIENT_001"
+
+
+def client_du_document(fm: dict) -> str:
+    """Identifie le client imputé d'un document.
+
+    Ordre : frontmatter `client_id` / `client`, variable KOS_CLIENT_ID,
+    puis PROFIL_CLIENT.client_id du journal client.
+
+    Args:
+        fm: Frontmatter du document.
+
+    Returns:
+        Identifiant client.
+    """
+    return str(fm.get("client_id") or fm.get("client")
+               or os.environ.get("KOS_CLIENT_ID") or _client_par_defaut())
+
+
+# ─────────────────────────────────────────────
+# PRIORISATION
+# ─────────────────────────────────────────────
+
+def _date(valeur) -> Optional[date]:
+    """Convertit une date ISO de frontmatter (éventuellement entre guillemets)."""
+    try:
+        return date.fromisoformat(str(valeur).strip().strip("'\"")[:10])
+    except ValueError:
+        return None
+
+
+def prioriser(chemins: list[Path], mode: str = None) -> list[Path]:
+    """Ordonne les documents pour que le budget serve d'abord les plus urgents.
+
+    Modes (KOS_BUDGET_PRIORITE) :
+        echeance (défaut) : factures échues d'abord (plus ancienne échéance en tête),
+                            puis montant TTC décroissant
+        montant           : montant TTC décroissant
+        fifo              : ordre de dépôt (date de modification)
+
+    Args:
+        chemins: Documents .md de la dropzone.
+        mode:    Mode de priorité (défaut : KOS_BUDGET_PRIORITE).
+
+    Returns:
+        Nouvelle liste triée.
+    """
+    mode = (mode or os.environ.get("KOS_BUDGET_PRIORITE", "echeance")).strip().lower()
+    if mode == "fifo":
+        return sorted(chemins, key=lambda c: c.stat().st_mtime)
+
+    aujourdhui = date.today()
+
+    def cle(chemin: Path) -> tuple:
+        fm       = lire_frontmatter(chemin)
+        montant  = parser_montant(str(fm.get("montant_ttc", "")).strip("'\"")) or Decimal("0")
+        echeance = _date(fm.get("date_echeance", ""))
+        echue    = mode == "echeance" and echeance is not None and echeance < aujourdhui
+        return (not echue, echeance if echue else date.max, -montant, chemin.name)
+
+    return sorted(chemins, key=cle)
+
+
+# ─────────────────────────────────────────────
+# RÉSERVATION / IMPUTATION
+# ─────────────────────────────────────────────
+
+def connecter() -> sqlite3.Connection:
+    """Ouvre la base budget en autocommit (transactions explicites), mode WAL."""
+    BUDGET_DB.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(BUDGET_DB, timeout=30, isolation_level=None)
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.executescript(SCHEMA)
+    return cnx
+
+
+def _estimation(cnx: sqlite3.Connection) -> tuple[float, int]:
+    """Coût et tokens attendus d'un audit : moyenne des derniers audits soldés."""
+    cout, tokens = cnx.execute(
+        "SELECT avg(cout_eur), avg(tokens) FROM (SELECT cout_eur, tokens FROM consommations"
+        " WHERE statut = 'consomme' ORDER BY id DESC LIMIT ?)",
+        (HISTORIQUE_ESTIMATION,),
+    ).fetchone()
+    defaut = _plafond("KOS_BUDGET_ESTIMATION_EUR") or ESTIMATION_DEFAUT_EUR
+    return (cout or defaut), int(tokens or ESTIMATION_DEFAUT_TOKENS)
+
+
+def _engage(cnx: sqlite3.Connection, filtre: str, params: tuple) -> tuple[float, int]:
+    """Coût et tokens engagés (soldés + réservations encore valides) pour un filtre SQL."""
+    limite = (datetime.now() - DUREE_RESERVATION).isoformat()
+    cout, tokens = cnx.execute(
+        f"SELECT coalesce(sum(cout_eur), 0), coalesce(sum(tokens), 0) FROM consommations"
+        f" WHERE {filtre} AND (statut = 'consomme' OR horodatage >= ?)",
+        (*params, limite),
+    ).fetchone()
+    return cout, tokens
+
+
+def reserver(document: str, client: str) -> tuple[Optional[int], str]:
+    """Réserve atomiquement le budget d'un audit, ou le refuse si un plafond serait dépassé.
+
+    Args:
+        document: Nom du fichier audité.
+        client:   Identifiant client (client_du_document()).
+
+    Returns:
+        Tuple (id de réservation, "") si accordé, (None, motif) si le document
+        doit être reporté au run suivant.
+    """
+    p = plafonds()
+    jour = date.today().isoformat()
+    with closing(connecter()) as cnx:
+        cnx.execute("BEGIN IMMEDIATE")
+        try:
+            cout, tokens = _estimation(cnx)
+            controles = (
+                ("run_eur",         "run_id = ?",               (RUN_ID,),        f"run {RUN_ID}"),
+                ("jour_eur",        "jour = ?",                 (jour,),          f"jour {jour}"),
+                ("client_jour_eur", "jour = ? AND client = ?",  (jour, client),   f"client {client} / {jour}"),
+                ("jour_tokens",     "jour = ?",                 (jour,),          f"tokens {jour}"),
+            )
+            for cle, filtre, params, libelle in controles:
+                if p[cle] is None:
+                    continue
+                engage_eur, engage_tokens = _engage(cnx, filtre, params)
+                engage, besoin = (engage_tokens, tokens) if cle == "jour_tokens" else (engage_eur, cout)
+                if engage + besoin > p[cle]:
+                    cnx.execute("ROLLBACK")
+                    unite = "tokens" if cle == "jour_tokens" else "EUR"
+                    return None, (f"Budget {libelle} atteint : {engage:.5g} engagés + {besoin:.5g} estimés"
+                                  f" > plafond {p[cle]:g} {unite}")
+            cur = cnx.execute(
+                "INSERT INTO consommations (run_id, jour, client, document, statut, tokens, cout_eur, horodatage)"
+                " VALUES (?, ?, ?, ?, 'reserve', ?, ?, ?)",
+                (RUN_ID, jour, client, document, tokens, cout, datetime.now().isoformat()),
+            )
+            cnx.execute("COMMIT")
+        except BaseException:
+            if cnx.in_transaction:
+                cnx.execute("ROLLBACK")
+            raise
+    return cur.lastrowid, ""
+
+
+def imputer(reservation: int, meta: dict) -> None:
+    """Solde une réservation avec la consommation réelle de l'appel LLM.
+
+    Args:
+        reservation: Identifiant retourné par reserver().
+        meta:        Bloc `_meta` du verdict (input_tokens, output_tokens, cout_estime_eur).
+    """
+    entree, sortie = meta.get("input_tokens", 0), meta.get("output_tokens", 0)
+    with closing(connecter()) as cnx:
+        cnx.execute(
+            "UPDATE consommations SET statut = 'consomme', tokens = ?, tokens_input = ?,"
+            " tokens_output = ?, cout_eur = ?, horodatage = ? WHERE id = ?",
+            (entree + sortie, entree, sortie, meta.get("cout_estime_eur", 0.0),
+             datetime.now().isoformat(), reservation),
+        )
+
+
+def liberer(reservation: int) -> None:
+    """Annule une réservation (appel LLM non effectué ou en échec)."""
+    with closing(connecter()) as cnx:
+        cnx.execute("DELETE FROM consommations WHERE id = ? AND statut = 'reserve'", (reservation,))
+
+
+# ─────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────
+
+def afficher_etat(jour: str) -> None:
+    """Affiche la consommation d'un jour par client, face aux plafonds actifs."""
+    p = plafonds()
+    with closing(connecter()) as cnx:
+        lignes = cnx.execute(
+            "SELECT client, count(*), sum(tokens), sum(cout_eur), sum(statut = 'reserve')"
+            " FROM consommations WHERE jour = ? GROUP BY client ORDER BY sum(cout_eur) DESC",
+            (jour,),
+        ).fetchall()
+    print(f"\n{'─' * 60}")
+    print(f"  BUDGET LLM — {jour}")
+    print(f"{'─' * 60}")
+    for client, audits, tokens, cout, reserves in lignes:
+        plafond = f" / {p['client_jour_eur']:g}" if p["client_jour_eur"] is not None else ""
+        print(f"  {client:20} {audits:5} audits  {tokens:>9} tokens  {cout:9.4f}{plafond} EUR"
+              + (f"  ({reserves} en cours)" if reserves else ""))
+    total_cout   = sum(l[3] for l in lignes)
+    total_tokens = sum(l[2] for l in lignes)
+    print(f"{'─' * 60}")
+    print(f"  {'TOTAL':20} {sum(l[1] for l in lignes):5} audits  {total_tokens:>9} tokens  {total_cout:9.4f}"
+          + (f" / {p['jour_eur']:g}" if p["jour_eur"] is not None else "") + " EUR")
+    if p["jour_tokens"] is not None:
+        print(f"  Plafond tokens/jour : {total_tokens} / {p['jour_tokens']:g}")
+    if p["run_eur"] is not None:
+        print(f"  Plafond par run     : {p['run_eur']:g} EUR")
+    print()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Gouverneur de budget LLM")
+    parser.add_argument("--etat", action="store_true", help="Consommation du jour par client vs plafonds")
+    parser.add_argument("--jour", type=str, default=date.today().isoformat(), help="Jour AAAA-MM-JJ (défaut: aujourd'hui)")
+    args = parser.parse_args()
+
+    if not args.etat:
+        parser.print_help()
+        sys.exit(1)
+    afficher_etat(args.jour)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
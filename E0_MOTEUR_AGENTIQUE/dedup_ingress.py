@@ -0,0 +1,275 @@
+# ERGO_ID: DEDUP_INGRESS
+"""
+dedup_ingress.py
+================
+ERGO KOS_COMPTA — Index de déduplication à l'entrée de la Dropzone
+
+Empêche qu'un même document soit audité (coût LLM) puis exporté deux fois
+(double comptabilisation). Trois empreintes sont indexées :
+    - sources  : SHA-256 des octets du fichier source (PDF/XML) — avant ETL
+    - contenus : SHA-256 du Markdown normalisé (horodatages et noms retirés)
+    - factures : clé métier fournisseur + numéro de facture
+
+L'index est une table SQLite clé (section, empreinte) → document, étape
+(logs/DEDUP_INDEX.sqlite3, WAL) partagée par l'ETL, l'agent de conformité
+et le watcher : recherche et enregistrement en O(1) par document, sans
+relire ni réécrire l'index entier. Un ancien registry/DEDUP_INDEX.json est
+importé à la création de la base.
+
+Cycle d'une entrée : posée à l'étape "etl" sous le nom du Markdown produit,
+promue en "audit" quand ce Markdown reçoit un verdict abouti, libérée
+(oublier) quand l'audit finit en ERREUR — le document peut alors être
+redéposé. L'ETL n'est bloqué que par une entrée "audit" ; un second dépôt
+encore en attente d'audit est écarté par l'agent de conformité.
+
+Mode (variable KOS_DEDUP) :
+    skip (défaut) : le doublon est écarté avant l'appel LLM (archive/doublons/)
+    flag          : le doublon est audité mais marqué et jamais injecté en ERP
+    off           : déduplication désactivée
+
+ERGO_REGISTRY:
+    role         : Index de deduplication ingress (hash source, hash contenu, fournisseur+numero)
+    version      : 2.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : (stdlib uniquement — sqlite3, hashlib, json, re)
+    entrees      : fichiers source E3.1/input, Markdown E3.1, registry/DEDUP_INDEX.json (import unique)
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/DEDUP_INDEX.sqlite3
+    variable_env : KOS_DEDUP
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+DEDUP_DB    = Path(__file__).parent / "logs" / "DEDUP_INDEX.sqlite3"
+DEDUP_INDEX = Path(__file__).parent / "registry" / "DEDUP_INDEX.json"     # index JSON ≤ v1.1 (import)
+
+CHAMPS_VOLATILS = {"extraction_date", "source_fichier", "id", "statut", "date_soumission", "soumis_par"}
+SECTIONS_INDEX  = ("sources", "contenus", "factures")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS empreintes (
+    section     TEXT NOT NULL,
+    empreinte   TEXT NOT NULL,
+    document    TEXT NOT NULL,
+    etape       TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    PRIMARY KEY (section, empreinte)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_empreintes_document ON empreintes (document);
+"""
+
+
+def mode_dedup() -> str:
+    """Retourne le mode de déduplication actif (skip | flag | off) depuis KOS_DEDUP."""
+    mode = os.environ.get("KOS_DEDUP", "skip").strip().lower()
+    return mode if mode in ("skip", "flag", "off") else "skip"
+
+
+def empreinte_octets(chemin: Path) -> str:
+    """Calcule le SHA-256 des octets d'un fichier, lu par blocs de 1 Mo.
+
+    Args:
+        chemin: Fichier source (PDF, XML, Markdown).
+
+    Returns:
+        Empreinte hexadécimale complète.
+    """
+    h = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def normaliser_contenu(texte: str) -> str:
+    """Normalise un Markdown E3.1 pour comparer deux extractions du même document.
+
+    Retire les champs frontmatter volatils (date d'extraction, nom de fichier,
+    id dérivé du nom), les lignes d'horodatage de l'ETL, puis écrase casse et espaces.
+
+    Args:
+        texte: Contenu Markdown complet (frontmatter inclus).
+
+    Returns:
+        Texte normalisé.
+    """
+    lignes: list[str] = []
+    for ligne in texte.splitlines():
+        cle = ligne.split(":", 1)[0].strip()
+        if ":" in ligne and cle in CHAMPS_VOLATILS:
+            continue
+        if ligne.startswith(("# Document extrait —", "> `")):
+            continue
+        lignes.append(ligne)
+    return re.sub(r"\s+", " ", "\n".join(lignes)).strip().lower()
+
+
+def empreinte_contenu(texte: str) -> str:
+    """SHA-256 du contenu normalisé par normaliser_contenu()."""
+    return hashlib.sha256(normaliser_contenu(texte).encode("utf-8")).hexdigest()
+
+
+def cle_facture(fm: dict) -> Optional[str]:
+    """Construit la clé métier fournisseur + numéro de facture depuis le frontmatter.
+
+    Args:
+        fm: Frontmatter parsé (fournisseur, numero_facture | numero | id).
+
+    Returns:
+        Clé normalisée "FOURNISSEUR|NUMERO", ou None si l'un des deux manque.
+    """
+    fournisseur = fm.get("fournisseur")
+    numero = fm.get("numero_facture") or fm.get("numero") or fm.get("id")
+    if not fournisseur or not numero:
+        return None
+    return f"{_alphanum(fournisseur)}|{_alphanum(numero)}"
+
+
+def _alphanum(valeur) -> str:
+    """Réduit une valeur à ses caractères alphanumériques majuscules (clé d'index)."""
+    return re.sub(r"[^A-Z0-9]", "", str(valeur).upper())
+
+
+def connecter(chemin: Path = None) -> sqlite3.Connection:
+    """Ouvre l'index (création du schéma et import du JSON historique au premier accès), en mode WAL.
+
+    Args:
+        chemin: Fichier SQLite (défaut : DEDUP_DB).
+
+    Returns:
+        Connexion sqlite3 (lignes accessibles par nom de colonne).
+    """
+    chemin = chemin or DEDUP_DB
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    nouvelle = not chemin.exists()
+    cnx = sqlite3.connect(chemin, timeout=30)
+    cnx.row_factory = sqlite3.Row
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    cnx.executescript(SCHEMA)
+    if nouvelle:
+        _importer_json(cnx)
+    return cnx
+
+
+def _importer_json(cnx: sqlite3.Connection) -> int:
+    """Importe un registry/DEDUP_INDEX.json antérieur (ignoré s'il est absent ou illisible)."""
+    if not DEDUP_INDEX.exists():
+        return 0
+    try:
+        data = json.loads(DEDUP_INDEX.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError):
+        return 0
+    lignes = [(section, empreinte, e.get("document", ""), e.get("etape", "etl"), e.get("date", ""))
+              for section in SECTIONS_INDEX for empreinte, e in (data.get(section) or {}).items()
+              if isinstance(e, dict)]
+    with cnx:
+        cnx.executemany("INSERT OR IGNORE INTO empreintes VALUES (?, ?, ?, ?, ?)", lignes)
+    return len(lignes)
+
+
+def _criteres(source: Optional[str], contenu: Optional[str], cle: Optional[str]) -> list[tuple[str, str]]:
+    """Couples (section, empreinte) renseignés, dans l'ordre de priorité des critères."""
+    return [(section, empreinte) for section, empreinte in
+            (("sources", source), ("contenus", contenu), ("factures", cle)) if empreinte]
+
+
+def chercher_doublon(
+    document: str,
+    source: Optional[str] = None,
+    contenu: Optional[str] = None,
+    cle: Optional[str] = None,
+    etapes: Iterable[str] = ("etl", "audit"),
+) -> Optional[dict]:
+    """Recherche un document déjà ingéré partageant l'une des empreintes fournies.
+
+    Une entrée "audit" est toujours un doublon (même fichier redéposé après
+    audit). Une entrée "etl" n'en est un que si elle appartient à un autre
+    document : sous le même nom, c'est le Markdown que l'ETL vient de produire.
+    L'ETL ne consulte que les entrées "audit" (etapes=("audit",)) : il compare
+    un nom de source à des noms de Markdown, et un dépôt encore en attente
+    d'audit est écarté ensuite par l'agent de conformité.
+
+    Args:
+        document: Nom du document candidat.
+        source:   SHA-256 des octets source.
+        contenu:  SHA-256 du contenu normalisé.
+        cle:      Clé fournisseur|numéro.
+        etapes:   Étapes des entrées pouvant désigner un doublon.
+
+    Returns:
+        Entrée existante {document, etape, date, critere (sources | contenus | factures)}, ou None.
+    """
+    criteres = _criteres(source, contenu, cle)
+    if not criteres:
+        return None
+    etapes = tuple(etapes)
+    with closing(connecter()) as cnx:
+        for section, empreinte in criteres:
+            entree = cnx.execute(
+                "SELECT document, etape, date FROM empreintes WHERE section = ? AND empreinte = ?",
+                (section, empreinte),
+            ).fetchone()
+            if entree and entree["etape"] in etapes \
+                    and (entree["document"] != document or entree["etape"] == "audit"):
+                return {**dict(entree), "critere": section}
+    return None
+
+
+def enregistrer(
+    document: str,
+    etape: str,
+    source: Optional[str] = None,
+    contenu: Optional[str] = None,
+    cle: Optional[str] = None,
+) -> None:
+    """Enregistre les empreintes d'un document ingéré (première occurrence conservée).
+
+    Les entrées "etl" d'un document (empreinte source comprise) sont promues
+    en "audit" lorsque ce même document est audité ; une entrée appartenant à
+    un autre document n'est jamais écrasée.
+
+    Args:
+        document: Nom du Markdown E3.1.
+        etape:    "etl" (pdf_extractor) ou "audit" (agent_compliance).
+        source:   SHA-256 des octets source.
+        contenu:  SHA-256 du contenu normalisé.
+        cle:      Clé fournisseur|numéro.
+    """
+    criteres = _criteres(source, contenu, cle)
+    date = datetime.now().isoformat()
+    with closing(connecter()) as cnx, cnx:
+        if etape == "audit":
+            cnx.execute("UPDATE empreintes SET etape = 'audit', date = ? WHERE document = ? AND etape = 'etl'",
+                        (date, document))
+        cnx.executemany(
+            "INSERT INTO empreintes (section, empreinte, document, etape, date) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (section, empreinte) DO UPDATE SET etape = excluded.etape, date = excluded.date "
+            "WHERE empreintes.document = excluded.document AND empreintes.etape = 'etl'",
+            [(section, empreinte, document, etape, date) for section, empreinte in criteres],
+        )
+
+
+def oublier(document: str) -> int:
+    """Libère les empreintes "etl" d'un document dont l'audit n'a pas abouti (ERREUR).
+
+    Le même fichier source peut ensuite être redéposé et audité à nouveau.
+
+    Args:
+        document: Nom du Markdown E3.1.
+
+    Returns:
+        Nombre d'empreintes libérées.
+    """
+    with closing(connecter()) as cnx, cnx:
+        return cnx.execute(
+            "DELETE FROM empreintes WHERE document = ? AND etape = 'etl'", (document,)
+        ).rowcount
@@ -17,9 +17,9 @@ La révision s'incrémente automatiquement quand le SHA-256 de la source change.
 
 ERGO_REGISTRY:
     role         : Genere la documentation Markdown versionnee des composants ERGO_ID
-    version      : 1.1.0
+    version      : 1.2.0
     auteur       : ERGO Capital / Adam
-    dependances  : (stdlib uniquement — ast, re, hashlib, json)
+    dependances  : ast, re, hashlib, json (stdlib), sequence_kos.py
     entrees      : E0_MOTEUR_AGENTIQUE/*.py avec header ERGO_ID
     sorties      : E0_MOTEUR_AGENTIQUE/docs/<ergo_id>.md, E0_MOTEUR_AGENTIQUE/docs/DOC_INDEX.json
 
@@ -39,6 +39,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+import sequence_kos
+
 
 BASE_DIR       = Path(__file__).parent.parent
 E0_DIR         = Path(__file__).parent
@@ -101,7 +103,11 @@ def sauvegarder_doc_index(docs_dir: Path, docs: list[dict]) -> None:
 
 
 def prochain_doc_id(index: list[dict]) -> str:
-    """Calcule le prochain identifiant DOC_XXXX séquentiel.
+    """Alloue le prochain identifiant DOC_XXXX séquentiel.
+
+    L'allocation passe par le compteur atomique DOC de sequence_kos : deux
+    générations concurrentes ne peuvent pas attribuer le même DOC_XXXX.
+    Le plus grand identifiant de l'index sert de plancher.
 
     Args:
         index: Liste actuelle des entrées DOC.
@@ -109,17 +115,7 @@ def prochain_doc_id(index: list[dict]) -> str:
     Returns:
         Identifiant au format "DOC_XXXX" (ex: "DOC_0001").
     """
-    if not index:
-        return "DOC_0001"
-    max_n = 0
-    for entree in index:
-        try:
-            n = int(entree.get("doc_id", "DOC_0000").split("_")[1])
-            if n > max_n:
-                max_n = n
-        except (IndexError, ValueError):
-            pass
-    return f"DOC_{max_n + 1:04d}"
+    return sequence_kos.identifiant("DOC", sequence_kos.max_identifiant(index, "doc_id"))
 
 
 def mettre_a_jour_index(
@@ -0,0 +1,314 @@
+# ERGO_ID: DROPZONE_WATCHER
+"""
+dropzone_watcher.py
+===================
+ERGO KOS_COMPTA — Service de surveillance de la Dropzone E3.1
+
+Processus longue durée qui surveille `E3.1_Dropzone_Factures/input` (PDF/XML)
+et `E3.1_Dropzone_Factures` (Markdown) et pousse chaque arrivée dans la chaîne
+extract → detect → audit → route, dans un processus chaud : modèle d'embedding,
+collection ChromaDB et client Anthropic sont chargés une seule fois.
+
+Détection des arrivées :
+  - inotify via watchdog (si installé)
+  - polling périodique sinon (ou avec --polling)
+
+Anti-rebond : un fichier n'est traité que lorsque sa taille et sa date de
+modification sont restées stables pendant --debounce secondes (fichiers
+en cours de copie ignorés).
+
+Usage :
+  python dropzone_watcher.py
+  python dropzone_watcher.py --debounce 3 --intervalle 1
+  python dropzone_watcher.py --polling
+
+ERGO_REGISTRY:
+    role         : Watcher E3.1 - traitement evenementiel extract/detect/audit/route
+    version      : 1.2.0
+    auteur       : ERGO Capital / Adam
+    dependances  : pdf_extractor.py, detect_document_type.py, agent_compliance.py, instrumentation.py,
+                   watchdog (optionnel)
+    entrees      : E3.1_Dropzone_Factures/input/*.pdf, *.xml, *.ubl, E3.1_Dropzone_Factures/*.md
+    sorties      : E4.1 / E4.2 (via agent_compliance), journal ITERATIONS_LOG, input/archive/
+    variable_env : ANTHROPIC_API_KEY (obligatoire), KOS_BUDGET_* (optionnels, voir budget_kos.py)
+"""
+
+import argparse
+import logging
+import queue
+import shutil
+import signal
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pdf_extractor
+import agent_compliance
+import instrumentation
+from detect_document_type import lire_frontmatter, detecter_type
+
+
+INPUT_DIR      = pdf_extractor.INPUT_DIR
+DROPZONE       = pdf_extractor.DROPZONE
+INPUT_ARCHIVE  = INPUT_DIR / "archive"
+EXTENSIONS_ETL = {".pdf", ".xml", ".ubl", ".facturx"}
+
+log = logging.getLogger("dropzone_watcher")
+
+_arret_demande = False
+
+
+def _demander_arret(signum, _frame) -> None:
+    """Handler SIGINT/SIGTERM : termine la boucle après le document en cours."""
+    global _arret_demande
+    _arret_demande = True
+    log.info(f"Signal {signum} reçu — arrêt après le document en cours")
+
+
+def est_surveille(chemin: Path) -> bool:
+    """Indique si un chemin correspond à un document à traiter par le watcher.
+
+    Args:
+        chemin: Chemin signalé par inotify ou par le polling.
+
+    Returns:
+        True pour un .md directement dans la dropzone ou un PDF/XML dans input/.
+    """
+    if chemin.name.startswith("."):
+        return False
+    if chemin.parent == DROPZONE:
+        return chemin.suffix.lower() == ".md"
+    if chemin.parent == INPUT_DIR:
+        return chemin.suffix.lower() in EXTENSIONS_ETL
+    return False
+
+
+def scanner(dossiers: list[Path]) -> list[Path]:
+    """Liste les documents présents dans les dossiers surveillés (polling / démarrage).
+
+    Args:
+        dossiers: Dossiers à parcourir (non récursif).
+
+    Returns:
+        Chemins des documents à traiter, triés par nom.
+    """
+    trouves: list[Path] = []
+    for dossier in dossiers:
+        if dossier.exists():
+            trouves.extend(p for p in dossier.iterdir() if p.is_file() and est_surveille(p))
+    return sorted(trouves)
+
+
+def demarrer_inotify(dossiers: list[Path], evenements: queue.Queue):
+    """Démarre un observateur watchdog (inotify sous Linux) sur les dossiers.
+
+    Args:
+        dossiers:   Dossiers à surveiller (non récursif).
+        evenements: File recevant les chemins créés, modifiés ou déplacés.
+
+    Returns:
+        Observateur démarré, ou None si watchdog n'est pas installé.
+    """
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        log.warning("watchdog absent (pip install watchdog) — bascule en mode polling")
+        return None
+
+    class _Gestionnaire(FileSystemEventHandler):
+        def on_created(self, event):
+            if not event.is_directory:
+                evenements.put(Path(event.src_path))
+
+        on_modified = on_created
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                evenements.put(Path(event.dest_path))
+
+    observateur = Observer()
+    for dossier in dossiers:
+        observateur.schedule(_Gestionnaire(), str(dossier), recursive=False)
+    observateur.start()
+    log.info("Surveillance inotify active")
+    return observateur
+
+
+def est_stable(chemin: Path, suivi: dict, debounce: float) -> bool:
+    """Anti-rebond : vrai si taille et mtime n'ont pas changé depuis `debounce` secondes.
+
+    Args:
+        chemin:   Fichier candidat.
+        suivi:    État {chemin: (taille, mtime, depuis)} mis à jour à chaque appel.
+        debounce: Durée de stabilité requise en secondes.
+
+    Returns:
+        True si le fichier peut être traité.
+    """
+    try:
+        st = chemin.stat()
+    except FileNotFoundError:
+        suivi.pop(chemin, None)
+        return False
+    signature = (st.st_size, st.st_mtime)
+    precedent = suivi.get(chemin)
+    maintenant = time.monotonic()
+    if precedent is None or precedent[:2] != signature:
+        suivi[chemin] = (*signature, maintenant)
+        return False
+    return st.st_size > 0 and maintenant - precedent[2] >= debounce
+
+
+def traiter_source_etl(chemin: Path) -> Path | None:
+    """Extrait un PDF/XML vers la dropzone puis archive la source dans input/archive/.
+
+    Args:
+        chemin: Fichier source dans input/.
+
+    Returns:
+        Chemin du Markdown produit dans E3.1, ou None si la source est un doublon.
+    """
+    sortie = pdf_extractor.traiter_fichier(chemin)
+    INPUT_ARCHIVE.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(chemin), str(INPUT_ARCHIVE / chemin.name))
+    return sortie
+
+
+def traiter_markdown(chemin: Path) -> bool:
+    """Détecte, audite et route un document Markdown, puis logue l'itération.
+
+    Args:
+        chemin: Fichier .md dans E3.1_Dropzone_Factures.
+
+    Returns:
+        True si l'audit est reporté (budget épuisé, document laissé en E3.1).
+    """
+    debut    = datetime.now().isoformat()
+    doc_type = detecter_type(lire_frontmatter(chemin))
+    log.info(f"DETECT {chemin.name} → type={doc_type}")
+    resultat = agent_compliance.traiter_document(chemin)
+    if resultat.get("reporte"):
+        log.warning(f"Audit reporté {chemin.name} : {resultat['reporte']}")
+        return True
+    agent_compliance.log_iteration("watch", debut, [resultat])
+    return False
+
+
+def traiter(chemin: Path) -> Path | None:
+    """Pousse un document stable dans la chaîne extract → detect → audit → route.
+
+    Args:
+        chemin: Fichier surveillé devenu stable.
+
+    Returns:
+        Chemin du Markdown laissé en E3.1 si l'audit est reporté, sinon None.
+    """
+    t0 = time.perf_counter()
+    if chemin.parent == INPUT_DIR:
+        chemin = traiter_source_etl(chemin)
+        if chemin is None:
+            instrumentation.exporter(composant="dropzone_watcher")
+            return None
+    reporte = traiter_markdown(chemin)
+    instrumentation.exporter(composant="dropzone_watcher")
+    log.info(f"Document traité en {time.perf_counter() - t0:.2f}s → {chemin.name}")
+    return chemin if reporte else None
+
+
+def surveiller(
+    debounce: float = 2.0, intervalle: float = 1.0, polling: bool = False, relance: float = 600.0
+) -> None:
+    """Boucle principale du watcher jusqu'à SIGINT/SIGTERM.
+
+    Args:
+        debounce:   Durée de stabilité requise avant traitement (secondes).
+        intervalle: Période de la boucle (et du scan en mode polling), en secondes.
+        polling:    Force le mode polling même si watchdog est disponible.
+        relance:    Délai avant de représenter un document reporté faute de budget (secondes).
+    """
+    dossiers = [DROPZONE, INPUT_DIR]
+    for dossier in dossiers:
+        dossier.mkdir(parents=True, exist_ok=True)
+
+    evenements: queue.Queue = queue.Queue()
+    observateur = None if polling else demarrer_inotify(dossiers, evenements)
+    if observateur is None:
+        log.info(f"Surveillance par polling (intervalle {intervalle}s)")
+
+    en_attente: set[Path] = set(scanner(dossiers))
+    suivi: dict = {}
+    echecs: dict[Path, float] = {}
+    relances: dict[Path, float] = {}
+
+    try:
+        while not _arret_demande:
+            attente = min(intervalle, 0.25) if en_attente else intervalle
+            try:
+                chemin = evenements.get(timeout=attente)
+                while True:
+                    if est_surveille(chemin):
+                        en_attente.add(chemin)
+                    chemin = evenements.get_nowait()
+            except queue.Empty:
+                pass
+            if observateur is None:
+                en_attente.update(scanner(dossiers))
+            maintenant = time.monotonic()
+            for chemin in [c for c, echeance in relances.items() if echeance <= maintenant]:
+                del relances[chemin]
+                en_attente.add(chemin)
+
+            for chemin in sorted(en_attente):
+                if _arret_demande:
+                    break
+                if not chemin.exists():
+                    en_attente.discard(chemin)
+                    suivi.pop(chemin, None)
+                    continue
+                if echecs.get(chemin) == chemin.stat().st_mtime or chemin in relances:
+                    en_attente.discard(chemin)
+                    continue
+                if not est_stable(chemin, suivi, debounce):
+                    continue
+                en_attente.discard(chemin)
+                suivi.pop(chemin, None)
+                try:
+                    reporte = traiter(chemin)
+                    if reporte is not None:
+                        relances[reporte] = time.monotonic() + relance
+                except Exception as e:
+                    log.error(f"Échec {chemin.name} : {e}")
+                    if chemin.exists():
+                        echecs[chemin] = chemin.stat().st_mtime
+                    pdf_extractor.log_system(chemin.name, "FAILED", f"watcher | {e}")
+    finally:
+        if observateur is not None:
+            observateur.stop()
+            observateur.join()
+        log.info("Watcher arrêté")
+
+
+def main() -> None:
+    """Point d'entrée CLI du watcher de dropzone."""
+    parser = argparse.ArgumentParser(
+        description="ERGO KOS_COMPTA — Watcher E3.1 : extract → detect → audit → route en continu"
+    )
+    parser.add_argument("--debounce",   type=float, default=2.0, help="Stabilité requise avant traitement (s)")
+    parser.add_argument("--intervalle", type=float, default=1.0, help="Période de boucle / polling (s)")
+    parser.add_argument("--polling",    action="store_true", help="Forcer le polling (sans inotify)")
+    parser.add_argument("--relance",    type=float, default=600.0,
+                        help="Délai avant nouvel essai d'un document reporté faute de budget (s)")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGINT, _demander_arret)
+    signal.signal(signal.SIGTERM, _demander_arret)
+
+    log.info(f"═══ WATCHER START → {DROPZONE} ═══")
+    surveiller(args.debounce, args.intervalle, args.polling, args.relance)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
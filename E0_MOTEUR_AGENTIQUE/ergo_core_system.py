@@ -9,10 +9,11 @@ Appelé en stage 'setup' du pipeline GitLab CI/CD.
 import subprocess
 import sys
 import os
-import json
 from pathlib import Path
 from datetime import datetime
 
+import journal_kos
+
 # ─────────────────────────────────────────────
 # CONFIG
 # ─────────────────────────────────────────────
@@ -21,7 +22,6 @@ BASE_DIR       = Path(__file__).parent.parent
 VENV_DIR       = BASE_DIR / ".venv_compta"
 REQUIREMENTS   = BASE_DIR / "requirements.txt"
 CHROMA_STORAGE = BASE_DIR / "chroma_db_storage"
-SYSTEM_LOG     = BASE_DIR / "E0_MOTEUR_AGENTIQUE" / "logs" / "SYSTEM_LOG.json"
 
 DOSSIERS_REQUIS = [
     BASE_DIR / "E1_CORPUS_LEGAL_ETAT",
@@ -42,21 +42,14 @@ def log(niveau: str, message: str):
     print(f"[{ts}] [{niveau}] {message}", flush=True)
 
 def log_system(action: str, statut: str, detail: str = ""):
-    """Écrit une entrée dans SYSTEM_LOG.json."""
-    entrees = []
-    if SYSTEM_LOG.exists():
-        try:
-            entrees = json.loads(SYSTEM_LOG.read_text())
-        except json.JSONDecodeError:
-            entrees = []
-    entrees.append({
+    """Ajoute une entrée au journal SYSTEM_LOG (append-only, voir journal_kos)."""
+    journal_kos.ajouter("SYSTEM_LOG", {
         "timestamp": datetime.now().isoformat(),
         "fichier": "ergo_core_system.py",
         "action": action,
         "statut": statut,
         "detail": detail
     })
-    SYSTEM_LOG.write_text(json.dumps(entrees, ensure_ascii=False, indent=2))
 
 # ─────────────────────────────────────────────
 # ÉTAPES BOOTSTRAP
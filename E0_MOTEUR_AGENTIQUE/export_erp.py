@@ -2,7 +2,7 @@
 """
 export_erp.py
 =============
-KOS_COMPTA — Pipeline E4 : Payloads JSON → CSV Import CEGID
+KOS_COMPTA — Pipeline E4 : Payloads JSON → Imports ERP (CEGID, Sage, EBP, FEC)
 
 Maillon final du pipeline KOS_COMPTA. Transforme les verdicts JSON produits
 par l'agent de conformité (E4.2) en un fichier CSV normalisé, prêt à être
@@ -24,14 +24,62 @@ Garanties v2.0 :
     - Archivage transactionnel (aucune perte de donnée en cas de crash)
     - Validation de structure JSON (batch résilient, pas de crash total)
 
+Export en flux (v2.3) — mémoire constante quel que soit le volume de E4.2 :
+    - parcours paresseux du dossier (os.scandir), parsing orjson si installé
+    - écriture CSV tamponnée (1 Mo) dans IMPORT_CEGID_*.csv.partiel
+    - archivage par lots de KOS_EXPORT_LOT payloads (défaut 500), précédé d'un
+      checkpoint (logs/export_erp.checkpoint.json : offset CSV + lot en attente)
+    - reprise automatique après crash : CSV tronqué au dernier lot validé,
+      lot en attente archivé ; renommage en .csv seulement en fin d'export
+
+Validation parallèle (v2.4) : avec KOS_EXPORT_WORKERS > 1 (ou "auto"), parsing,
+validation et contrôle d'intégrité de chaque lot sont répartis sur un pool de
+processus ; les lignes sont écrites par le processus principal, triées par
+horodatage de payload puis par nom (sortie identique au mode séquentiel).
+
+Montants en centimes entiers (v2.5, module montants) : plus de float() ni de
+tolérance math.isclose ; HT + TVA = TTC est vérifié exactement (écart admis :
+KOS_TOLERANCE_CENTIMES, défaut 0) et chaque lot est contrôlé avant écriture
+(Σ débits = Σ crédits par fichier et par journal, totaux affichés en fin d'export).
+
+Multi-formats (v2.6, module formats_erp) : chaque payload devient des écritures
+d'un modèle commun (date, journal, compte, sens, montant, libellé, pièce, tiers),
+numérotées une pièce par payload et rendues dans la même passe par chaque format
+de KOS_EXPORT_FORMATS (cegid, sage, ebp, fec) — un fichier partiel et un offset
+de checkpoint par format, E4.2 n'est lu qu'une fois.
+
+Archive Parquet (v2.7, module archive_parquet, pyarrow optionnel) : chaque lot
+écrit est aussi ajouté au dataset E4.3_Imports_ERP/ecritures/, partitionné par
+exercice et par mois, avant le checkpoint (un lot rejoué remplace son fichier).
+
+Exactement une fois (v2.8, module index_export) : chaque payload écrit est
+indexé (empreinte SHA-256 du contenu → export, fichiers, plage de lignes) après
+le fsync du lot ; un payload déjà indexé (archivage interrompu, copie remise
+dans E4.2) est écarté comme doublon et seulement archivé, d'un run à l'autre.
+La reprise annule les entrées d'index postérieures au checkpoint.
+
+Balance incrémentale (v2.9, module balance_kos) : chaque lot écrit est reporté
+dans les soldes par compte, tiers et mois (O(lignes du lot)) ; la reprise
+retranche les lots postérieurs au checkpoint, le rapport affiche la balance.
+
+Numérotation continue (v2.10) : les pièces sont numérotées à la suite du
+dernier numéro indexé (index_export.derniere_piece), et non plus à partir de
+1 à chaque export ; chaque export produit ses propres fichiers, FEC compris
+(<SIREN>FEC<AAAAMMJJ_HHMMSS>.txt), sans écraser un export du même jour.
+
 ERGO_REGISTRY:
     role         : Transformation Payloads JSON conformes en CSV import ERP (CEGID)
-    version      : 2.0.0
+    version      : 2.10.0
     auteur       : ERGO Capital / Adam
-    dependances  : [agent_compliance.py]
+    dependances  : [agent_compliance.py, archive_parquet.py, balance_kos.py, formats_erp.py, index_export.py,
+                    instrumentation.py, montants.py, schema_verdict.py, orjson (optionnel), pyarrow (optionnel)]
     entrees      : [E4_AUDIT_ET_ROUTAGE/E4.2_Payloads_ERP/*.json]
-    sorties      : [E4_AUDIT_ET_ROUTAGE/E4.3_Imports_ERP/IMPORT_CEGID_*.csv]
-    variable_env : []
+    sorties      : [E4_AUDIT_ET_ROUTAGE/E4.3_Imports_ERP/IMPORT_CEGID_*.csv (+ IMPORT_SAGE_*, IMPORT_EBP_*,
+                    <SIREN>FEC*.txt selon KOS_EXPORT_FORMATS), E4.3_Imports_ERP/ecritures/ (Parquet),
+                    logs/export_erp.checkpoint.json, logs/EXPORT_INDEX.sqlite3,
+                    logs/BALANCE_KOS.sqlite3]
+    variable_env : [KOS_TELEMETRIE (optionnel), KOS_EXPORT_LOT, KOS_EXPORT_WORKERS, KOS_TOLERANCE_CENTIMES,
+                    KOS_ARRONDI, KOS_EXPORT_FORMATS, KOS_SIREN, KOS_ARCHIVE_PARQUET, KOS_EXERCICE_DEBUT (optionnels)]
 """
 
 import sys
@@ -39,11 +87,30 @@ if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 
 import json
+import contextlib
 import csv
-import math
+import itertools
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Iterator
+
+try:
+    import orjson
+    _charger_json = orjson.loads          # ~3-5x plus rapide ; erreurs sous-classes de ValueError
+except ImportError:
+    _charger_json = json.loads
+
+import archive_parquet
+import balance_kos
+import formats_erp
+import index_export
+import instrumentation
+import montants
+import schema_verdict
 
 logging.basicConfig(
     level=logging.INFO,
@@ -56,8 +123,13 @@ BASE_DIR = Path(__file__).parent.parent
 PAYLOADS_DIR = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.2_Payloads_ERP"
 EXPORT_DIR = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.3_Imports_ERP"
 ARCHIVE_DIR = PAYLOADS_DIR / "archive"
+CHECKPOINT_FILE = Path(__file__).parent / "logs" / "export_erp.checkpoint.json"
+
+JOURNAL = "ACH"
+SUFFIXE_PARTIEL = ".partiel"
+TAMPON_CSV = 1 << 20
 
-TOLERANCE_EUROS = 0.01
+TOLERANCE_CENTIMES = int(os.environ.get("KOS_TOLERANCE_CENTIMES", "0"))
 _CSV_INJECTION_CHARS = ("=", "+", "-", "@", "\t", "\r")
 
 
@@ -79,6 +151,23 @@ def _sanitize_csv_field(val: str) -> str:
     return val
 
 
+def _separer_compte(compte) -> tuple[str, str]:
+    """Sépare "62888 — Frais divers" en ("62888", "Frais divers") ; libellé vide si absent."""
+    numero, _, libelle = str(compte).replace(" –", " —").partition(" —")
+    return numero.strip(), libelle.strip()
+
+
+def _date_iso(valeur) -> str:
+    """Normalise une date (AAAA-MM-JJ, AAAAMMJJ[_HHMMSS], JJ/MM/AAAA) en AAAA-MM-JJ ; "" si illisible."""
+    texte = str(valeur or "").strip()
+    for motif, longueur in (("%Y-%m-%d", 10), ("%Y%m%d", 8), ("%d/%m/%Y", 10)):
+        try:
+            return datetime.strptime(texte[:longueur], motif).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
 def _extraire_depuis_ergo_pgi(data: dict, chemin_fichier: Path) -> dict | None:
     """Extrait les données d'imputation depuis le format ergo_pgi_export_v1.
 
@@ -109,20 +198,25 @@ def _extraire_depuis_ergo_pgi(data: dict, chemin_fichier: Path) -> dict | None:
     ligne_tva = lignes[1] if len(lignes) >= 3 else {"compte": "44566", "debit": 0}
     ligne_ttc = lignes[-1]
 
-    montant_ht = float(ligne_ht.get("debit", 0))
-    tva = float(ligne_tva.get("debit", 0))
-    montant_ttc = float(ligne_ttc.get("credit", 0))
+    montant_ht = ligne_ht.get("debit", 0)
+    tva = ligne_tva.get("debit", 0)
+    montant_ttc = ligne_ttc.get("credit", 0)
 
-    compte_debit = str(ligne_ht.get("compte", "62888")).split(" —")[0].split(" –")[0].strip()
-    compte_credit = str(ligne_ttc.get("compte", "401")).split(" —")[0].split(" –")[0].strip()
+    compte_debit, libelle_debit = _separer_compte(ligne_ht.get("compte", "62888"))
+    compte_credit, libelle_credit = _separer_compte(ligne_ttc.get("compte", "401"))
 
     return {
         "compte_debit": compte_debit,
         "compte_credit": compte_credit,
+        "libelle_debit": libelle_debit,
+        "libelle_credit": libelle_credit,
         "montant_ht": montant_ht,
         "tva_deductible": tva,
         "montant_ttc": montant_ttc,
         "action_erp": export_bloc.get("compliance_status", "A_VALIDER").upper(),
+        "piece": ecriture.get("piece"),
+        "date_piece": ecriture.get("date_piece"),
+        "tiers": ecriture.get("tiers"),
     }
 
 
@@ -130,7 +224,9 @@ def valider_structure_json(data: dict, chemin_fichier: Path) -> dict | None:
     """Valide la structure du payload JSON et extrait le bloc d'imputation.
 
     Supporte deux formats d'entrée :
-        1. Format verdict brut : ``verdict.imputation_recommandee``
+        1. Format verdict brut : ``verdict.imputation_recommandee``, contrôlé
+           par le schéma partagé ``schema_verdict`` (validation sautée si le
+           document est estampillé ``schema`` = SCHEMA_ID, déjà validé en amont)
         2. Format ergo_pgi_export_v1 : produit par ``agent_compliance.py``
 
     Args:
@@ -152,208 +248,506 @@ def valider_structure_json(data: dict, chemin_fichier: Path) -> dict | None:
         return None
 
     imputation = verdict_bloc.get("imputation_recommandee")
-    if not isinstance(imputation, dict) or not imputation:
+    erreurs = [] if schema_verdict.est_estampille(data) else schema_verdict.valider_imputation(imputation)
+    if erreurs:
         logger.warning(
-            "⚠️  IGNORÉ [%s] : Clé 'imputation_recommandee' absente ou vide.",
-            chemin_fichier.name
+            "⚠️  IGNORÉ [%s] : imputation_recommandee hors schéma (%s).",
+            chemin_fichier.name, "; ".join(erreurs[:3])
         )
         return None
 
-    champs_requis = ["montant_ht", "montant_ttc"]
-    for champ in champs_requis:
-        if champ not in imputation or imputation[champ] is None:
-            logger.warning(
-                "⚠️  IGNORÉ [%s] : Champ obligatoire '%s' manquant.",
-                chemin_fichier.name, champ
-            )
-            return None
-
     return imputation
 
 
 def verifier_integrite_comptable(
-    montant_ht: float,
-    tva: float,
-    montant_ttc: float,
+    montant_ht: int,
+    tva: int,
+    montant_ttc: int,
     chemin_fichier: Path
 ) -> bool:
-    """Contrôle de sécurité : vérifie que HT + TVA ≈ TTC.
+    """Contrôle de sécurité : vérifie que HT + TVA = TTC.
 
     Applique la règle fondamentale de la partie double :
         Somme(Débits) = Somme(Crédits) ⟹ HT + TVA = TTC
 
-    Utilise ``math.isclose()`` avec une tolérance absolue de 0.01€
-    pour absorber les erreurs d'arrondi flottant.
+    Comparaison exacte en centimes entiers (``montants``) ; un écart n'est
+    admis que jusqu'à KOS_TOLERANCE_CENTIMES (0 par défaut).
 
     Args:
-        montant_ht: Montant hors taxe.
-        tva: TVA déductible (peut être 0).
-        montant_ttc: Montant toutes taxes comprises.
+        montant_ht: Montant hors taxe (centimes).
+        tva: TVA déductible (centimes, peut être 0).
+        montant_ttc: Montant toutes taxes comprises (centimes).
         chemin_fichier: Chemin du fichier source (utilisé pour les logs).
 
     Returns:
         True si l'intégrité est vérifiée, False sinon.
     """
     somme_debits = montant_ht + tva
-    if not math.isclose(somme_debits, montant_ttc, abs_tol=TOLERANCE_EUROS):
-        ecart = abs(somme_debits - montant_ttc)
+    if abs(somme_debits - montant_ttc) > TOLERANCE_CENTIMES:
         logger.error(
             "🚫 REJETÉ [%s] : Intégrité comptable violée ! "
-            "HT(%.2f) + TVA(%.2f) = %.2f ≠ TTC(%.2f) — Écart: %.2f€",
+            "HT(%s) + TVA(%s) = %s ≠ TTC(%s) — Écart: %s€",
             chemin_fichier.name,
-            montant_ht, tva, somme_debits, montant_ttc, ecart
+            montants.formater(montant_ht), montants.formater(tva), montants.formater(somme_debits),
+            montants.formater(montant_ttc), montants.formater(abs(somme_debits - montant_ttc))
         )
         return False
     return True
 
 
+def iterer_payloads(dossier: Path) -> Iterator[Path]:
+    """Parcourt paresseusement les payloads JSON d'un dossier (os.scandir, sans liste en mémoire).
+
+    Args:
+        dossier: Dossier E4.2 (non récursif : archive/ est ignoré).
+
+    Yields:
+        Chemins des fichiers *.json non cachés, dans l'ordre du système de fichiers.
+    """
+    with os.scandir(dossier) as entrees:
+        for entree in entrees:
+            if entree.name.endswith(".json") and not entree.name.startswith(".") and entree.is_file():
+                yield Path(entree.path)
+
+
+def _ecrire_checkpoint(etat: dict) -> None:
+    """Écrit le checkpoint de façon atomique (fichier temporaire + os.replace)."""
+    CHECKPOINT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(etat, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, CHECKPOINT_FILE)
+
+
+def _archiver(noms: list[str]) -> int:
+    """Déplace les payloads exportés vers archive/ ; retourne le nombre archivé."""
+    archives = 0
+    for nom in noms:
+        try:
+            (PAYLOADS_DIR / nom).rename(ARCHIVE_DIR / nom)
+            archives += 1
+        except FileNotFoundError:
+            archives += (ARCHIVE_DIR / nom).exists()      # déjà archivé avant l'interruption
+        except OSError as e:
+            logger.error(
+                "⚠️  ARCHIVAGE ÉCHOUÉ [%s] : %s",
+                nom, str(e)
+            )
+    return archives
+
+
+def _reprendre() -> dict | None:
+    """Reprend un export interrompu à partir du checkpoint.
+
+    Chaque fichier partiel (un par format) est tronqué au dernier lot validé
+    (lignes écrites après le checkpoint supprimées, entrées d'index_export
+    correspondantes annulées) et les payloads de ce lot, déjà écrits, sont
+    archivés. Sans checkpoint, les fichiers partiels orphelins sont supprimés.
+
+    Returns:
+        État de reprise {fichiers: {format: {nom, octets}}, pieces, pieces_avant,
+        lignes, archives, journaux}, ou None pour un nouvel export.
+    """
+    if not CHECKPOINT_FILE.exists():
+        for orphelin in EXPORT_DIR.glob(f"*{SUFFIXE_PARTIEL}"):
+            logger.warning("🧹 Fichier partiel sans checkpoint supprimé : %s", orphelin.name)
+            orphelin.unlink()
+        return None
+
+    etat = json.loads(CHECKPOINT_FILE.read_text(encoding="utf-8"))
+    if "csv" in etat:                                   # checkpoint v2.4/v2.5 : CEGID seul
+        etat["fichiers"] = {"cegid": {"nom": etat.pop("csv"), "octets": etat.pop("octets")}}
+    manquants = [f["nom"] for f in etat["fichiers"].values() if not (EXPORT_DIR / f["nom"]).exists()]
+    if manquants:
+        logger.warning("⚠️  Checkpoint sans fichier partiel (%s) — nouvel export.", ", ".join(manquants))
+        CHECKPOINT_FILE.unlink()
+        return None
+
+    for fichier in etat["fichiers"].values():
+        with open(EXPORT_DIR / fichier["nom"], "r+b") as f:
+            f.truncate(fichier["octets"])
+    if etat.get("horodatage"):
+        with contextlib.closing(index_export.connecter()) as cnx:
+            annulees = index_export.annuler_apres(cnx, etat["horodatage"], etat["lignes"])
+        if annulees:
+            logger.info("♻️  %d entrée(s) d'index postérieure(s) au checkpoint annulée(s).", annulees)
+        with contextlib.closing(balance_kos.connecter()) as cnx:
+            retranchees = balance_kos.annuler_apres(cnx, etat["horodatage"], etat["lignes"])
+        if retranchees:
+            logger.info("♻️  %d ligne(s) postérieure(s) au checkpoint retranchée(s) de la balance.", retranchees)
+    etat["archives"] += _archiver(etat.pop("en_attente", []))
+    logger.info(
+        "♻️  Reprise de %s : %d écriture(s) déjà exportée(s), %d payload(s) archivé(s).",
+        ", ".join(f["nom"] for f in etat["fichiers"].values()), etat["lignes"], etat["archives"]
+    )
+    return etat
+
+
+def preparer_payload(path: Path) -> dict:
+    """Lit, valide et calcule les écritures d'un payload (sans effet de bord).
+
+    Fonction pure exécutable dans un processus du pool (KOS_EXPORT_WORKERS) :
+    parsing JSON, valider_structure_json(), verifier_integrite_comptable().
+
+    Args:
+        path: Payload JSON de E4.2.
+
+    Returns:
+        {nom, statut ("exporte" | "ignore" | "rejete"), horodatage (clé d'ordre),
+        octets, empreinte (SHA-256 du contenu, index_export), ecritures (modèle
+        formats_erp, sans numero ni date d'écriture), journal, debit, credit
+        (totaux en centimes, pour controler_equilibre())}.
+    """
+    resultat = {"nom": path.name, "statut": "rejete", "horodatage": "", "octets": 0, "ecritures": [],
+                "journal": JOURNAL, "debit": 0, "credit": 0}
+    try:
+        brut = path.read_bytes()
+        data = _charger_json(brut)
+    except ValueError as e:
+        logger.error(
+            "🚫 ERREUR [%s] : JSON malformé — %s",
+            path.name, str(e)
+        )
+        return resultat
+    except OSError as e:
+        logger.error(
+            "🚫 ERREUR [%s] : Impossible de lire le fichier — %s",
+            path.name, str(e)
+        )
+        return resultat
+    resultat["octets"] = len(brut)
+    resultat["empreinte"] = index_export.empreinte(brut)
+    if isinstance(data, dict):
+        entete = data.get("ergo_pgi_export_v1", data)
+        resultat["horodatage"] = str(entete.get("date_export") or entete.get("date_audit") or "")
+
+    imputation = valider_structure_json(data, path) if isinstance(data, dict) else None
+    if imputation is None:
+        resultat["statut"] = "ignore"
+        return resultat
+
+    verdict_bloc = data.get("verdict", {})
+    action_erp = imputation.pop("action_erp", None) or verdict_bloc.get("action_erp", "A_VALIDER")
+
+    try:
+        montant_ht = montants.en_centimes(imputation.get("montant_ht", 0))
+        tva = montants.en_centimes(imputation.get("tva_deductible", 0))
+        montant_ttc = montants.en_centimes(imputation.get("montant_ttc", 0))
+    except ValueError as e:
+        logger.error(
+            "🚫 REJETÉ [%s] : %s",
+            path.name, str(e)
+        )
+        return resultat
+
+    if not verifier_integrite_comptable(montant_ht, tva, montant_ttc, path):
+        return resultat
+
+    reference = path.stem.replace('PAYLOAD_', '')
+    commun = {
+        "journal": JOURNAL,
+        "libelle": _sanitize_csv_field(f"Achat - {reference}"),
+        "statut": action_erp,
+        "piece": _sanitize_csv_field(imputation.get("piece") or reference),
+        "date_piece": _date_iso(imputation.get("date_piece")) or _date_iso(resultat["horodatage"]),
+    }
+
+    def ajouter(sens: str, montant: int, compte, compte_lib, tiers: str = "") -> None:
+        resultat["ecritures"].append({
+            **commun, "compte": _sanitize_csv_field(compte), "compte_lib": _sanitize_csv_field(compte_lib or ""),
+            "sens": sens, "montant": montant, "tiers": tiers,
+        })
+        resultat["debit" if sens == "D" else "credit"] += montant
+
+    if montant_ht:
+        ajouter("D", montant_ht, imputation.get("compte_debit", "62888"), imputation.get("libelle_debit"))
+    if tva > 0:
+        ajouter("D", tva, "44566", "TVA déductible sur autres biens et services")
+    if montant_ttc:
+        ajouter("C", montant_ttc, imputation.get("compte_credit", "401"), imputation.get("libelle_credit"),
+                _sanitize_csv_field(imputation.get("tiers") or ""))
+    resultat["statut"] = "exporte"
+    return resultat
+
+
+def nombre_workers() -> int:
+    """Taille du pool de validation (KOS_EXPORT_WORKERS : entier, "auto" = nombre de cœurs ; défaut 1)."""
+    valeur = os.environ.get("KOS_EXPORT_WORKERS", "1").strip().lower()
+    if valeur == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(valeur or 1))
+
+
+def preparer_lot(lot: list[Path], pool: ProcessPoolExecutor | None, workers: int) -> list[dict]:
+    """Prépare un lot de payloads, en parallèle si un pool est fourni, dans un ordre déterministe.
+
+    Les résultats sont triés par horodatage du payload (date_export / date_audit)
+    puis par nom : le CSV produit est identique quel que soit le nombre de workers.
+
+    Args:
+        lot:     Payloads du lot.
+        pool:    Pool de processus, ou None (exécution séquentielle).
+        workers: Taille du pool (dimensionne les paquets envoyés aux workers).
+
+    Returns:
+        Résultats de preparer_payload() triés.
+    """
+    if pool is None:
+        resultats = [preparer_payload(path) for path in lot]
+    else:
+        resultats = list(pool.map(preparer_payload, lot, chunksize=max(1, len(lot) // (workers * 4))))
+    return sorted(resultats, key=lambda r: (r["horodatage"], r["nom"]))
+
+
+def ecarter_doublons(resultats: list[dict], cnx) -> int:
+    """Écarte les payloads déjà exportés (index_export) ou présents deux fois dans le lot.
+
+    Contrôle par clé primaire (empreinte SHA-256 du contenu) : un payload
+    resté dans E4.2 après un archivage en échec n'est jamais réécrit ; il
+    passe au statut "doublon" et sera seulement archivé.
+
+    Args:
+        resultats: Résultats de preparer_lot() (modifiés en place).
+        cnx:       Connexion à l'index des exports.
+
+    Returns:
+        Nombre de doublons écartés.
+    """
+    candidats = [r for r in resultats if r["statut"] == "exporte"]
+    connus = index_export.deja_exportes(cnx, (r["empreinte"] for r in candidats))
+    vus: set[str] = set()
+    doublons = 0
+    for r in candidats:
+        anterieur = connus.get(r["empreinte"])
+        if anterieur is None and r["empreinte"] not in vus:
+            vus.add(r["empreinte"])
+            continue
+        r["statut"] = "doublon"
+        doublons += 1
+        origine = (f"{anterieur['payload']} — export {anterieur['export']}, lignes "
+                   f"{anterieur['premiere_ligne']}-{anterieur['derniere_ligne']}") if anterieur else "même lot"
+        logger.warning(
+            "♊ DOUBLON [%s] : déjà exporté (%s) — archivé sans réécriture.",
+            r["nom"], origine
+        )
+    return doublons
+
+
+def controler_lot(resultats: list[dict]) -> dict:
+    """Contrôle d'équilibre du lot avant écriture : Σ débits = Σ crédits par fichier et par journal.
+
+    Les payloads dont les lignes générées ne s'équilibrent pas (au-delà de
+    KOS_TOLERANCE_CENTIMES) passent au statut "rejete" et ne sont pas écrits.
+
+    Args:
+        resultats: Résultats de preparer_lot() (modifiés en place).
+
+    Returns:
+        Totaux {journal: {"debit": centimes, "credit": centimes}} des payloads exportés.
+    """
+    exportes = [r for r in resultats if r["statut"] == "exporte"]
+    if not exportes:
+        return {}
+    equilibre = montants.controler_equilibre(
+        [r["nom"] for r in exportes], [r["journal"] for r in exportes],
+        [r["debit"] for r in exportes], [r["credit"] for r in exportes],
+    )
+    rejetes = {nom for nom, ecart in equilibre["fichiers"].items() if abs(ecart) > TOLERANCE_CENTIMES}
+    if not rejetes:
+        return equilibre["journaux"]
+    for r in exportes:
+        if r["nom"] in rejetes:
+            logger.error(
+                "🚫 REJETÉ [%s] : Écritures déséquilibrées — Débit %s ≠ Crédit %s",
+                r["nom"], montants.formater(r["debit"]), montants.formater(r["credit"])
+            )
+            r["statut"] = "rejete"
+    return controler_lot(resultats)
+
+
 def main() -> None:
-    """Point d'entrée principal — Version 2.0 Production-Ready.
-
-    Orchestre le pipeline complet :
-        1. Créer les dossiers de sortie (E4.3, archive) s'ils n'existent pas
-        2. Scanner les payloads JSON dans E4.2
-        3. Pour chaque JSON : valider structure → vérifier intégrité → générer écritures
-        4. Écrire et fermer le fichier CSV
-        5. Archiver en bloc les JSONs traités (transactionnel)
+    """Point d'entrée principal — Version 2.10 (export en flux, reprise, validation parallèle, multi-formats, Parquet, index, balance).
+
+    Orchestre le pipeline complet en mémoire constante :
+        1. Reprendre un export interrompu (checkpoint) ou créer un fichier
+           partiel par format demandé (KOS_EXPORT_FORMATS, défaut cegid)
+        2. Parcourir paresseusement les payloads JSON de E4.2 (os.scandir)
+        3. Pour chaque JSON : valider structure → vérifier intégrité en centimes
+           (pool de KOS_EXPORT_WORKERS processus si > 1) → écarter les payloads
+           déjà exportés (index_export) → contrôler l'équilibre
+           du lot par fichier et par journal → numéroter les écritures (à la
+           suite de la dernière pièce indexée) et les écrire dans chaque format, triées par horodatage de payload
+           (et les ajouter à l'archive Parquet si pyarrow est installé)
+        4. Tous les KOS_EXPORT_LOT payloads : flush + fsync des fichiers,
+           indexation des payloads écrits, report en balance, checkpoint,
+           puis archivage du lot (un crash ne duplique ni ne perd
+           d'écriture)
+        5. Renommer les fichiers partiels (visibles par l'ERP)
         6. Afficher le rapport de synthèse
     """
     print("═" * 60)
-    print(" 🏭 KOS_COMPTA v2.0 : GÉNÉRATION DU FICHIER ERP")
+    print(" 🏭 KOS_COMPTA v2.10 : GÉNÉRATION DES FICHIERS ERP")
     print("═" * 60)
 
     EXPORT_DIR.mkdir(parents=True, exist_ok=True)
     ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
 
-    fichiers_json = list(PAYLOADS_DIR.glob("*.json"))
-
-    if not fichiers_json:
+    reprise = _reprendre()
+    payloads = iterer_payloads(PAYLOADS_DIR)
+    premier = next(payloads, None)
+    if premier is None and reprise is None:
         logger.info("⚠️ Aucun nouveau payload JSON à exporter vers l'ERP.")
         return
 
-    logger.info("📥 %d payload(s) JSON détecté(s) dans E4.2.", len(fichiers_json))
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = EXPORT_DIR / f"IMPORT_CEGID_{timestamp}.csv"
-
-    lignes_exportees: int = 0
-    fichiers_rejetes: int = 0
-    fichiers_ignores: int = 0
-    fichiers_a_archiver: list[Path] = []
-
-    with open(csv_filename, mode='w', newline='', encoding='utf-8') as csv_file:
-        writer = csv.writer(csv_file, delimiter=';')
-
-        writer.writerow([
-            "DATE", "JOURNAL", "COMPTE", "SENS",
-            "MONTANT", "LIBELLE", "STATUT_KOS"
-        ])
-
-        for path in fichiers_json:
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except json.JSONDecodeError as e:
-                logger.error(
-                    "🚫 ERREUR [%s] : JSON malformé — %s",
-                    path.name, str(e)
-                )
-                fichiers_rejetes += 1
-                continue
-            except OSError as e:
-                logger.error(
-                    "🚫 ERREUR [%s] : Impossible de lire le fichier — %s",
-                    path.name, str(e)
-                )
-                fichiers_rejetes += 1
-                continue
-
-            imputation = valider_structure_json(data, path)
-            if imputation is None:
-                fichiers_ignores += 1
-                continue
-
-            verdict_bloc = data.get("verdict", {})
-            action_erp = imputation.pop("action_erp", None) or verdict_bloc.get("action_erp", "A_VALIDER")
-
-            montant_ht = float(imputation.get("montant_ht", 0))
-            tva = float(imputation.get("tva_deductible", 0))
-            montant_ttc = float(imputation.get("montant_ttc", 0))
-
-            if not verifier_integrite_comptable(montant_ht, tva, montant_ttc, path):
-                fichiers_rejetes += 1
-                continue
-
-            date_jour = datetime.now().strftime("%d/%m/%Y")
-            libelle = _sanitize_csv_field(f"Achat - {path.stem.replace('PAYLOAD_', '')}")
-            compte_debit  = _sanitize_csv_field(imputation.get("compte_debit", "62888"))
-            compte_credit = _sanitize_csv_field(imputation.get("compte_credit", "401"))
-
-            if montant_ht:
-                writer.writerow([
-                    date_jour,
-                    "ACH",
-                    compte_debit,
-                    "D",
-                    f"{montant_ht:.2f}",
-                    libelle,
-                    action_erp
-                ])
-                lignes_exportees += 1
-
-            if tva > 0:
-                writer.writerow([
-                    date_jour,
-                    "ACH",
-                    "44566",
-                    "D",
-                    f"{tva:.2f}",
-                    libelle,
-                    action_erp
-                ])
-                lignes_exportees += 1
-
-            if montant_ttc:
-                writer.writerow([
-                    date_jour,
-                    "ACH",
-                    compte_credit,
-                    "C",
-                    f"{montant_ttc:.2f}",
-                    libelle,
-                    action_erp
-                ])
-                lignes_exportees += 1
-
-            fichiers_a_archiver.append(path)
-
-    archives_reussies: int = 0
-    for path in fichiers_a_archiver:
-        try:
-            path.rename(ARCHIVE_DIR / path.name)
-            archives_reussies += 1
-        except OSError as e:
-            logger.error(
-                "⚠️  ARCHIVAGE ÉCHOUÉ [%s] : %s",
-                path.name, str(e)
-            )
+    if reprise:
+        fichiers = reprise["fichiers"]
+        horodatage = reprise.get("horodatage") or datetime.now().strftime("%Y%m%d_%H%M%S")
+        if list(fichiers) != formats_erp.formats_actifs():
+            logger.warning("⚠️  Reprise avec les formats du checkpoint : %s", ", ".join(fichiers))
+    else:
+        horodatage = datetime.now().strftime("%Y%m%d_%H%M%S")
+        fichiers = {nom: {"nom": formats_erp.FORMATS[nom]["fichier"](horodatage) + SUFFIXE_PARTIEL, "octets": 0}
+                    for nom in formats_erp.formats_actifs()}
+
+    compteurs = {"payloads": 0, "lignes": reprise["lignes"] if reprise else 0,
+                 "rejetes": 0, "ignores": 0, "doublons": 0, "octets": 0}
+    archives_reussies: int = reprise["archives"] if reprise else 0
+    journaux: dict[str, dict[str, int]] = reprise.get("journaux", {}) if reprise else {}
+    pieces: int = reprise.get("pieces", 0) if reprise else 0
+    pieces_avant: int = reprise.get("pieces_avant", 0) if reprise else 0
+    taille_lot = max(1, int(os.environ.get("KOS_EXPORT_LOT", "500")))
+    workers = nombre_workers()
+    archiver_parquet = archive_parquet.actif()
+    date_jour = datetime.now().date().isoformat()
+    debut = time.perf_counter()
+
+    noms_definitifs = {nom: fichier["nom"].removesuffix(SUFFIXE_PARTIEL) for nom, fichier in fichiers.items()}
+
+    def etat_courant(en_attente: list[str]) -> dict:
+        return {"fichiers": {nom: {"nom": fichiers[nom]["nom"], "octets": s["fichier"].buffer.tell()}
+                             for nom, s in sorties.items()},
+                "horodatage": horodatage, "en_attente": en_attente, "pieces": pieces, "pieces_avant": pieces_avant,
+                "lignes": compteurs["lignes"], "archives": archives_reussies, "journaux": journaux}
+
+    with contextlib.ExitStack() as pile:
+        pool = pile.enter_context(ProcessPoolExecutor(max_workers=workers)) if workers > 1 else None
+        index = pile.enter_context(contextlib.closing(index_export.connecter()))
+        soldes = pile.enter_context(contextlib.closing(balance_kos.connecter()))
+        sorties: dict[str, dict] = {}
+        for nom, fichier in fichiers.items():
+            spec = formats_erp.FORMATS[nom]
+            flux_fichier = pile.enter_context(open(
+                EXPORT_DIR / fichier["nom"], mode="a" if reprise else "w", newline="",
+                encoding=spec["encodage"], errors="replace", buffering=TAMPON_CSV,
+            ))
+            writer = csv.writer(flux_fichier, delimiter=spec["delimiteur"])
+            if not reprise and spec["entete"]:
+                writer.writerow(spec["entete"])
+            sorties[nom] = {"fichier": flux_fichier, "writer": writer, "ligne": spec["ligne"]}
+            flux_fichier.flush()
+        if not reprise:
+            pieces = pieces_avant = index_export.derniere_piece(index)
+            _ecrire_checkpoint(etat_courant([]))    # toute entrée d'index a désormais un checkpoint de reprise
+
+        flux = itertools.chain([premier] if premier else [], payloads)
+        while lot := list(itertools.islice(flux, taille_lot)):
+            exportes: list[str] = []
+            a_archiver: list[str] = []
+            indexes: list[dict] = []
+            with instrumentation.span("validation", payloads=len(lot), workers=workers) as sp:
+                resultats = preparer_lot(lot, pool, workers)
+                sp["octets"] = sum(r["octets"] for r in resultats)
+            with instrumentation.span("dedoublonnage", payloads=len(lot)) as sp:
+                sp["doublons"] = ecarter_doublons(resultats, index)
+            with instrumentation.span("equilibre", payloads=len(lot)):
+                for code, totaux in controler_lot(resultats).items():
+                    cumul = journaux.setdefault(code, {"debit": 0, "credit": 0})
+                    cumul["debit"]  += totaux["debit"]
+                    cumul["credit"] += totaux["credit"]
+            with instrumentation.span("export_csv", formats=",".join(sorties), payloads=len(lot)) as sp:
+                octets_avant = sum(s["fichier"].buffer.tell() for s in sorties.values())
+                ecritures: list[dict] = []
+                for r in resultats:
+                    compteurs["payloads"] += 1
+                    compteurs["octets"]   += r["octets"]
+                    if r["statut"] == "doublon":
+                        compteurs["doublons"] += 1
+                        a_archiver.append(r["nom"])
+                        continue
+                    if r["statut"] != "exporte":
+                        compteurs["rejetes" if r["statut"] == "rejete" else "ignores"] += 1
+                        continue
+                    pieces += 1
+                    for e in r["ecritures"]:
+                        e["numero"], e["date"], e["source"] = pieces, date_jour, r["nom"]
+                        e["date_piece"] = e["date_piece"] or date_jour
+                    premiere = compteurs["lignes"] + len(ecritures) + 1
+                    indexes.append({"empreinte": r["empreinte"], "payload": r["nom"], "piece": pieces,
+                                    "premiere_ligne": premiere, "derniere_ligne": premiere + len(r["ecritures"]) - 1})
+                    ecritures += r["ecritures"]
+                    exportes.append(r["nom"])
+                premiere_ligne = compteurs["lignes"] + 1
+                for sortie in sorties.values():
+                    ligne = sortie["ligne"]
+                    sortie["writer"].writerows(ligne(e, n) for n, e in enumerate(ecritures, start=premiere_ligne))
+                    sortie["fichier"].flush()
+                    os.fsync(sortie["fichier"].fileno())
+                compteurs["lignes"] += len(ecritures)
+                sp["octets"] = sum(s["fichier"].buffer.tell() for s in sorties.values()) - octets_avant
+            if archiver_parquet:
+                with instrumentation.span("archive_parquet", ecritures=len(ecritures)):
+                    archive_parquet.ajouter(ecritures, horodatage)
+            index_export.enregistrer(index, horodatage, noms_definitifs, indexes)
+            with instrumentation.span("balance", ecritures=len(ecritures)):
+                balance_kos.appliquer(soldes, horodatage, premiere_ligne, ecritures)
+            a_archiver += exportes
+            _ecrire_checkpoint(etat_courant(a_archiver))
+            with instrumentation.span("archivage", payloads=len(a_archiver)):
+                archives_reussies += _archiver(a_archiver)
+            _ecrire_checkpoint(etat_courant([]))
+
+    produits = []
+    for nom, fichier in fichiers.items():
+        produits.append(EXPORT_DIR / noms_definitifs[nom])
+        os.replace(EXPORT_DIR / fichier["nom"], produits[-1])
+    CHECKPOINT_FILE.unlink(missing_ok=True)
+    with contextlib.closing(balance_kos.connecter()) as soldes:
+        balance_kos.clore(soldes, horodatage)
+        cumul = balance_kos.balance(soldes)
+    duree = time.perf_counter() - debut
 
     print()
     print("═" * 60)
-    print(" 📊 RAPPORT D'EXÉCUTION KOS_COMPTA v2.0")
+    print(" 📊 RAPPORT D'EXÉCUTION KOS_COMPTA v2.10")
     print("═" * 60)
-    print(f"  📥 Payloads détectés   : {len(fichiers_json)}")
-    print(f"  ✅ Écritures générées  : {lignes_exportees}")
+    print(f"  📥 Payloads lus        : {compteurs['payloads']}")
+    print(f"  ✅ Écritures générées  : {compteurs['lignes']} ({pieces - pieces_avant} pièce(s))")
     print(f"  📦 Fichiers archivés   : {archives_reussies}")
-    print(f"  ⚠️  Fichiers ignorés    : {fichiers_ignores}")
-    print(f"  🚫 Fichiers rejetés    : {fichiers_rejetes}")
-    print(f"  📂 Fichier ERP         : {csv_filename.name}")
+    print(f"  ⚠️  Fichiers ignorés    : {compteurs['ignores']}")
+    print(f"  🚫 Fichiers rejetés    : {compteurs['rejetes']}")
+    print(f"  ♊ Doublons écartés    : {compteurs['doublons']}")
+    for produit in produits:
+        print(f"  📂 Fichier ERP         : {produit.name}")
+    if archiver_parquet:
+        print(f"  🗄️  Archive Parquet     : {archive_parquet.ARCHIVE_DIR.parent.name}/{archive_parquet.ARCHIVE_DIR.name}/")
+    for code, totaux in sorted(journaux.items()):
+        equilibre = "=" if totaux["debit"] == totaux["credit"] else "≠"
+        print(f"  ⚖️  Journal {code:12}: Débit {montants.formater(totaux['debit'])} {equilibre} "
+              f"Crédit {montants.formater(totaux['credit'])}")
+    print(f"  📒 Balance cumulée     : {len(cumul['comptes'])} compte(s), Débit {montants.formater(cumul['debit'])} "
+          f"{'=' if cumul['equilibre'] else '≠'} Crédit {montants.formater(cumul['credit'])}")
+    print(f"  🚀 Débit               : {compteurs['payloads'] / duree if duree else 0:.0f} payloads/s, "
+          f"{compteurs['octets'] / 1024 ** 2 / duree if duree else 0:.1f} Mo/s ({workers} worker(s), {duree:.2f} s)")
     print("═" * 60)
 
-    if fichiers_rejetes > 0:
+    spans = instrumentation.vider()
+    for etape, mesure in instrumentation.resumer(spans).items():
+        print(f"  ⏱  {etape:12} {mesure['wall_ms']:9.1f} ms réel  {mesure['cpu_ms']:9.1f} ms CPU  ×{mesure['appels']}")
+    instrumentation.exporter(spans, composant="export_erp")
+
+    if compteurs["rejetes"] > 0:
         logger.warning(
             "⚠️  %d fichier(s) rejeté(s) — consultez les logs ci-dessus.",
-            fichiers_rejetes
+            compteurs["rejetes"]
         )
 
 
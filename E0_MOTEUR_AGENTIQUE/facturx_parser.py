@@ -0,0 +1,250 @@
+# ERGO_ID: FACTURX_PARSER
+"""
+facturx_parser.py
+=================
+ERGO KOS_COMPTA — Lecteur Factur-X / UBL en flux (iterparse)
+
+Lit une facture électronique structurée — Factur-X / ZUGFeRD (syntaxe CII
+UN/CEFACT) ou UBL 2.1 (Invoice / CreditNote) — en streaming via
+`lxml.etree.iterparse`, et projette uniquement les chemins utiles vers les
+champs canoniques KOS (numéro, dates, parties, totaux) et les lignes typées
+de `lignes_facture.py`. Les éléments répétés (lignes, taxes) sont conservés ;
+les éléments déjà lus sont libérés au fil de l'eau (mémoire bornée).
+
+Un XML de racine inconnue (ni CII ni UBL) peut être aplati en lignes
+« Parent/Tag: texte » par aplatir_xml (nombre de lignes borné).
+
+ERGO_REGISTRY:
+    role         : Parser Factur-X CII / UBL en flux → champs canoniques + lignes typees
+    version      : 1.1.0
+    auteur       : ERGO Capital / Adam
+    dependances  : lxml, lignes_facture.py
+    entrees      : fichiers .xml / .ubl / .facturx, XML Factur-X embarqué (bytes)
+    sorties      : dict {syntaxe, champs, lignes}, lignes de texte aplaties (aplatir_xml)
+"""
+
+import re
+from pathlib import Path
+from typing import BinaryIO, Union
+
+from lignes_facture import CHAMPS_LIGNE, completer_ligne, parser_montant, parser_taux_tva
+
+
+_CII_ACCORD    = ("SupplyChainTradeTransaction", "ApplicableHeaderTradeAgreement")
+_CII_REGLEMENT = ("SupplyChainTradeTransaction", "ApplicableHeaderTradeSettlement")
+_CII_TOTAUX    = _CII_REGLEMENT + ("SpecifiedTradeSettlementHeaderMonetarySummation",)
+
+CHEMINS_CII: dict[tuple, str] = {
+    ("ExchangedDocument", "ID"):                                            "numero_facture",
+    ("ExchangedDocument", "TypeCode"):                                      "type_code",
+    ("ExchangedDocument", "IssueDateTime", "DateTimeString"):               "date_facture",
+    _CII_ACCORD + ("SellerTradeParty", "Name"):                             "fournisseur",
+    _CII_ACCORD + ("SellerTradeParty", "SpecifiedTaxRegistration", "ID"):   "fournisseur_tva",
+    _CII_ACCORD + ("SellerTradeParty", "SpecifiedLegalOrganization", "ID"): "fournisseur_siret",
+    _CII_ACCORD + ("BuyerTradeParty", "Name"):                              "acheteur",
+    _CII_REGLEMENT + ("InvoiceCurrencyCode",):                              "devise",
+    _CII_REGLEMENT + ("SpecifiedTradePaymentTerms", "DueDateDateTime", "DateTimeString"): "date_echeance",
+    _CII_REGLEMENT + ("SpecifiedTradeSettlementPaymentMeans",
+                      "PayeePartyCreditorFinancialAccount", "IBANID"):      "iban",
+    _CII_TOTAUX + ("TaxBasisTotalAmount",):                                 "montant_ht",
+    _CII_TOTAUX + ("TaxTotalAmount",):                                      "montant_tva",
+    _CII_TOTAUX + ("GrandTotalAmount",):                                    "montant_ttc",
+    _CII_TOTAUX + ("DuePayableAmount",):                                    "net_a_payer",
+}
+
+CHEMINS_LIGNE_CII: dict[tuple, str] = {
+    ("SpecifiedTradeProduct", "Name"):                                          "designation",
+    ("SpecifiedLineTradeDelivery", "BilledQuantity"):                           "quantite",
+    ("SpecifiedLineTradeAgreement", "NetPriceProductTradePrice", "ChargeAmount"): "pu_ht",
+    ("SpecifiedLineTradeSettlement", "ApplicableTradeTax", "RateApplicablePercent"): "taux_tva",
+    ("SpecifiedLineTradeSettlement",
+     "SpecifiedTradeSettlementLineMonetarySummation", "LineTotalAmount"):       "total_ht",
+}
+
+_UBL_FOURNISSEUR = ("AccountingSupplierParty", "Party")
+_UBL_ACHETEUR    = ("AccountingCustomerParty", "Party")
+
+CHEMINS_UBL: dict[tuple, str] = {
+    ("ID",):                                                  "numero_facture",
+    ("InvoiceTypeCode",):                                     "type_code",
+    ("CreditNoteTypeCode",):                                  "type_code",
+    ("IssueDate",):                                           "date_facture",
+    ("DueDate",):                                             "date_echeance",
+    ("DocumentCurrencyCode",):                                "devise",
+    _UBL_FOURNISSEUR + ("PartyLegalEntity", "RegistrationName"): "fournisseur",
+    _UBL_FOURNISSEUR + ("PartyName", "Name"):                 "fournisseur",
+    _UBL_FOURNISSEUR + ("PartyTaxScheme", "CompanyID"):       "fournisseur_tva",
+    _UBL_FOURNISSEUR + ("PartyLegalEntity", "CompanyID"):     "fournisseur_siret",
+    _UBL_ACHETEUR + ("PartyLegalEntity", "RegistrationName"): "acheteur",
+    _UBL_ACHETEUR + ("PartyName", "Name"):                    "acheteur",
+    ("PaymentMeans", "PayeeFinancialAccount", "ID"):          "iban",
+    ("TaxTotal", "TaxAmount"):                                "montant_tva",
+    ("LegalMonetaryTotal", "TaxExclusiveAmount"):             "montant_ht",
+    ("LegalMonetaryTotal", "TaxInclusiveAmount"):             "montant_ttc",
+    ("LegalMonetaryTotal", "PayableAmount"):                  "net_a_payer",
+}
+
+CHEMINS_LIGNE_UBL: dict[tuple, str] = {
+    ("Item", "Name"):                                "designation",
+    ("InvoicedQuantity",):                           "quantite",
+    ("CreditedQuantity",):                           "quantite",
+    ("Price", "PriceAmount"):                        "pu_ht",
+    ("Item", "ClassifiedTaxCategory", "Percent"):    "taux_tva",
+    ("LineExtensionAmount",):                        "total_ht",
+}
+
+SYNTAXES: dict[str, tuple] = {
+    "CrossIndustryInvoice": ("CII", CHEMINS_CII, "IncludedSupplyChainTradeLineItem", CHEMINS_LIGNE_CII),
+    "Invoice":              ("UBL", CHEMINS_UBL, "InvoiceLine",                      CHEMINS_LIGNE_UBL),
+    "CreditNote":           ("UBL", CHEMINS_UBL, "CreditNoteLine",                   CHEMINS_LIGNE_UBL),
+}
+
+CHAMPS_MONTANT = {"montant_ht", "montant_tva", "montant_ttc", "net_a_payer"}
+
+LIGNES_MAX_APLATI = 2000        # borne du repli générique (XML de racine inconnue)
+
+
+def _nom_local(tag) -> str:
+    """Retire l'espace de noms d'un tag lxml ('{urn:...}ID' → 'ID')."""
+    return re.sub(r"^\{.*?\}", "", tag) if isinstance(tag, str) else ""
+
+
+def _formater_date(valeur: str) -> str:
+    """Convertit une date CII format 102 (AAAAMMJJ) en ISO 8601, sinon inchangée."""
+    if re.fullmatch(r"\d{8}", valeur):
+        return f"{valeur[:4]}-{valeur[4:6]}-{valeur[6:]}"
+    return valeur
+
+
+def lire_facture_structuree(source: Union[Path, str, BinaryIO]) -> dict:
+    """Parse une facture Factur-X (CII) ou UBL en flux et la projette sur le modèle KOS.
+
+    Le document est parcouru une seule fois ; seuls les chemins déclarés dans
+    CHEMINS_CII / CHEMINS_UBL et CHEMINS_LIGNE_* sont retenus. Pour un champ
+    d'en-tête répété, la première occurrence est conservée ; chaque élément
+    ligne produit une ligne typée distincte.
+
+    Args:
+        source: Chemin du fichier XML ou flux binaire (ex: XML embarqué PDF/A-3).
+
+    Returns:
+        Dictionnaire contenant :
+            - syntaxe (str)  : "CII" | "UBL"
+            - champs (dict)  : champs canoniques (montants en Decimal, dates ISO)
+            - lignes (list)  : lignes typées (cf. lignes_facture.CHAMPS_LIGNE)
+
+    Raises:
+        ImportError: Si lxml n'est pas installé.
+        ValueError:  Si la racine XML n'est ni CrossIndustryInvoice, ni Invoice, ni CreditNote.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        raise ImportError("pip install lxml")
+
+    flux = str(source) if isinstance(source, Path) else source
+    contexte = etree.iterparse(
+        flux, events=("start", "end"),
+        resolve_entities=False, no_network=True, load_dtd=False,
+    )
+
+    syntaxe, chemins, tag_ligne, chemins_ligne = None, {}, None, {}
+    champs: dict = {}
+    lignes: list[dict] = []
+    pile: list[str] = []
+    ligne: dict | None = None
+    profondeur_ligne = 0
+
+    for evenement, el in contexte:
+        nom = _nom_local(el.tag)
+        if evenement == "start":
+            if syntaxe is None:
+                if nom not in SYNTAXES:
+                    raise ValueError(f"Racine XML non supportée : {nom}")
+                syntaxe, chemins, tag_ligne, chemins_ligne = SYNTAXES[nom]
+                continue
+            pile.append(nom)
+            if nom == tag_ligne and ligne is None:
+                ligne = {c: None for c in CHAMPS_LIGNE}
+                profondeur_ligne = len(pile)
+            continue
+
+        if not pile:
+            break
+        texte = (el.text or "").strip()
+        if ligne is not None:
+            if len(pile) == profondeur_ligne:
+                lignes.append(completer_ligne(ligne))
+                ligne = None
+            elif texte:
+                champ = chemins_ligne.get(tuple(pile[profondeur_ligne:]))
+                if champ and ligne[champ] is None:
+                    if champ == "designation":
+                        ligne[champ] = texte
+                    elif champ == "taux_tva":
+                        ligne[champ] = parser_taux_tva(texte)
+                    else:
+                        ligne[champ] = parser_montant(texte)
+        elif texte:
+            champ = chemins.get(tuple(pile))
+            if champ and champ not in champs:
+                if champ in CHAMPS_MONTANT:
+                    champs[champ] = parser_montant(texte)
+                elif champ.startswith("date_"):
+                    champs[champ] = _formater_date(texte)
+                else:
+                    champs[champ] = texte
+        pile.pop()
+        el.clear()
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+
+    if syntaxe is None:
+        raise ValueError("Document XML vide")
+    return {"syntaxe": syntaxe, "champs": champs, "lignes": lignes}
+
+
+def aplatir_xml(source: Union[Path, str, BinaryIO], lignes_max: int = LIGNES_MAX_APLATI) -> list[str]:
+    """Aplatit un XML quelconque en lignes « Parent/Tag: texte » (repli générique).
+
+    Utilisé pour un XML de racine inconnue, que lire_facture_structuree
+    refuse. Le document est lu en flux ; seuls les éléments porteurs de texte
+    produisent une ligne, et la lecture s'arrête à `lignes_max` lignes.
+
+    Args:
+        source:     Chemin du fichier XML ou flux binaire.
+        lignes_max: Nombre maximal de lignes retournées.
+
+    Returns:
+        Lignes de texte, dans l'ordre du document.
+
+    Raises:
+        ImportError: Si lxml n'est pas installé.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        raise ImportError("pip install lxml")
+
+    flux = str(source) if isinstance(source, Path) else source
+    contexte = etree.iterparse(
+        flux, events=("start", "end"),
+        resolve_entities=False, no_network=True, load_dtd=False,
+    )
+
+    lignes: list[str] = []
+    pile: list[str] = []
+    for evenement, el in contexte:
+        if evenement == "start":
+            pile.append(_nom_local(el.tag))
+            continue
+        texte = (el.text or "").strip()
+        if texte:
+            lignes.append(f"{'/'.join(pile[-2:])}: {texte}")
+            if len(lignes) >= lignes_max:
+                break
+        pile.pop()
+        el.clear()
+        while el.getprevious() is not None:
+            del el.getparent()[0]
+    return lignes
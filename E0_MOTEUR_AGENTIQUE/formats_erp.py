@@ -0,0 +1,173 @@
+# ERGO_ID: FORMATS_ERP
+"""
+formats_erp.py
+==============
+ERGO KOS_COMPTA — Formats d'import ERP (CEGID, Sage, EBP, FEC)
+
+Modèle commun d'écriture comptable en mémoire, produit une seule fois par
+export_erp pour chaque payload E4.2, puis rendu par un ou plusieurs formats
+de sortie dans la même passe (KOS_EXPORT_FORMATS=cegid,fec…).
+
+Écriture (dict) :
+    numero      : numéro d'écriture (séquentiel, une pièce par payload)
+    date        : date d'écriture ISO (AAAA-MM-JJ)
+    journal     : code journal ("ACH")
+    compte      : compte général PCG          compte_lib : libellé du compte
+    sens        : "D" | "C"                    montant    : centimes (int, montants.py)
+    libelle     : libellé d'écriture           statut     : action_erp KOS
+    piece       : référence de pièce (numéro de facture)
+    date_piece  : date de la pièce ISO
+    tiers       : tiers (fournisseur) — renseigné sur la ligne fournisseur
+
+Les colonnes « compte » reçoivent toujours le numéro de compte général ; le
+tiers y figure en compte auxiliaire, sous un code dérivé de son nom
+(code_tiers), son nom complet restant dans les colonnes de libellé.
+
+Un format est une entrée de FORMATS : nom de fichier, motif de recherche des
+fichiers produits, séparateur, encodage, en-tête éventuel, fonction
+ligne(ecriture, numero_ligne) → colonnes et rang de la colonne libellé
+(relue par la réconciliation d'index_export). Ajouter un ERP revient à
+ajouter une entrée.
+
+    cegid : IMPORT_CEGID_*.csv — 7 colonnes historiques (inchangé)
+    sage  : IMPORT_SAGE_*.csv  — import paramétrable Sage 100 (débit / crédit séparés)
+    ebp   : IMPORT_EBP_*.txt   — format ASCII EBP (ligne, date JJMMAA, montant + sens)
+    fec   : <SIREN>FEC<AAAAMMJJ_HHMMSS>.txt — 18 colonnes de l'art. A47 A-1 du LPF,
+            un fichier par export (EcritureNum continu d'un export à l'autre)
+
+ERGO_REGISTRY:
+    role         : Modele d'ecriture commun + formats d'import ERP (CEGID, Sage, EBP, FEC)
+    version      : 1.2.0
+    auteur       : ERGO Capital / Adam
+    dependances  : montants.py
+    entrees      : ecritures preparees par export_erp.py
+    sorties      : lignes des fichiers E4.3_Imports_ERP (un fichier par format)
+    variable_env : KOS_EXPORT_FORMATS (optionnel, défaut "cegid"), KOS_SIREN (optionnel, nom du FEC)
+"""
+
+import os
+import re
+import unicodedata
+from typing import Callable
+
+import montants
+
+
+JOURNAUX = {"ACH": "Journal des achats"}
+
+
+def _date(iso: str, motif: str) -> str:
+    """Reformate une date ISO (AAAA-MM-JJ) selon un motif "JJ", "MM", "AAAA", "AA"."""
+    annee, mois, jour = iso[:10].split("-")
+    return motif.replace("AAAA", annee).replace("AA", annee[2:]).replace("MM", mois).replace("JJ", jour)
+
+
+def code_tiers(nom: str) -> str:
+    """Code de compte auxiliaire d'un tiers : nom sans accents, A-Z / 0-9, 17 caractères au plus.
+
+    Args:
+        nom: Nom du tiers (fournisseur), tel que porté par l'écriture.
+
+    Returns:
+        Code tiers ("FOURNISSEUR0" pour "Fournisseur 0"), chaîne vide sans tiers.
+    """
+    ascii_ = unicodedata.normalize("NFKD", nom).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Z0-9]", "", ascii_.upper())[:17]
+
+
+def _virgule(centimes: int) -> str:
+    """Montant à virgule décimale ("1234,56"), sans séparateur de milliers."""
+    return montants.formater(centimes).replace(".", ",")
+
+
+def _debit_credit(ecriture: dict, formateur: Callable[[int], str]) -> list[str]:
+    """Colonnes [débit, crédit] d'une écriture, l'autre sens à zéro."""
+    montant = formateur(ecriture["montant"])
+    zero = formateur(0)
+    return [montant, zero] if ecriture["sens"] == "D" else [zero, montant]
+
+
+def _ligne_cegid(e: dict, _numero: int) -> list[str]:
+    """CEGID : date JJ/MM/AAAA, montant + sens, statut KOS."""
+    return [_date(e["date"], "JJ/MM/AAAA"), e["journal"], e["compte"], e["sens"],
+            montants.formater(e["montant"]), e["libelle"], e["statut"]]
+
+
+def _ligne_sage(e: dict, _numero: int) -> list[str]:
+    """Sage 100 : date JJMMAA, compte général, code tiers, débit / crédit à virgule."""
+    return [_date(e["date"], "JJMMAA"), e["journal"], e["compte"], code_tiers(e["tiers"]), e["piece"],
+            e["libelle"], *_debit_credit(e, _virgule)]
+
+
+def _ligne_ebp(e: dict, numero: int) -> list[str]:
+    """EBP ASCII : n° de ligne, date JJMMAA, compte général, compte auxiliaire, montant + sens, devise."""
+    return [str(numero), _date(e["date"], "JJMMAA"), e["journal"], e["compte"], code_tiers(e["tiers"]),
+            e["libelle"], e["piece"], montants.formater(e["montant"]), e["sens"], "", "EUR"]
+
+
+def _ligne_fec(e: dict, _numero: int) -> list[str]:
+    """FEC : 18 colonnes, dates AAAAMMJJ, débit / crédit à virgule, validée à la date d'écriture."""
+    aaaammjj = _date(e["date"], "AAAAMMJJ")
+    return [e["journal"], JOURNAUX.get(e["journal"], e["journal"]), str(e["numero"]), aaaammjj,
+            e["compte"], e["compte_lib"] or e["compte"], code_tiers(e["tiers"]), e["tiers"],
+            e["piece"], _date(e["date_piece"], "AAAAMMJJ"), e["libelle"],
+            *_debit_credit(e, _virgule), "", "", aaaammjj, "", ""]
+
+
+FORMATS: dict[str, dict] = {
+    "cegid": {
+        "fichier":    lambda horodatage: f"IMPORT_CEGID_{horodatage}.csv",
+        "motif":      "IMPORT_CEGID_*.csv",
+        "delimiteur": ";",
+        "encodage":   "utf-8",
+        "entete":     ["DATE", "JOURNAL", "COMPTE", "SENS", "MONTANT", "LIBELLE", "STATUT_KOS"],
+        "ligne":      _ligne_cegid,
+        "colonne_libelle": 5,
+    },
+    "sage": {
+        "fichier":    lambda horodatage: f"IMPORT_SAGE_{horodatage}.csv",
+        "motif":      "IMPORT_SAGE_*.csv",
+        "delimiteur": ";",
+        "encodage":   "cp1252",
+        "entete":     ["Date", "Journal", "Compte général", "Compte tiers", "N° pièce",
+                       "Libellé", "Débit", "Crédit"],
+        "ligne":      _ligne_sage,
+        "colonne_libelle": 5,
+    },
+    "ebp": {
+        "fichier":    lambda horodatage: f"IMPORT_EBP_{horodatage}.txt",
+        "motif":      "IMPORT_EBP_*.txt",
+        "delimiteur": ",",
+        "encodage":   "cp1252",
+        "entete":     None,
+        "ligne":      _ligne_ebp,
+        "colonne_libelle": 5,
+    },
+    "fec": {
+        "fichier":    lambda horodatage: f"{os.environ.get('KOS_SIREN', '000000000')}FEC{horodatage}.txt",
+        "motif":      "*FEC*.txt",
+        "delimiteur": "\t",
+        "encodage":   "iso-8859-15",
+        "entete":     ["JournalCode", "JournalLib", "EcritureNum", "EcritureDate", "CompteNum", "CompteLib",
+                       "CompAuxNum", "CompAuxLib", "PieceRef", "PieceDate", "EcritureLib", "Debit", "Credit",
+                       "EcritureLet", "DateLet", "ValidDate", "Montantdevise", "Idevise"],
+        "ligne":      _ligne_fec,
+        "colonne_libelle": 10,
+    },
+}
+
+
+def formats_actifs() -> list[str]:
+    """Formats de sortie demandés (KOS_EXPORT_FORMATS, séparés par des virgules ; défaut "cegid").
+
+    Returns:
+        Noms de formats, dans l'ordre demandé, sans doublon.
+
+    Raises:
+        ValueError: Si un format est inconnu.
+    """
+    demandes = [f.strip().lower() for f in os.environ.get("KOS_EXPORT_FORMATS", "cegid").split(",") if f.strip()]
+    inconnus = [f for f in demandes if f not in FORMATS]
+    if inconnus:
+        raise ValueError(f"KOS_EXPORT_FORMATS : format(s) inconnu(s) {inconnus} (disponibles : {', '.join(FORMATS)})")
+    return list(dict.fromkeys(demandes)) or ["cegid"]
@@ -0,0 +1,420 @@
+# ERGO_ID: FOURNISSEURS_LLM
+"""
+fournisseurs_llm.py
+===================
+ERGO KOS_COMPTA — Fournisseurs LLM, chaîne de repli et disjoncteurs
+
+Abstraction minimale au-dessus des API de complétion utilisées pour l'audit :
+chaque fournisseur expose un appel (system + message utilisateur → texte,
+tokens ; sortie structurée si un JSON Schema est fourni) et un contrôle de santé. `completer()` parcourt la chaîne ordonnée :
+
+    anthropic → gemini → ollama → mistral
+
+L'ordre de repli est celui de GESTION_ERREURS.llm_indisponible
+(KOS_COMPTA_Agentique.json) ; KOS_LLM_CHAINE le remplace entièrement (ex:
+"ollama" pour un audit 100 % local, ou contre un serveur de substitution
+compatible Ollama via OLLAMA_HOST). Les fournisseurs sans clé sont ignorés.
+
+Disjoncteur par fournisseur : après KOS_DISJONCTEUR_ECHECS échecs consécutifs,
+le fournisseur est écarté pendant KOS_DISJONCTEUR_PAUSE_S secondes puis
+retenté une fois (semi-ouvert). Un fournisseur de repli n'est utilisé qu'après
+un contrôle de santé réussi (résultat mis en cache SANTE_TTL secondes).
+
+ERGO_REGISTRY:
+    role         : Abstraction fournisseurs LLM (Anthropic, Gemini, Ollama, Mistral) + repli + disjoncteurs
+    version      : 1.1.0
+    auteur       : ERGO Capital / Adam
+    dependances  : anthropic, requests, kos/KOS_COMPTA_Agentique.json (GESTION_ERREURS)
+    entrees      : prompts d'audit agent_compliance
+    sorties      : texte + tokens + coût du fournisseur ayant répondu
+    variable_env : ANTHROPIC_API_KEY, GEMINI_API_KEY, MISTRAL_API_KEY, OLLAMA_HOST,
+                   KOS_LLM_CHAINE, KOS_MODELE_GEMINI, KOS_MODELE_OLLAMA, KOS_MODELE_MISTRAL,
+                   KOS_DISJONCTEUR_ECHECS, KOS_DISJONCTEUR_PAUSE_S
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import anthropic
+import requests
+
+
+KOS_AGENTIQUE = Path(__file__).parent / "kos" / "KOS_COMPTA_Agentique.json"
+
+SEUIL_ECHECS  = int(os.environ.get("KOS_DISJONCTEUR_ECHECS", "3"))
+PAUSE_S       = float(os.environ.get("KOS_DISJONCTEUR_PAUSE_S", "60"))
+SANTE_TTL     = 30.0
+TIMEOUT_SANTE = 3.0
+TIMEOUT_APPEL = 120.0
+
+log = logging.getLogger("fournisseurs_llm")
+
+_disjoncteurs: dict[str, dict] = {}
+_sante: dict[str, tuple[float, bool]] = {}
+_verrou = threading.Lock()
+
+
+# ─────────────────────────────────────────────
+# APPELS PAR FOURNISSEUR
+# ─────────────────────────────────────────────
+
+@lru_cache(maxsize=1)
+def client_anthropic() -> anthropic.Anthropic:
+    """Instancie une seule fois le client Anthropic (pool HTTP réutilisé).
+
+    ANTHROPIC_BASE_URL, si définie, redirige le client (mock, proxy).
+
+    Raises:
+        KeyError: Si la variable d'environnement ANTHROPIC_API_KEY est absente.
+    """
+    return anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"].strip())
+
+
+def _schema_nu(schema: dict) -> dict:
+    """Schéma sans mots-clés de métadonnées ($schema, $id, title) pour les API LLM."""
+    return {k: v for k, v in schema.items() if not k.startswith("$") and k != "title"}
+
+
+def _decoder(texte: str, schema: Optional[dict]) -> Optional[dict]:
+    """Objet JSON d'une réponse contrainte par schéma (None si non contrainte ou illisible)."""
+    if schema is None:
+        return None
+    try:
+        donnees = json.loads(texte)
+    except json.JSONDecodeError:
+        return None
+    return donnees if isinstance(donnees, dict) else None
+
+
+def _appeler_anthropic(
+    modele: str, system: str, message: str, max_tokens: int, schema: Optional[dict], nom: str
+) -> dict:
+    options = {}
+    if schema is not None:
+        # Sortie structurée : appel d'outil imposé, l'entrée de l'outil est la réponse.
+        options = {
+            "tools": [{"name": nom, "description": schema.get("title", nom), "input_schema": _schema_nu(schema)}],
+            "tool_choice": {"type": "tool", "name": nom},
+        }
+    reponse = client_anthropic().messages.create(
+        model=modele,
+        max_tokens=max_tokens,
+        system=system,
+        messages=[{"role": "user", "content": message}],
+        **options,
+    )
+    outil = next((b for b in reponse.content if b.type == "tool_use"), None)
+    texte = "".join(b.text for b in reponse.content if b.type == "text")
+    return {"texte": json.dumps(outil.input, ensure_ascii=False) if outil else texte,
+            "donnees": outil.input if outil and isinstance(outil.input, dict) else None,
+            "input_tokens": reponse.usage.input_tokens, "output_tokens": reponse.usage.output_tokens}
+
+
+def _sante_anthropic() -> bool:
+    return bool(os.environ.get("ANTHROPIC_API_KEY", "").strip())
+
+
+def _url_gemini(chemin: str) -> str:
+    base = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+    return f"{base}/v1beta/{chemin}"
+
+
+def _appeler_gemini(
+    modele: str, system: str, message: str, max_tokens: int, schema: Optional[dict], nom: str
+) -> dict:
+    r = requests.post(
+        _url_gemini(f"models/{modele}:generateContent"),
+        headers={"x-goog-api-key": os.environ["GEMINI_API_KEY"].strip()},
+        json={
+            "systemInstruction": {"parts": [{"text": system}]},
+            "contents": [{"role": "user", "parts": [{"text": message}]}],
+            "generationConfig": {
+                "maxOutputTokens": max_tokens, "responseMimeType": "application/json",
+                **({"responseJsonSchema": _schema_nu(schema)} if schema is not None else {}),
+            },
+        },
+        timeout=TIMEOUT_APPEL,
+    )
+    r.raise_for_status()
+    data  = r.json()
+    usage = data.get("usageMetadata", {})
+    texte = data["candidates"][0]["content"]["parts"][0]["text"]
+    return {"texte": texte, "donnees": _decoder(texte, schema),
+            "input_tokens": usage.get("promptTokenCount", 0),
+            "output_tokens": usage.get("candidatesTokenCount", 0)}
+
+
+def _sante_gemini() -> bool:
+    r = requests.get(_url_gemini("models"), headers={"x-goog-api-key": os.environ["GEMINI_API_KEY"].strip()},
+                     timeout=TIMEOUT_SANTE)
+    return r.ok
+
+
+def _url_ollama(chemin: str) -> str:
+    return f"{os.environ.get('OLLAMA_HOST', 'http://localhost:11434').rstrip('/')}/api/{chemin}"
+
+
+def _appeler_ollama(
+    modele: str, system: str, message: str, max_tokens: int, schema: Optional[dict], nom: str
+) -> dict:
+    r = requests.post(
+        _url_ollama("chat"),
+        json={
+            "model": modele,
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": message}],
+            "stream": False,
+            "format": _schema_nu(schema) if schema is not None else "json",
+            "options": {"num_predict": max_tokens, "temperature": 0},
+        },
+        timeout=TIMEOUT_APPEL,
+    )
+    r.raise_for_status()
+    data  = r.json()
+    texte = data["message"]["content"]
+    return {"texte": texte, "donnees": _decoder(texte, schema),
+            "input_tokens": data.get("prompt_eval_count", 0), "output_tokens": data.get("eval_count", 0)}
+
+
+def _sante_ollama() -> bool:
+    r = requests.get(_url_ollama("tags"), timeout=TIMEOUT_SANTE)
+    return r.ok
+
+
+def _url_mistral(chemin: str) -> str:
+    return f"{os.environ.get('MISTRAL_BASE_URL', 'https://api.mistral.ai').rstrip('/')}/v1/{chemin}"
+
+
+def _appeler_mistral(
+    modele: str, system: str, message: str, max_tokens: int, schema: Optional[dict], nom: str
+) -> dict:
+    r = requests.post(
+        _url_mistral("chat/completions"),
+        headers={"Authorization": f"Bearer {os.environ['MISTRAL_API_KEY'].strip()}"},
+        json={
+            "model": modele,
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": message}],
+            "max_tokens": max_tokens,
+            "temperature": 0,
+            "response_format": (
+                {"type": "json_schema", "json_schema": {"name": nom, "schema": _schema_nu(schema)}}
+                if schema is not None else {"type": "json_object"}
+            ),
+        },
+        timeout=TIMEOUT_APPEL,
+    )
+    r.raise_for_status()
+    data  = r.json()
+    usage = data.get("usage", {})
+    texte = data["choices"][0]["message"]["content"]
+    return {"texte": texte, "donnees": _decoder(texte, schema),
+            "input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)}
+
+
+def _sante_mistral() -> bool:
+    r = requests.get(_url_mistral("models"), headers={"Authorization": f"Bearer {os.environ['MISTRAL_API_KEY'].strip()}"},
+                     timeout=TIMEOUT_SANTE)
+    return r.ok
+
+
+# Prix indicatifs en EUR/token. Le modèle anthropic est fixé par le palier
+# d'agent_compliance ; les fournisseurs de repli utilisent leur modèle par défaut.
+FOURNISSEURS: dict[str, dict] = {
+    "anthropic": {
+        "appeler": _appeler_anthropic, "sante": _sante_anthropic, "cle": "ANTHROPIC_API_KEY",
+        "modele": None, "prix_input": None, "prix_output": None,
+    },
+    "gemini": {
+        "appeler": _appeler_gemini, "sante": _sante_gemini, "cle": "GEMINI_API_KEY",
+        "modele": os.environ.get("KOS_MODELE_GEMINI", "gemini-2.5-flash"),
+        "prix_input": 0.0000003, "prix_output": 0.0000025,
+    },
+    "ollama": {
+        "appeler": _appeler_ollama, "sante": _sante_ollama, "cle": None,
+        "modele": os.environ.get("KOS_MODELE_OLLAMA", "mistral-nemo"),
+        "prix_input": 0.0, "prix_output": 0.0,
+    },
+    "mistral": {
+        "appeler": _appeler_mistral, "sante": _sante_mistral, "cle": "MISTRAL_API_KEY",
+        "modele": os.environ.get("KOS_MODELE_MISTRAL", "mistral-large-latest"),
+        "prix_input": 0.000002, "prix_output": 0.000006,
+    },
+}
+
+
+# ─────────────────────────────────────────────
+# CHAÎNE DE REPLI
+# ─────────────────────────────────────────────
+
+@lru_cache(maxsize=1)
+def _llm_indisponible() -> dict:
+    """Règle GESTION_ERREURS.llm_indisponible du KOS agentique ({} si illisible)."""
+    try:
+        kos = json.loads(KOS_AGENTIQUE.read_text(encoding="utf-8"))
+        return kos["GESTION_ERREURS"]["llm_indisponible"]
+    except (OSError, KeyError, json.JSONDecodeError) as e:
+        log.warning(f"GESTION_ERREURS.llm_indisponible illisible ({e}) — ordre de repli par défaut")
+        return {}
+
+
+def _ordre_repli_kos() -> tuple[str, ...]:
+    """Fournisseurs de repli dans l'ordre de GESTION_ERREURS.llm_indisponible."""
+    action = _llm_indisponible().get("action", "gemini → ollama → mistral").lower()
+    trouves = re.findall("|".join(n for n in FOURNISSEURS if n != "anthropic"), action)
+    return tuple(dict.fromkeys(trouves))
+
+
+def mention_repli(fournisseur: str, modele: str) -> str:
+    """Mention de rapport imposée par le KOS quand un fournisseur de repli a répondu.
+
+    Args:
+        fournisseur: Nom du fournisseur de repli.
+        modele:      Modèle ayant produit l'analyse.
+
+    Returns:
+        mention_rapport de GESTION_ERREURS.llm_indisponible, [llm_fallback] renseigné.
+    """
+    gabarit = _llm_indisponible().get(
+        "mention_rapport", "LLM principal indisponible — analyse réalisée par [llm_fallback]"
+    )
+    return gabarit.replace("[llm_fallback]", f"{fournisseur}:{modele}")
+
+
+def chaine() -> list[str]:
+    """Chaîne ordonnée des fournisseurs configurés.
+
+    Returns:
+        Noms de fournisseurs : KOS_LLM_CHAINE si définie, sinon anthropic suivi de
+        l'ordre de repli du KOS ; les fournisseurs dont la clé API manque sont omis.
+    """
+    brute = os.environ.get("KOS_LLM_CHAINE", "").strip()
+    noms = [n.strip().lower() for n in brute.split(",")] if brute else ["anthropic", *_ordre_repli_kos()]
+    return [n for n in noms
+            if n in FOURNISSEURS and (FOURNISSEURS[n]["cle"] is None or os.environ.get(FOURNISSEURS[n]["cle"]))]
+
+
+def _disjoncteur_ouvert(nom: str) -> bool:
+    """Vrai si le fournisseur est écarté ; passe en semi-ouvert à l'expiration de la pause."""
+    with _verrou:
+        etat = _disjoncteurs.get(nom)
+        if not etat or etat["echecs"] < SEUIL_ECHECS:
+            return False
+        if time.monotonic() < etat["ouvert_jusqua"]:
+            return True
+        etat["echecs"] = SEUIL_ECHECS - 1      # semi-ouvert : un nouvel échec rouvre
+        _sante.pop(nom, None)
+        return False
+
+
+def _noter(nom: str, succes: bool) -> None:
+    """Met à jour le disjoncteur d'un fournisseur après un appel."""
+    with _verrou:
+        etat = _disjoncteurs.setdefault(nom, {"echecs": 0, "ouvert_jusqua": 0.0})
+        if succes:
+            etat["echecs"] = 0
+            return
+        etat["echecs"] += 1
+        if etat["echecs"] >= SEUIL_ECHECS:
+            etat["ouvert_jusqua"] = time.monotonic() + PAUSE_S
+            log.warning(f"Disjoncteur ouvert : {nom} écarté {PAUSE_S:.0f}s ({etat['echecs']} échecs)")
+
+
+def en_bonne_sante(nom: str) -> bool:
+    """Contrôle de santé d'un fournisseur (résultat mis en cache SANTE_TTL secondes)."""
+    maintenant = time.monotonic()
+    with _verrou:
+        cache = _sante.get(nom)
+    if cache and maintenant - cache[0] < SANTE_TTL:
+        return cache[1]
+    try:
+        ok = bool(FOURNISSEURS[nom]["sante"]())
+    except Exception as exc:
+        log.warning(f"Contrôle de santé {nom} en échec : {exc}")
+        ok = False
+    with _verrou:
+        _sante[nom] = (maintenant, ok)
+    return ok
+
+
+def etat() -> dict:
+    """Instantané des disjoncteurs et contrôles de santé (supervision, rapport)."""
+    with _verrou:
+        return {
+            nom: {
+                "echecs":  _disjoncteurs.get(nom, {}).get("echecs", 0),
+                "ouvert":  _disjoncteurs.get(nom, {}).get("echecs", 0) >= SEUIL_ECHECS
+                           and time.monotonic() < _disjoncteurs[nom]["ouvert_jusqua"],
+                "sante":   _sante[nom][1] if nom in _sante else None,
+            }
+            for nom in FOURNISSEURS
+        }
+
+
+def completer(
+    system: str,
+    message: str,
+    modele: str,
+    max_tokens: int,
+    prix: tuple[float, float],
+    schema: Optional[dict] = None,
+    nom_schema: str = "reponse",
+) -> dict:
+    """Obtient une complétion du premier fournisseur disponible de la chaîne.
+
+    Le fournisseur principal (anthropic) est appelé avec le modèle et les prix
+    du palier demandé ; un fournisseur de repli utilise son modèle par défaut.
+
+    Args:
+        system:     Consignes système.
+        message:    Message utilisateur.
+        modele:     Modèle Anthropic du palier (ex: "claude-sonnet-4-6").
+        max_tokens: Plafond de tokens de sortie.
+        prix:       (EUR/token entrée, EUR/token sortie) du modèle Anthropic.
+        schema:     JSON Schema (objet) imposé à la réponse : appel d'outil forcé chez
+                    Anthropic, sortie structurée native chez les fournisseurs de repli.
+        nom_schema: Nom de l'outil / du schéma transmis à l'API.
+
+    Returns:
+        {fournisseur, modele, texte, donnees (objet décodé si schema, sinon None),
+        input_tokens, output_tokens, cout_eur, repli (motif si un fournisseur de
+        repli a répondu, sinon None)}.
+
+    Raises:
+        RuntimeError: Si aucun fournisseur de la chaîne n'a répondu.
+    """
+    echecs: list[str] = []
+    for rang, nom in enumerate(chaine()):
+        config = FOURNISSEURS[nom]
+        if _disjoncteur_ouvert(nom):
+            echecs.append(f"{nom}: disjoncteur ouvert")
+            continue
+        if rang > 0 and not en_bonne_sante(nom):
+            echecs.append(f"{nom}: contrôle de santé en échec")
+            continue
+        modele_appel = modele if nom == "anthropic" else config["modele"]
+        prix_input, prix_output = prix if nom == "anthropic" else (config["prix_input"], config["prix_output"])
+        try:
+            reponse = config["appeler"](modele_appel, system, message, max_tokens, schema, nom_schema)
+        except Exception as exc:
+            _noter(nom, False)
+            echecs.append(f"{nom}: {type(exc).__name__}: {exc}"[:300])
+            log.warning(f"LLM {nom} indisponible ({type(exc).__name__}) — bascule sur le fournisseur suivant")
+            continue
+        _noter(nom, True)
+        return {
+            "fournisseur":   nom,
+            "modele":        modele_appel,
+            "texte":         reponse["texte"],
+            "donnees":       reponse["donnees"],
+            "input_tokens":  reponse["input_tokens"],
+            "output_tokens": reponse["output_tokens"],
+            "cout_eur":      round(reponse["input_tokens"] * prix_input + reponse["output_tokens"] * prix_output, 5),
+            "repli":         "; ".join(echecs) if echecs else None,
+        }
+    raise RuntimeError("Aucun fournisseur LLM disponible — " + ("; ".join(echecs) or "chaîne vide"))
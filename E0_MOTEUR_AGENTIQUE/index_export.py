@@ -0,0 +1,278 @@
+# ERGO_ID: INDEX_EXPORT
+"""
+index_export.py
+===============
+ERGO KOS_COMPTA — Index persistant des payloads exportés (exactement une fois)
+
+Chaque payload écrit par export_erp est enregistré sous l'empreinte SHA-256
+de son contenu, avec l'export, les fichiers d'import et la plage de lignes
+qui le portent. export_erp consulte l'index avant d'écrire un lot : un
+payload déjà exporté (archivage interrompu, copie remise dans E4.2) est
+archivé sans être réécrit, quel que soit le run qui l'a exporté.
+
+Cohérence avec la reprise d'export_erp : les entrées d'un lot sont validées
+après le fsync des fichiers d'import et avant le checkpoint ; à la reprise,
+celles situées au-delà du dernier checkpoint (lignes tronquées) sont annulées.
+
+La réconciliation vérifie que chaque payload archivé est indexé et que
+chaque payload apparaît une seule fois dans les fichiers d'import de E4.3,
+pour chacun des formats produits (CEGID, Sage, EBP, FEC). L'index fournit
+aussi le dernier numéro de pièce attribué (derniere_piece), d'où export_erp
+poursuit la numérotation d'un export à l'autre.
+
+Usage :
+    python index_export.py --reconcilier
+    python index_export.py --reconcilier --json
+
+ERGO_REGISTRY:
+    role         : Index SQLite empreinte payload → fichier d'import + lignes ; reconciliation E4.2 / E4.3
+    version      : 1.1.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib), formats_erp.py
+    entrees      : payloads E4.2 (et archive/), fichiers E4.3_Imports_ERP
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/EXPORT_INDEX.sqlite3, rapport de reconciliation
+    variable_env : (aucune)
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import sys
+from collections import Counter
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable
+
+import formats_erp
+
+
+BASE_DIR     = Path(__file__).parent.parent
+PAYLOADS_DIR = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.2_Payloads_ERP"
+EXPORT_DIR   = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.3_Imports_ERP"
+INDEX_DB     = Path(__file__).parent / "logs" / "EXPORT_INDEX.sqlite3"
+
+_LOT_SQL = 500          # paramètres par requête IN (...) (limite SQLite : 999 sur les anciennes versions)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    empreinte       TEXT PRIMARY KEY,
+    payload         TEXT NOT NULL,
+    export          TEXT NOT NULL,
+    fichiers        TEXT NOT NULL,
+    piece           INTEGER NOT NULL,
+    premiere_ligne  INTEGER NOT NULL,
+    derniere_ligne  INTEGER NOT NULL,
+    date_export     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_exports_export  ON exports (export, premiere_ligne);
+CREATE INDEX IF NOT EXISTS idx_exports_payload ON exports (payload);
+"""
+
+
+def empreinte(contenu: bytes) -> str:
+    """Empreinte SHA-256 (hexadécimale) du contenu brut d'un payload."""
+    return hashlib.sha256(contenu).hexdigest()
+
+
+def connecter(chemin: Path = None) -> sqlite3.Connection:
+    """Ouvre l'index (création du schéma au premier accès), en mode WAL.
+
+    Args:
+        chemin: Fichier SQLite (défaut : INDEX_DB).
+
+    Returns:
+        Connexion sqlite3 (lignes accessibles par nom de colonne).
+    """
+    chemin = chemin or INDEX_DB
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(chemin, timeout=30)
+    cnx.row_factory = sqlite3.Row
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    cnx.executescript(SCHEMA)
+    return cnx
+
+
+def deja_exportes(cnx: sqlite3.Connection, empreintes: Iterable[str]) -> dict[str, sqlite3.Row]:
+    """Recherche par clé primaire les empreintes déjà exportées.
+
+    Args:
+        cnx:        Connexion à l'index.
+        empreintes: Empreintes du lot à écrire.
+
+    Returns:
+        {empreinte: ligne d'index} pour les payloads déjà exportés.
+    """
+    cles = list(dict.fromkeys(empreintes))
+    trouves: dict[str, sqlite3.Row] = {}
+    for i in range(0, len(cles), _LOT_SQL):
+        paquet = cles[i:i + _LOT_SQL]
+        requete = f"SELECT * FROM exports WHERE empreinte IN ({','.join('?' * len(paquet))})"
+        trouves.update((ligne["empreinte"], ligne) for ligne in cnx.execute(requete, paquet))
+    return trouves
+
+
+def enregistrer(cnx: sqlite3.Connection, export: str, fichiers: dict[str, str], entrees: list[dict]) -> None:
+    """Enregistre les payloads d'un lot écrit, en une transaction.
+
+    Args:
+        cnx:      Connexion à l'index.
+        export:   Identifiant de l'export (horodatage).
+        fichiers: Noms définitifs des fichiers d'import de l'export, par format.
+        entrees:  {empreinte, payload, piece, premiere_ligne, derniere_ligne} par payload.
+    """
+    date_export = datetime.now().isoformat(timespec="seconds")
+    noms = json.dumps(fichiers, ensure_ascii=False)
+    with cnx:
+        cnx.executemany(
+            "INSERT INTO exports (empreinte, payload, export, fichiers, piece, premiere_ligne, derniere_ligne, "
+            "date_export) VALUES (:empreinte, :payload, :export, :fichiers, :piece, :premiere_ligne, "
+            ":derniere_ligne, :date_export)",
+            [{**e, "export": export, "fichiers": noms, "date_export": date_export} for e in entrees],
+        )
+
+
+def derniere_piece(cnx: sqlite3.Connection) -> int:
+    """Dernier numéro de pièce indexé, tous exports confondus (0 si l'index est vide)."""
+    return cnx.execute("SELECT COALESCE(MAX(piece), 0) FROM exports").fetchone()[0]
+
+
+def annuler_apres(cnx: sqlite3.Connection, export: str, lignes: int) -> int:
+    """Annule les entrées d'un export situées au-delà de `lignes` (reprise après crash).
+
+    Args:
+        cnx:    Connexion à l'index.
+        export: Identifiant de l'export repris.
+        lignes: Nombre de lignes conservées par le checkpoint.
+
+    Returns:
+        Nombre d'entrées annulées.
+    """
+    with cnx:
+        return cnx.execute(
+            "DELETE FROM exports WHERE export = ? AND premiere_ligne > ?", (export, lignes)
+        ).rowcount
+
+
+# ─────────────────────────────────────────────
+# RÉCONCILIATION
+# ─────────────────────────────────────────────
+
+def _attendu(libelle: str, nom_format: str) -> str:
+    """Libellé tel que relu dans un fichier du format (caractères hors encodage remplacés à l'écriture)."""
+    encodage = formats_erp.FORMATS[nom_format]["encodage"]
+    return libelle.encode(encodage, errors="replace").decode(encodage)
+
+
+def _lire_libelles(fichier: Path, nom_format: str) -> list[str]:
+    """Libellés des lignes de données d'un fichier d'import (liste vide si le fichier est absent)."""
+    format_erp = formats_erp.FORMATS[nom_format]
+    if not fichier.exists():
+        return []
+    colonne = format_erp["colonne_libelle"]
+    with open(fichier, newline="", encoding=format_erp["encodage"], errors="replace") as f:
+        lignes = list(csv.reader(f, delimiter=format_erp["delimiteur"]))
+    if format_erp["entete"]:
+        lignes = lignes[1:]
+    return [ligne[colonne] if len(ligne) > colonne else "" for ligne in lignes]
+
+
+def reconcilier() -> dict:
+    """Vérifie que chaque payload archivé apparaît exactement une fois dans les exports.
+
+    Les contrôles de lignes portent sur chaque fichier d'import indexé, quel
+    qu'en soit le format, et les doublons sont recherchés format par format.
+
+    Contrôles :
+        non_indexes     : payloads archivés absents de l'index (exports antérieurs à l'index)
+        payload_absents : entrées d'index dont le payload n'est ni dans E4.2 ni dans archive/
+        incoherents     : plage de lignes indexée absente d'un fichier ou portant un autre libellé
+        doublons        : libellé de payload présent dans plusieurs pièces des fichiers d'un format
+
+    Returns:
+        {"payloads_archives", "entrees_index", "fichiers", "non_indexes", "payload_absents",
+         "incoherents", "doublons"} (listes de noms / détails).
+    """
+    with closing(connecter()) as cnx:
+        index = list(cnx.execute("SELECT * FROM exports ORDER BY export, premiere_ligne"))
+    par_empreinte = {ligne["empreinte"]: ligne for ligne in index}
+
+    archives = sorted((PAYLOADS_DIR / "archive").glob("*.json")) if (PAYLOADS_DIR / "archive").exists() else []
+    non_indexes = [p.name for p in archives if empreinte(p.read_bytes()) not in par_empreinte]
+    presents = {p.name for p in archives} | {p.name for p in PAYLOADS_DIR.glob("*.json")}
+    payload_absents = [ligne["payload"] for ligne in index if ligne["payload"] not in presents]
+
+    incoherents: list[str] = []
+    libelles_par_fichier: dict[tuple[str, str], list[str]] = {}    # (format, fichier) → libellés
+    for ligne in index:
+        attendu = f"Achat - {Path(ligne['payload']).stem.replace('PAYLOAD_', '')}"
+        for nom_format, nom in json.loads(ligne["fichiers"]).items():
+            if nom_format not in formats_erp.FORMATS:
+                continue
+            cle = (nom_format, nom)
+            if cle not in libelles_par_fichier:
+                libelles_par_fichier[cle] = _lire_libelles(EXPORT_DIR / nom, nom_format)
+            libelles = libelles_par_fichier[cle][ligne["premiere_ligne"] - 1:ligne["derniere_ligne"]]
+            if (len(libelles) != ligne["derniere_ligne"] - ligne["premiere_ligne"] + 1
+                    or set(libelles) != {_attendu(attendu, nom_format)}):
+                incoherents.append(f"{ligne['payload']} → {nom} lignes "
+                                   f"{ligne['premiere_ligne']}-{ligne['derniere_ligne']}")
+
+    for nom_format, format_erp in formats_erp.FORMATS.items():
+        for fichier in sorted(EXPORT_DIR.glob(format_erp["motif"])):
+            if (nom_format, fichier.name) not in libelles_par_fichier:
+                libelles_par_fichier[(nom_format, fichier.name)] = _lire_libelles(fichier, nom_format)
+    doublons: list[str] = []
+    for nom_format in formats_erp.FORMATS:
+        occurrences: Counter = Counter()
+        for (format_fichier, _), libelles in libelles_par_fichier.items():
+            if format_fichier != nom_format:
+                continue
+            precedent = None
+            for libelle in libelles:
+                if libelle != precedent:                   # une pièce = suite de lignes de même libellé
+                    occurrences[libelle] += 1
+                precedent = libelle
+        doublons += sorted(f"[{nom_format}] {libelle} ×{n}" for libelle, n in occurrences.items() if n > 1)
+
+    return {
+        "payloads_archives": len(archives),
+        "entrees_index": len(index),
+        "fichiers": len(libelles_par_fichier),
+        "non_indexes": non_indexes,
+        "payload_absents": payload_absents,
+        "incoherents": incoherents,
+        "doublons": doublons,
+    }
+
+
+def main() -> None:
+    """Point d'entrée CLI : réconciliation payloads archivés ↔ fichiers d'import."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Index des payloads exportés")
+    parser.add_argument("--reconcilier", action="store_true",
+                        help="Vérifier que chaque payload archivé est exporté exactement une fois")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+    if not args.reconcilier:
+        parser.print_help()
+        sys.exit(0)
+
+    resultat = reconcilier()
+    if args.json:
+        print(json.dumps(resultat, ensure_ascii=False, indent=2))
+    else:
+        print(f"  {resultat['payloads_archives']} payload(s) archivé(s), {resultat['entrees_index']} entrée(s) "
+              f"d'index, {resultat['fichiers']} fichier(s) d'import")
+        for cle, titre in (("doublons", "Exportés plusieurs fois"), ("incoherents", "Plages incohérentes"),
+                           ("payload_absents", "Payloads introuvables"), ("non_indexes", "Archivés non indexés")):
+            print(f"  {'✗' if resultat[cle] else '✓'} {titre} : {len(resultat[cle])}")
+            for detail in resultat[cle][:20]:
+                print(f"      - {detail}")
+    sys.exit(1 if resultat["doublons"] or resultat["incoherents"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,14 @@ Hackathon GitLab AI 2026
 
 Ingestion vectorielle des normes E1/E2 dans ChromaDB.
 Parse, chunk, encode (multilingual-e5-base) et stocke les documents légaux.
+Chaque étape (modèle, scan, chunking, embedding, upsert) est chronométrée.
 
 ERGO_REGISTRY:
     role         : RAG Ingestion — parse E1/E2, chunk, embed, stocke dans ChromaDB
-    version      : 1.0.0
+    version      : 1.1.0
     auteur       : ERGO Capital / Adam
-    dependances  : chromadb, sentence-transformers, langchain-text-splitters, python-frontmatter
+    dependances  : chromadb, sentence-transformers, langchain-text-splitters, python-frontmatter,
+                   instrumentation.py
     entrees      : E1_CORPUS_LEGAL_ETAT/*.md, E2_SOP_INTERNE_ET_ERP/*.md
     sorties      : KOS_DB/ (ChromaDB persistant)
 """
@@ -26,6 +28,8 @@ import chromadb
 from sentence_transformers import SentenceTransformer
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+import instrumentation
+
 
 BASE_DIR = Path(__file__).parent.parent
 E1_LEGAL = BASE_DIR / "E1_CORPUS_LEGAL_ETAT"
@@ -165,13 +169,16 @@ def ingerer(
     for debut in range(0, len(chunks), batch_size):
         lot = chunks[debut : debut + batch_size]
         textes_prefixes = [f"passage: {c['texte']}" for c in lot]
-        vecteurs = model.encode(textes_prefixes, normalize_embeddings=True).tolist()
-        collection.upsert(
-            ids=[c["id"] for c in lot],
-            embeddings=vecteurs,
-            documents=[c["texte"] for c in lot],
-            metadatas=[c["metadata"] for c in lot],
-        )
+        with instrumentation.span("embedding", chunks=len(lot)) as sp:
+            sp["octets"] = sum(len(t.encode("utf-8")) for t in textes_prefixes)
+            vecteurs = model.encode(textes_prefixes, normalize_embeddings=True).tolist()
+        with instrumentation.span("chroma_upsert", chunks=len(lot)):
+            collection.upsert(
+                ids=[c["id"] for c in lot],
+                embeddings=vecteurs,
+                documents=[c["texte"] for c in lot],
+                metadatas=[c["metadata"] for c in lot],
+            )
         total += len(lot)
         logging.info("  Batch upsert : %d/%d chunks.", total, len(chunks))
     return total
@@ -186,14 +193,19 @@ def main() -> None:
     debut = time.time()
     logging.info("=== ERGO KOS_COMPTA — Ingestion RAG ===")
 
-    model      = initialiser_embedding_model()
-    documents  = scanner_documents([E1_LEGAL, E2_SOP])
-    collection = initialiser_chromadb(KOS_DB)
+    with instrumentation.span("chargement_modele", modele="intfloat/multilingual-e5-base"):
+        model = initialiser_embedding_model()
+    with instrumentation.span("scan") as sp:
+        documents = scanner_documents([E1_LEGAL, E2_SOP])
+        sp["octets"] = sum(len(d["contenu"].encode("utf-8")) for d in documents)
+    with instrumentation.span("chroma_init"):
+        collection = initialiser_chromadb(KOS_DB)
 
     tous_chunks: list[dict] = []
-    for doc in documents:
-        chunks = chunker_document(doc["contenu"], doc["metadata"], doc["chemin"])
-        tous_chunks.extend(chunks)
+    with instrumentation.span("chunking"):
+        for doc in documents:
+            chunks = chunker_document(doc["contenu"], doc["metadata"], doc["chemin"])
+            tous_chunks.extend(chunks)
 
     if not tous_chunks:
         logging.warning("Aucun chunk à ingérer — vérifier E1/E2.")
@@ -207,6 +219,10 @@ def main() -> None:
         total_chunks,
         duree,
     )
+    spans = instrumentation.vider()
+    for etape, mesure in instrumentation.resumer(spans).items():
+        logging.info("  %-18s %9.1f ms réel  %9.1f ms CPU  ×%d", etape, mesure["wall_ms"], mesure["cpu_ms"], mesure["appels"])
+    instrumentation.exporter(spans, composant="ingest_kos")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+# ERGO_ID: INSTRUMENTATION
+"""
+instrumentation.py
+==================
+ERGO KOS_COMPTA — Spans de latence et de coût par étape du pipeline
+
+API minimale de chronométrage utilisée par agent_compliance, pdf_extractor,
+ingest_kos et export_erp :
+
+    with trace("facture_A102.md") as t:          # regroupe les spans d'un document
+        with span("lecture") as s:
+            ...
+            s["octets"] = taille
+        with span("llm", modele="claude-sonnet-4-6") as s:
+            ...
+            s["tokens_input"], s["tokens_output"] = 4353, 589
+    t["spans"]            # → écrit dans l'enregistrement d'itération
+
+Chaque span mesure le temps réel (perf_counter) et le temps CPU du thread
+(thread_time) : un écart important signale une attente (réseau, disque,
+API LLM), un temps CPU élevé un calcul (parsing, embedding).
+
+Export optionnel vers un fichier local, au choix (variable KOS_TELEMETRIE) :
+    prometheus : logs/telemetrie/kos_<composant>.prom (format texte d'exposition, cumulé)
+    otel       : logs/telemetrie/kos_traces.json     (OTLP/JSON, resourceSpans)
+
+ERGO_REGISTRY:
+    role         : Spans wall/CPU/octets/tokens par document et par etape + export Prometheus / OTLP JSON
+    version      : 1.1.0
+    auteur       : ERGO Capital / Adam
+    dependances  : (stdlib uniquement — contextvars, threading, time)
+    entrees      : appels span() / trace() des modules du pipeline
+    sorties      : iteration ITERATIONS_LOG (etapes), logs/telemetrie/*.prom | *.json
+    variable_env : KOS_TELEMETRIE (prometheus | otel | vide = désactivé)
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+TELEMETRIE_DIR = Path(__file__).parent / "logs" / "telemetrie"
+SERVICE        = "kos_compta"
+
+MESURES = ("octets", "tokens_input", "tokens_output")
+
+_trace_courante: ContextVar[Optional[dict]] = ContextVar("kos_trace", default=None)
+_span_courant:   ContextVar[Optional[dict]] = ContextVar("kos_span", default=None)
+_tampon: list[dict] = []
+_cumuls: dict[str, dict] = {}
+_verrou = threading.Lock()
+
+
+@contextmanager
+def trace(document: str, reprise: Optional[dict] = None) -> Iterator[dict]:
+    """Ouvre la trace d'un document : les spans imbriqués y sont rattachés.
+
+    Args:
+        document: Nom du document traité (ex: "facture_A102.md").
+        reprise:  Trace déjà ouverte à poursuivre (traitement en plusieurs phases,
+                  ex: audit groupé) ; ses spans sont complétés.
+
+    Yields:
+        Dictionnaire {document, trace_id, spans} complété à la sortie du bloc.
+    """
+    t = reprise if reprise is not None else {"document": document, "trace_id": secrets.token_hex(16), "spans": []}
+    jeton = _trace_courante.set(t)
+    try:
+        yield t
+    finally:
+        _trace_courante.reset(jeton)
+
+
+@contextmanager
+def span(etape: str, **attributs) -> Iterator[dict]:
+    """Chronomètre une étape (temps réel et CPU du thread).
+
+    Le dictionnaire produit peut être enrichi dans le bloc : octets,
+    tokens_input, tokens_output, ou tout attribut descriptif.
+
+    Args:
+        etape:      Nom de l'étape (ex: "lecture", "rag", "llm", "routage").
+        **attributs: Attributs descriptifs initiaux (modele, fichier…).
+
+    Yields:
+        Span mutable, enregistré à la sortie du bloc (même en cas d'exception).
+    """
+    t = _trace_courante.get()
+    parent = _span_courant.get()
+    s = {
+        "etape":     etape,
+        "document":  t["document"] if t else None,
+        "trace_id":  t["trace_id"] if t else None,
+        "span_id":   secrets.token_hex(8),
+        "parent_id": parent["span_id"] if parent else None,
+        **attributs,
+    }
+    jeton = _span_courant.set(s)
+    debut_ns, cpu_ns, t0 = time.time_ns(), time.thread_time_ns(), time.perf_counter_ns()
+    try:
+        yield s
+    except BaseException as exc:
+        s["erreur"] = type(exc).__name__
+        raise
+    finally:
+        duree_ns = time.perf_counter_ns() - t0
+        s["debut_ns"] = debut_ns
+        s["fin_ns"]   = debut_ns + duree_ns
+        s["wall_ms"]  = round(duree_ns / 1e6, 3)
+        s["cpu_ms"]   = round((time.thread_time_ns() - cpu_ns) / 1e6, 3)
+        _span_courant.reset(jeton)
+        if t is not None:
+            t["spans"].append(s)
+        with _verrou:
+            _tampon.append(s)
+
+
+def resumer(spans: list[dict], etapes: dict = None) -> dict:
+    """Agrège des spans par étape : somme wall/CPU, octets, tokens et nombre d'appels.
+
+    Args:
+        spans:  Spans bruts (d'un document ou d'une itération).
+        etapes: Agrégat existant à compléter (défaut : nouvel agrégat).
+
+    Returns:
+        {etape: {appels, wall_ms, cpu_ms, octets, tokens_input, tokens_output}}.
+    """
+    etapes = {} if etapes is None else etapes
+    for s in spans:
+        e = etapes.setdefault(s["etape"], {"appels": 0, "wall_ms": 0.0, "cpu_ms": 0.0})
+        e["appels"]  += 1
+        e["wall_ms"]  = round(e["wall_ms"] + s["wall_ms"], 3)
+        e["cpu_ms"]   = round(e["cpu_ms"] + s["cpu_ms"], 3)
+        for mesure in MESURES:
+            if s.get(mesure):
+                e[mesure] = e.get(mesure, 0) + s[mesure]
+    return etapes
+
+
+def vider() -> list[dict]:
+    """Retourne et efface les spans accumulés depuis le dernier appel (tous documents)."""
+    with _verrou:
+        spans = list(_tampon)
+        _tampon.clear()
+    return spans
+
+
+def _echapper(valeur) -> str:
+    """Échappe une valeur de label Prometheus."""
+    return str(valeur).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_prometheus(etapes: dict) -> str:
+    """Sérialise un agrégat par étape au format texte d'exposition Prometheus.
+
+    Args:
+        etapes: Agrégat produit par resumer().
+
+    Returns:
+        Texte des métriques kos_etape_* (une série par étape).
+    """
+    series = [
+        ("kos_etape_appels_total",         "counter", "Nombre d'exécutions de l'étape",  "appels", 1),
+        ("kos_etape_duree_secondes_total", "counter", "Temps réel cumulé de l'étape",    "wall_ms", 1e-3),
+        ("kos_etape_cpu_secondes_total",   "counter", "Temps CPU cumulé de l'étape",     "cpu_ms", 1e-3),
+        ("kos_etape_octets_total",         "counter", "Octets lus ou écrits par l'étape", "octets", 1),
+        ("kos_etape_tokens_input_total",   "counter", "Tokens LLM en entrée",             "tokens_input", 1),
+        ("kos_etape_tokens_output_total",  "counter", "Tokens LLM en sortie",             "tokens_output", 1),
+    ]
+    lignes: list[str] = []
+    for nom, type_, aide, cle, facteur in series:
+        valeurs = [(etape, e[cle]) for etape, e in sorted(etapes.items()) if cle in e]
+        if not valeurs:
+            continue
+        lignes += [f"# HELP {nom} {aide}", f"# TYPE {nom} {type_}"]
+        lignes += [f'{nom}{{service="{SERVICE}",etape="{_echapper(etape)}"}} {round(v * facteur, 6)}'
+                   for etape, v in valeurs]
+    return "\n".join(lignes) + "\n"
+
+
+def _attribut_otel(cle: str, valeur) -> dict:
+    """Convertit une paire clé/valeur en attribut OTLP/JSON typé."""
+    if isinstance(valeur, bool):
+        return {"key": cle, "value": {"boolValue": valeur}}
+    if isinstance(valeur, int):
+        return {"key": cle, "value": {"intValue": str(valeur)}}
+    if isinstance(valeur, float):
+        return {"key": cle, "value": {"doubleValue": valeur}}
+    return {"key": cle, "value": {"stringValue": str(valeur)}}
+
+
+def format_otel(spans: list[dict]) -> dict:
+    """Sérialise des spans au format OTLP/JSON (ExportTraceServiceRequest).
+
+    Les spans hors trace document reçoivent un trace_id commun à l'export.
+
+    Args:
+        spans: Spans bruts.
+
+    Returns:
+        Dictionnaire {"resourceSpans": [...]} importable par un collecteur OpenTelemetry.
+    """
+    trace_defaut = secrets.token_hex(16)
+    techniques = {"etape", "trace_id", "span_id", "parent_id", "debut_ns", "fin_ns"}
+    otel_spans = []
+    for s in spans:
+        entree = {
+            "traceId":           s.get("trace_id") or trace_defaut,
+            "spanId":            s["span_id"],
+            "name":              s["etape"],
+            "kind":              1,
+            "startTimeUnixNano": str(s["debut_ns"]),
+            "endTimeUnixNano":   str(s["fin_ns"]),
+            "attributes":        [_attribut_otel(f"kos.{k}", v) for k, v in s.items()
+                                  if k not in techniques and v is not None],
+            "status":            {"code": 2, "message": s["erreur"]} if s.get("erreur") else {"code": 1},
+        }
+        if s.get("parent_id"):
+            entree["parentSpanId"] = s["parent_id"]
+        otel_spans.append(entree)
+    return {
+        "resourceSpans": [{
+            "resource":   {"attributes": [_attribut_otel("service.name", SERVICE)]},
+            "scopeSpans": [{"scope": {"name": "kos_compta.instrumentation", "version": "1.0.0"},
+                            "spans": otel_spans}],
+        }]
+    }
+
+
+def exporter(spans: list[dict] = None, format_: str = None, composant: str = "pipeline") -> Optional[Path]:
+    """Écrit les spans dans un fichier local selon KOS_TELEMETRIE (ou format_).
+
+    Prometheus : compteurs cumulés depuis le démarrage du processus, fichier
+    remplacé atomiquement à chaque export (collecteur textfile de node_exporter).
+    OTLP/JSON : un objet ExportTraceServiceRequest par ligne, ajouté au fichier.
+
+    Args:
+        spans:     Spans à exporter (défaut : vider()).
+        format_:   "prometheus" | "otel" ; défaut : variable KOS_TELEMETRIE.
+        composant: Suffixe du fichier Prometheus (ex: "agent_compliance").
+
+    Returns:
+        Chemin écrit, ou None si l'export est désactivé ou sans span.
+    """
+    format_ = (format_ or os.environ.get("KOS_TELEMETRIE", "")).strip().lower()
+    spans = vider() if spans is None else spans
+    if format_ not in ("prometheus", "otel") or not spans:
+        return None
+    TELEMETRIE_DIR.mkdir(parents=True, exist_ok=True)
+    if format_ == "prometheus":
+        chemin = TELEMETRIE_DIR / f"kos_{composant}.prom"
+        with _verrou:
+            etapes = resumer(spans, _cumuls.setdefault(composant, {}))
+            texte = format_prometheus(etapes)
+        tmp = chemin.with_suffix(".prom.tmp")
+        tmp.write_text(texte, encoding="utf-8")
+        os.replace(tmp, chemin)
+    else:
+        chemin = TELEMETRIE_DIR / "kos_traces.json"
+        with open(chemin, "a", encoding="utf-8") as f:
+            f.write(json.dumps(format_otel(spans), ensure_ascii=False) + "\n")
+    return chemin
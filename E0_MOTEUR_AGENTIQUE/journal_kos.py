@@ -0,0 +1,341 @@
+# ERGO_ID: JOURNAL_KOS
+"""
+journal_kos.py
+==============
+ERGO KOS_COMPTA — Journal append-only (segments JSONL) pour les logs KOS
+
+Remplace le cycle « lire tout le tableau JSON → ajouter une entrée → réécrire
+le fichier » de ITERATIONS_LOG, SYSTEM_LOG et KOS_JOURNAL par un ajout d'une
+seule ligne JSON, d'un coût constant quelle que soit la taille de l'historique :
+
+    logs/journal/<NOM>/<NOM>.<numero>.<AAAAMMJJ>.jsonl   segments (1 entrée / ligne)
+    logs/journal/<NOM>/.etat.json                        segment courant + compteurs
+    logs/journal/<NOM>/.verrou                           verrou inter-processus
+
+Garanties :
+    - écriture d'une ligne complète en un seul write(), puis fsync
+    - verrou exclusif (fcntl.flock, msvcrt sous Windows) : jobs CI parallèles sûrs
+    - rotation à la date du jour ou au-delà de KOS_JOURNAL_SEGMENT_MO Mo
+    - migration automatique du tableau JSON historique dans le premier segment
+    - ligne tronquée (crash en cours d'écriture) ignorée à la lecture
+
+Les fichiers logs/<NOM>.json restent le format d'échange (artefacts CI,
+scripts de lecture) : ils sont régénérés à la demande par exporter().
+
+Usage :
+    python journal_kos.py --export                  # régénère les 3 tableaux JSON
+    python journal_kos.py --export SYSTEM_LOG
+    python journal_kos.py --list ITERATIONS_LOG --last 5
+
+ERGO_REGISTRY:
+    role         : Journal append-only JSONL (verrou, fsync, rotation, export JSON)
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : (stdlib uniquement — fcntl / msvcrt, json, os)
+    entrees      : logs/<NOM>.json (migration initiale)
+    sorties      : logs/journal/<NOM>/*.jsonl, logs/<NOM>.json (export)
+    variable_env : KOS_JOURNAL_SEGMENT_MO (défaut 16)
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:                      # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+LOGS_DIR     = Path(__file__).parent / "logs"
+JOURNAL_DIR  = LOGS_DIR / "journal"
+JOURNAUX     = ("ITERATIONS_LOG", "SYSTEM_LOG", "KOS_JOURNAL")
+
+TAILLE_SEGMENT_MAX = int(float(os.environ.get("KOS_JOURNAL_SEGMENT_MO", "16")) * 1024 * 1024)
+
+
+def _dossier(nom: str) -> Path:
+    """Dossier des segments d'un journal (logs/journal/<NOM>/)."""
+    return JOURNAL_DIR / nom
+
+
+def _nom_segment(nom: str, numero: int, jour: str) -> str:
+    """Nom d'un segment : <NOM>.<numero:05d>.<AAAAMMJJ>.jsonl (tri = ordre chronologique)."""
+    return f"{nom}.{numero:05d}.{jour}.jsonl"
+
+
+def segments(nom: str) -> list[Path]:
+    """Liste les segments d'un journal dans l'ordre d'écriture.
+
+    Args:
+        nom: Nom du journal (ex: "SYSTEM_LOG").
+
+    Returns:
+        Chemins des fichiers .jsonl, du plus ancien au plus récent.
+    """
+    dossier = _dossier(nom)
+    if not dossier.exists():
+        return []
+    return sorted(p for p in dossier.iterdir() if p.suffix == ".jsonl" and p.name.startswith(f"{nom}."))
+
+
+@contextmanager
+def _verrou(nom: str):
+    """Verrou exclusif inter-processus sur un journal (bloquant).
+
+    Args:
+        nom: Nom du journal.
+    """
+    dossier = _dossier(nom)
+    dossier.mkdir(parents=True, exist_ok=True)
+    with open(dossier / ".verrou", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _compter_lignes(chemin: Path, depuis: int = 0) -> int:
+    """Compte les lignes complètes d'un segment à partir d'un offset (lecture par blocs)."""
+    n = 0
+    with open(chemin, "rb") as f:
+        f.seek(depuis)
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            n += bloc.count(b"\n")
+    return n
+
+
+def _ecrire_etat(nom: str, etat: dict) -> None:
+    """Écrit .etat.json de façon atomique (fichier temporaire + os.replace)."""
+    chemin = _dossier(nom) / ".etat.json"
+    tmp = chemin.with_suffix(".tmp")
+    tmp.write_text(json.dumps(etat), encoding="utf-8")
+    os.replace(tmp, chemin)
+
+
+def _ecrire_ligne(chemin: Path, ligne: bytes) -> int:
+    """Ajoute une ligne en un seul write() puis fsync ; retourne la nouvelle taille.
+
+    Si le segment se termine par une ligne tronquée (crash précédent), un saut
+    de ligne est d'abord inséré pour que la nouvelle entrée reste lisible.
+    """
+    fd = os.open(chemin, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        taille = os.fstat(fd).st_size
+        if taille:
+            with open(chemin, "rb") as f:
+                f.seek(taille - 1)
+                if f.read(1) != b"\n":
+                    ligne = b"\n" + ligne
+        os.write(fd, ligne)
+        os.fsync(fd)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+
+def _migrer(nom: str, jour: str) -> dict:
+    """Importe le tableau JSON historique logs/<NOM>.json dans le premier segment.
+
+    Args:
+        nom:  Nom du journal.
+        jour: Date AAAAMMJJ du segment créé.
+
+    Returns:
+        État initial du journal.
+    """
+    segment = _dossier(nom) / _nom_segment(nom, 1, jour)
+    historique = LOGS_DIR / f"{nom}.json"
+    entrees: list = []
+    if historique.exists():
+        try:
+            entrees = json.loads(historique.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            print(f"[WARN] {historique.name} corrompu — journal démarré vide", file=sys.stderr)
+    with open(segment, "wb") as f:
+        for entree in entrees if isinstance(entrees, list) else []:
+            f.write(json.dumps(entree, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return {"segment": segment.name, "numero": 1, "jour": jour,
+            "taille": segment.stat().st_size, "entrees": len(entrees)}
+
+
+def _charger_etat(nom: str, jour: str) -> dict:
+    """Charge l'état du journal, en le reconstruisant ou en migrant si nécessaire.
+
+    L'état est resynchronisé avec le segment courant : les lignes écrites après
+    la dernière mise à jour de .etat.json (crash entre les deux écritures) sont
+    recomptées à partir de l'offset mémorisé, sans relire tout l'historique.
+    """
+    chemin = _dossier(nom) / ".etat.json"
+    etat = None
+    if chemin.exists():
+        try:
+            etat = json.loads(chemin.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            etat = None
+
+    existants = segments(nom)
+    if not existants:
+        return _migrer(nom, jour)
+
+    dernier = existants[-1]
+    if etat is None or etat.get("segment") != dernier.name:
+        numero, jour_segment = dernier.name.split(".")[1:3]
+        return {"segment": dernier.name, "numero": int(numero), "jour": jour_segment,
+                "taille": dernier.stat().st_size,
+                "entrees": sum(_compter_lignes(p) for p in existants)}
+
+    taille = dernier.stat().st_size
+    if taille > etat["taille"]:
+        etat["entrees"] += _compter_lignes(dernier, etat["taille"])
+        etat["taille"] = taille
+    return etat
+
+
+def ajouter(nom: str, entree: dict) -> dict:
+    """Ajoute une entrée à un journal (coût constant, sûr en accès concurrent).
+
+    Les identifiants séquentiels (ITER_XXXX, ERGO_XXXX) sont alloués par
+    l'appelant via sequence_kos, indépendamment du verrou du journal.
+
+    Args:
+        nom:    Nom du journal (ITERATIONS_LOG, SYSTEM_LOG, KOS_JOURNAL).
+        entree: Entrée à écrire.
+
+    Returns:
+        L'entrée écrite.
+    """
+    jour = datetime.now().strftime("%Y%m%d")
+    with _verrou(nom):
+        etat = _charger_etat(nom, jour)
+        if etat["jour"] != jour or etat["taille"] >= TAILLE_SEGMENT_MAX:
+            etat["numero"] += 1
+            etat["jour"] = jour
+            etat["segment"] = _nom_segment(nom, etat["numero"], jour)
+            etat["taille"] = 0
+
+        ligne = json.dumps(entree, ensure_ascii=False).encode("utf-8") + b"\n"
+        etat["taille"] = _ecrire_ligne(_dossier(nom) / etat["segment"], ligne)
+        etat["entrees"] += 1
+        _ecrire_etat(nom, etat)
+    return entree
+
+
+def lire(nom: str) -> Iterator[dict]:
+    """Parcourt toutes les entrées d'un journal en flux, de la plus ancienne à la plus récente.
+
+    Les lignes illisibles (écriture interrompue) sont ignorées. Un journal
+    jamais écrit est migré depuis son tableau JSON historique.
+
+    Args:
+        nom: Nom du journal.
+
+    Yields:
+        Entrées du journal.
+    """
+    if not segments(nom):
+        with _verrou(nom):
+            _charger_etat(nom, datetime.now().strftime("%Y%m%d"))
+    for segment in segments(nom):
+        with open(segment, "rb") as f:
+            for ligne in f:
+                if not ligne.strip():
+                    continue
+                try:
+                    yield json.loads(ligne)
+                except json.JSONDecodeError:
+                    continue
+
+
+def dernieres(nom: str, n: int) -> list[dict]:
+    """Retourne les n dernières entrées d'un journal.
+
+    Args:
+        nom: Nom du journal.
+        n:   Nombre d'entrées souhaitées.
+
+    Returns:
+        Entrées dans l'ordre chronologique.
+    """
+    return list(deque(lire(nom), maxlen=n))
+
+
+def compter(nom: str) -> int:
+    """Nombre d'entrées d'un journal, lu depuis son état (sans parcourir les segments)."""
+    with _verrou(nom):
+        return _charger_etat(nom, datetime.now().strftime("%Y%m%d"))["entrees"]
+
+
+def exporter(nom: str, destination: Path = None) -> Path:
+    """Régénère le tableau JSON compatible (logs/<NOM>.json, indent=2) depuis le journal.
+
+    L'écriture se fait en flux dans un fichier temporaire remplacé atomiquement :
+    un lecteur ne voit jamais un tableau partiel.
+
+    Args:
+        nom:         Nom du journal.
+        destination: Fichier cible (défaut : logs/<NOM>.json).
+
+    Returns:
+        Chemin du fichier exporté.
+    """
+    destination = destination or LOGS_DIR / f"{nom}.json"
+    tmp = destination.with_suffix(".json.tmp")
+    n = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[")
+        for entree in lire(nom):
+            bloc = json.dumps(entree, ensure_ascii=False, indent=2)
+            f.write(("," if n else "") + "\n  " + bloc.replace("\n", "\n  "))
+            n += 1
+        f.write("\n]" if n else "]")
+    os.replace(tmp, destination)
+    return destination
+
+
+def main() -> None:
+    """Point d'entrée CLI : export des tableaux JSON et consultation des journaux."""
+    parser = argparse.ArgumentParser(
+        description="ERGO KOS_COMPTA — Journal append-only JSONL (export / consultation)"
+    )
+    parser.add_argument("--export", nargs="*", metavar="NOM",
+                        help=f"Régénérer logs/<NOM>.json (défaut : {', '.join(JOURNAUX)})")
+    parser.add_argument("--list", metavar="NOM", choices=JOURNAUX, help="Afficher les dernières entrées")
+    parser.add_argument("--last", type=int, default=10, help="Nombre d'entrées avec --list")
+    args = parser.parse_args()
+
+    if args.export is not None:
+        for nom in args.export or JOURNAUX:
+            sortie = exporter(nom)
+            print(f"[EXPORT] {nom} → {sortie.name} ({compter(nom)} entrées)")
+    elif args.list:
+        for entree in dernieres(args.list, args.last):
+            print(json.dumps(entree, ensure_ascii=False))
+    else:
+        parser.print_help()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# ERGO_ID: LEDGER_AUDIT
+"""
+ledger_audit.py
+===============
+ERGO KOS_COMPTA — Registre SQLite des audits (verdicts, fournisseurs, dates)
+
+Base embarquée (SQLite, mode WAL) alimentée à chaque audit par
+`agent_compliance.router_verdict()` (une ligne par document) puis complétée
+par `log_iteration()` (rattachement à l'itération ITER_XXXX). Les colonnes
+interrogées en analyse sont indexées : les questions du type « combien de
+REJET pour le fournisseur X ce trimestre » ou l'alerte TAUX_REJET_ELEVE
+(KOS_COMPTA_Client_Log.json) deviennent des requêtes indexées, sans
+recharger ITERATIONS_LOG ni les rapports E4.1.
+
+Montants stockés en centimes entiers (sommes SQL exactes).
+
+Usage :
+    python ledger_audit.py --import                       # reprise ITERATIONS_LOG + E4.1
+    python ledger_audit.py --stats --par verdict --trimestre 2026-T1
+    python ledger_audit.py --stats --par mois --fournisseur "Maison Champagne Dupont"
+    python ledger_audit.py --stats --par article --verdict REJET
+    python ledger_audit.py --taux-rejet --mois 2026-03
+
+ERGO_REGISTRY:
+    role         : Registre SQLite (WAL) des audits + CLI d'analyse (verdicts, fournisseurs, dates)
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib), lignes_facture.py, journal_kos.py
+    entrees      : verdicts agent_compliance, journal ITERATIONS_LOG, E4.1_Rapports_Conformite/*.json
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/AUDIT_LEDGER.sqlite3
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional
+
+from lignes_facture import CENTIME, parser_montant
+import journal_kos
+
+
+BASE_DIR    = Path(__file__).parent.parent
+E4_RAPPORTS = BASE_DIR / "E4_AUDIT_ET_ROUTAGE" / "E4.1_Rapports_Conformite"
+LEDGER_DB   = Path(__file__).parent / "logs" / "AUDIT_LEDGER.sqlite3"
+
+SEUIL_TAUX_REJET = 0.30     # ALERTES_METIER.TAUX_REJET_ELEVE (KOS_COMPTA_Client_Log.json)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audits (
+    id                   INTEGER PRIMARY KEY,
+    iteration_id         TEXT,
+    pipeline_id          TEXT,
+    document             TEXT NOT NULL,
+    type                 TEXT,
+    verdict              TEXT NOT NULL,
+    niveau_risque        TEXT,
+    action_erp           TEXT,
+    fournisseur          TEXT,
+    numero_facture       TEXT,
+    date_facture         TEXT,
+    montant_ht_centimes  INTEGER,
+    montant_tva_centimes INTEGER,
+    montant_ttc_centimes INTEGER,
+    articles             TEXT,
+    motif                TEXT,
+    llm                  TEXT,
+    tokens_input         INTEGER DEFAULT 0,
+    tokens_output        INTEGER DEFAULT 0,
+    cout_eur             REAL    DEFAULT 0,
+    date_audit           TEXT NOT NULL,
+    fichier_sorti        TEXT,
+    UNIQUE (iteration_id, document)
+);
+CREATE TABLE IF NOT EXISTS audit_articles (
+    audit_id INTEGER NOT NULL REFERENCES audits(id) ON DELETE CASCADE,
+    article  TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audits_verdict     ON audits (verdict, date_audit);
+CREATE INDEX IF NOT EXISTS idx_audits_fournisseur ON audits (fournisseur, date_audit);
+CREATE INDEX IF NOT EXISTS idx_audits_date        ON audits (date_audit);
+CREATE INDEX IF NOT EXISTS idx_audits_type        ON audits (type, date_audit);
+CREATE INDEX IF NOT EXISTS idx_audits_risque      ON audits (niveau_risque);
+CREATE INDEX IF NOT EXISTS idx_audits_document    ON audits (document);
+CREATE INDEX IF NOT EXISTS idx_audits_iteration   ON audits (iteration_id);
+CREATE INDEX IF NOT EXISTS idx_articles_article   ON audit_articles (article);
+CREATE INDEX IF NOT EXISTS idx_articles_audit     ON audit_articles (audit_id);
+"""
+
+REGROUPEMENTS = {
+    "verdict":     "a.verdict",
+    "fournisseur": "a.fournisseur",
+    "type":        "a.type",
+    "risque":      "a.niveau_risque",
+    "mois":        "substr(a.date_audit, 1, 7)",
+    "jour":        "substr(a.date_audit, 1, 10)",
+    "article":     "aa.article",
+}
+
+
+def connecter(chemin: Path = None) -> sqlite3.Connection:
+    """Ouvre le registre (création du schéma au premier accès), en mode WAL.
+
+    Args:
+        chemin: Fichier SQLite (défaut : LEDGER_DB).
+
+    Returns:
+        Connexion sqlite3 (lignes accessibles par nom de colonne).
+    """
+    chemin = chemin or LEDGER_DB
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(chemin, timeout=30)
+    cnx.row_factory = sqlite3.Row
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("PRAGMA synchronous=NORMAL")
+    cnx.execute("PRAGMA foreign_keys=ON")
+    cnx.executescript(SCHEMA)
+    return cnx
+
+
+def _centimes(valeur) -> Optional[int]:
+    """Convertit un montant (str FR/EN, float, Decimal) en centimes entiers."""
+    montant = parser_montant(valeur)
+    if montant is None:
+        return None
+    return int((montant / CENTIME).to_integral_value())
+
+
+def _normaliser_date_audit(valeur: str) -> str:
+    """Ramène un horodatage ('20260318_183739' ou ISO) au format ISO 8601."""
+    try:
+        return datetime.strptime(valeur, "%Y%m%d_%H%M%S").isoformat()
+    except (TypeError, ValueError):
+        return valeur or datetime.now().isoformat()
+
+
+def _ligne_audit(
+    document: str,
+    fm: dict,
+    verdict: dict,
+    date_audit: str,
+    fichier_sorti: Optional[str],
+) -> dict:
+    """Projette un document et son verdict sur les colonnes de la table audits.
+
+    Les montants viennent du frontmatter (totaux imprimés / Factur-X), à défaut
+    de l'imputation recommandée par le LLM.
+    """
+    meta = verdict.get("_meta", {})
+    imp  = verdict.get("imputation_recommandee") or {}
+    return {
+        "document":             document,
+        "type":                 fm.get("type"),
+        "verdict":              verdict.get("verdict", "ERREUR"),
+        "niveau_risque":        verdict.get("niveau_risque"),
+        "action_erp":           verdict.get("action_erp"),
+        "fournisseur":          str(fm["fournisseur"]) if fm.get("fournisseur") else None,
+        "numero_facture":       str(fm.get("numero_facture") or fm.get("numero") or fm.get("id") or "") or None,
+        "date_facture":         str(fm.get("date_facture") or fm.get("date") or "") or None,
+        "montant_ht_centimes":  _centimes(fm.get("montant_ht", imp.get("montant_ht"))),
+        "montant_tva_centimes": _centimes(fm.get("montant_tva", imp.get("tva_deductible"))),
+        "montant_ttc_centimes": _centimes(fm.get("montant_ttc", imp.get("montant_ttc"))),
+        "articles":             json.dumps(verdict.get("articles_appliques", []), ensure_ascii=False),
+        "motif":                verdict.get("motif"),
+        "llm":                  meta.get("llm"),
+        "tokens_input":         meta.get("input_tokens", 0),
+        "tokens_output":        meta.get("output_tokens", 0),
+        "cout_eur":             meta.get("cout_estime_eur", 0.0),
+        "date_audit":           date_audit,
+        "fichier_sorti":        fichier_sorti,
+    }
+
+
+def _inserer(cnx: sqlite3.Connection, ligne: dict, ignorer_doublon: bool = False) -> Optional[int]:
+    """Insère une ligne d'audit et ses articles ; retourne l'id (None si ignorée)."""
+    colonnes = ", ".join(ligne)
+    marqueurs = ", ".join(f":{c}" for c in ligne)
+    verbe = "INSERT OR IGNORE" if ignorer_doublon else "INSERT"
+    cur = cnx.execute(f"{verbe} INTO audits ({colonnes}) VALUES ({marqueurs})", ligne)
+    if not cur.rowcount:
+        return None
+    cnx.executemany(
+        "INSERT INTO audit_articles (audit_id, article) VALUES (?, ?)",
+        [(cur.lastrowid, a) for a in json.loads(ligne["articles"])],
+    )
+    return cur.lastrowid
+
+
+def enregistrer_verdict(facture: dict, verdict: dict, fichier_sorti: Optional[str] = None) -> int:
+    """Enregistre le verdict d'un document audité (appelé par router_verdict).
+
+    La ligne reste sans iteration_id jusqu'à rattacher_iteration().
+
+    Args:
+        facture:       Dictionnaire produit par agent_compliance.lire_facture().
+        verdict:       Verdict complet (avec _meta).
+        fichier_sorti: Rapport E4.1 ou payload E4.2 produit, le cas échéant.
+
+    Returns:
+        Identifiant de la ligne créée.
+    """
+    ligne = _ligne_audit(
+        facture["fichier"], facture.get("frontmatter", {}), verdict,
+        datetime.now().isoformat(), fichier_sorti,
+    )
+    with closing(connecter()) as cnx, cnx:
+        return _inserer(cnx, ligne)
+
+
+def rattacher_iteration(iteration_id: str, pipeline_id: str, documents_resultats: list[dict]) -> None:
+    """Rattache les audits du run à leur itération (appelé par log_iteration).
+
+    Les documents qui ne sont pas passés par router_verdict (doublons écartés
+    avant l'appel LLM) sont insérés à cette étape.
+
+    Args:
+        iteration_id:        Identifiant ITER_XXXX attribué par le journal.
+        pipeline_id:         Identifiant CI/CD ou "local".
+        documents_resultats: Résultats {'facture', 'verdict', 'fichier_sorti'} du run.
+    """
+    with closing(connecter()) as cnx, cnx:
+        for item in documents_resultats:
+            document = item["facture"]["fichier"]
+            cur = cnx.execute(
+                "UPDATE audits SET iteration_id = ?, pipeline_id = ? WHERE id = ("
+                " SELECT id FROM audits WHERE document = ? AND iteration_id IS NULL"
+                " ORDER BY id DESC LIMIT 1)",
+                (iteration_id, pipeline_id, document),
+            )
+            if not cur.rowcount:
+                ligne = _ligne_audit(
+                    document, item["facture"].get("frontmatter", {}), item["verdict"],
+                    datetime.now().isoformat(), item.get("fichier_sorti"),
+                )
+                _inserer(cnx, {"iteration_id": iteration_id, "pipeline_id": pipeline_id, **ligne}, True)
+
+
+def importer_historique() -> int:
+    """Reprend l'historique : journal ITERATIONS_LOG enrichi des rapports E4.1.
+
+    Idempotent (contrainte UNIQUE iteration_id + document). Les montants et le
+    fournisseur ne sont pas journalisés par itération : ils sont lus, quand il
+    existe, dans le rapport E4.1 référencé par fichier_sorti.
+
+    Returns:
+        Nombre de lignes ajoutées.
+    """
+    ajoutees = 0
+    with closing(connecter()) as cnx, cnx:
+        for iteration in journal_kos.lire("ITERATIONS_LOG"):
+            for doc in iteration.get("documents", []):
+                verdict = {
+                    "verdict":            doc.get("verdict", "ERREUR"),
+                    "niveau_risque":      doc.get("niveau_risque") or None,
+                    "action_erp":         doc.get("action_erp") or None,
+                    "motif":              doc.get("motif"),
+                    "articles_appliques": doc.get("articles_appliques", []),
+                    "_meta": {
+                        "llm":             doc.get("llm"),
+                        "input_tokens":    doc.get("tokens_input", 0),
+                        "output_tokens":   doc.get("tokens_output", 0),
+                        "cout_estime_eur": doc.get("cout_eur", 0.0),
+                    },
+                }
+                date_audit = iteration.get("timestamp_end") or iteration.get("timestamp_start")
+                rapport = E4_RAPPORTS / (doc.get("fichier_sorti") or "")
+                if rapport.is_file():
+                    contenu = json.loads(rapport.read_text(encoding="utf-8"))
+                    verdict = {**contenu.get("verdict", {}), **{k: v for k, v in verdict.items() if v}}
+                    date_audit = _normaliser_date_audit(contenu.get("date_audit")) or date_audit
+                ligne = _ligne_audit(
+                    doc["fichier"], {"type": doc.get("type")}, verdict, date_audit, doc.get("fichier_sorti"),
+                )
+                ligne = {"iteration_id": iteration.get("iteration_id"),
+                         "pipeline_id": iteration.get("pipeline_id"), **ligne}
+                if _inserer(cnx, ligne, ignorer_doublon=True):
+                    ajoutees += 1
+    return ajoutees
+
+
+def _periode(args) -> tuple[Optional[str], Optional[str]]:
+    """Convertit --mois / --trimestre / --depuis / --jusqu en bornes ISO [début, fin[."""
+    if args.mois:
+        annee, mois = map(int, args.mois.split("-"))
+        fin = f"{annee + mois // 12:04d}-{mois % 12 + 1:02d}"
+        return args.mois, fin
+    if args.trimestre:
+        annee, t = args.trimestre.upper().split("-T")
+        debut = (int(t) - 1) * 3 + 1
+        fin = f"{int(annee) + 1}-01" if int(t) == 4 else f"{annee}-{debut + 3:02d}"
+        return f"{annee}-{debut:02d}", fin
+    return args.depuis, args.jusqu
+
+
+def _filtres(args) -> tuple[str, list]:
+    """Construit la clause WHERE (colonnes indexées) à partir des options CLI."""
+    clauses, params = [], []
+    debut, fin = _periode(args)
+    if debut:
+        clauses.append("a.date_audit >= ?")
+        params.append(debut)
+    if fin:
+        clauses.append("a.date_audit < ?")
+        params.append(fin)
+    for option, colonne in (("verdict", "verdict"), ("fournisseur", "fournisseur"),
+                            ("type", "type"), ("risque", "niveau_risque")):
+        valeur = getattr(args, option)
+        if valeur:
+            clauses.append(f"a.{colonne} = ?")
+            params.append(valeur)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def statistiques(args) -> list[sqlite3.Row]:
+    """Agrège nombre de documents, montants TTC et coût LLM par critère de regroupement.
+
+    Args:
+        args: Options CLI (--par, filtres de période, verdict, fournisseur, type, risque).
+
+    Returns:
+        Lignes (cle, documents, ttc_centimes, cout_eur) triées par nombre décroissant.
+    """
+    cle = REGROUPEMENTS[args.par]
+    jointure = " JOIN audit_articles aa ON aa.audit_id = a.id" if args.par == "article" else ""
+    where, params = _filtres(args)
+    sql = (
+        f"SELECT {cle} AS cle, COUNT(*) AS documents,"
+        f" SUM(a.montant_ttc_centimes) AS ttc_centimes, ROUND(SUM(a.cout_eur), 5) AS cout_eur"
+        f" FROM audits a{jointure}{where} GROUP BY cle ORDER BY documents DESC, cle"
+    )
+    with closing(connecter()) as cnx:
+        return cnx.execute(sql, params).fetchall()
+
+
+def taux_rejet(args) -> dict:
+    """Calcule le taux de REJET sur la période et l'alerte TAUX_REJET_ELEVE (> 30 %).
+
+    Les DOUBLON écartés avant audit ne comptent pas comme documents audités.
+
+    Args:
+        args: Options CLI (période et filtres).
+
+    Returns:
+        Dictionnaire {documents, rejets, taux, alerte}.
+    """
+    where, params = _filtres(args)
+    where += (" AND " if where else " WHERE ") + "a.verdict != 'DOUBLON'"
+    with closing(connecter()) as cnx:
+        ligne = cnx.execute(
+            f"SELECT COUNT(*) AS documents, SUM(a.verdict = 'REJET') AS rejets FROM audits a{where}",
+            params,
+        ).fetchone()
+    documents, rejets = ligne["documents"], ligne["rejets"] or 0
+    taux = rejets / documents if documents else 0.0
+    return {
+        "documents": documents,
+        "rejets":    rejets,
+        "taux":      round(taux, 4),
+        "alerte":    "TAUX_REJET_ELEVE" if taux > SEUIL_TAUX_REJET else None,
+    }
+
+
+def _euros(centimes: Optional[int]) -> str:
+    """Formate un total en centimes pour l'affichage CLI."""
+    return "—" if centimes is None else f"{Decimal(centimes) * CENTIME:,.2f} €".replace(",", " ")
+
+
+def main() -> None:
+    """Point d'entrée CLI : reprise d'historique et requêtes d'analyse."""
+    parser = argparse.ArgumentParser(
+        description="ERGO KOS_COMPTA — Registre SQLite des audits (analyse verdicts / fournisseurs / dates)"
+    )
+    parser.add_argument("--import", dest="importer", action="store_true",
+                        help="Reprendre ITERATIONS_LOG + rapports E4.1 (idempotent)")
+    parser.add_argument("--stats", action="store_true", help="Agrégats par --par")
+    parser.add_argument("--par", choices=sorted(REGROUPEMENTS), default="verdict")
+    parser.add_argument("--taux-rejet", action="store_true", help="Taux de REJET + alerte TAUX_REJET_ELEVE")
+    parser.add_argument("--mois", help="Période AAAA-MM")
+    parser.add_argument("--trimestre", help="Période AAAA-T1..T4")
+    parser.add_argument("--depuis", help="Date ISO de début (incluse)")
+    parser.add_argument("--jusqu", help="Date ISO de fin (exclue)")
+    parser.add_argument("--verdict")
+    parser.add_argument("--fournisseur")
+    parser.add_argument("--type")
+    parser.add_argument("--risque")
+    parser.add_argument("--json", action="store_true", help="Sortie JSON")
+    args = parser.parse_args()
+
+    if args.importer:
+        print(f"[IMPORT] {importer_historique()} audit(s) repris dans {LEDGER_DB.name}")
+    if args.stats:
+        lignes = statistiques(args)
+        if args.json:
+            print(json.dumps([dict(l) for l in lignes], ensure_ascii=False, indent=2))
+        else:
+            for l in lignes:
+                print(f"  {str(l['cle']):40} {l['documents']:6}  {_euros(l['ttc_centimes']):>16}  {l['cout_eur'] or 0:.5f} EUR")
+    if args.taux_rejet:
+        resultat = taux_rejet(args)
+        if args.json:
+            print(json.dumps(resultat, ensure_ascii=False))
+        else:
+            print(f"  REJET {resultat['rejets']}/{resultat['documents']} = {resultat['taux']:.1%}"
+                  + (f"  ⚠ {resultat['alerte']}" if resultat["alerte"] else ""))
+    if not (args.importer or args.stats or args.taux_rejet):
+        parser.print_help()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
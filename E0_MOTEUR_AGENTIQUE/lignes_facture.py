@@ -0,0 +1,423 @@
+# ERGO_ID: LIGNES_FACTURE
+"""
+lignes_facture.py
+=================
+ERGO KOS_COMPTA — Lignes facture typées (Decimal)
+
+Transforme les tableaux bruts extraits par l'ETL (pdfplumber) en lignes de
+facture typées — désignation, quantité, PU HT/TTC, taux TVA, totaux — calculées
+en Decimal, et fournit les contrôles déterministes exécutés avant l'appel LLM :
+    - cohérence HT + TVA = TTC (en-tête et somme des lignes)
+    - seuil cadeaux d'entreprise 73 € TTC par bénéficiaire (CGI Art. 236)
+
+Les lignes sont sérialisées dans le frontmatter du Markdown déposé en E3.1
+(clé `lignes_facture`, montants en chaînes pour conserver la précision).
+
+ERGO_REGISTRY:
+    role         : Lignes facture typees (Decimal) + controles deterministes pre-LLM
+    version      : 1.0.2
+    auteur       : ERGO Capital / Adam
+    dependances  : (stdlib uniquement — decimal, re, unicodedata)
+    entrees      : tables brutes pdf_extractor, frontmatter E3.1
+    sorties      : frontmatter lignes_facture / montant_ht / montant_tva / montant_ttc
+"""
+
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Optional
+
+
+CENTIME            = Decimal("0.01")
+TOLERANCE_CENTIMES = Decimal("0.01")
+SEUIL_CADEAU_TTC   = Decimal("73.00")
+TAUX_TVA_LEGAUX    = {Decimal(t) for t in ("0", "0.9", "1.05", "1.75", "2.1", "5.5", "8.5", "10", "13", "20")}
+
+CHAMPS_LIGNE = [
+    "designation", "quantite", "pu_ht", "pu_ttc",
+    "taux_tva", "total_ht", "montant_tva", "total_ttc",
+]
+
+_MOTS_DESIGNATION = ("designation", "description", "libelle", "article", "produit", "prestation")
+_MOTS_QUANTITE    = ("qte", "quantite", "qty", "nb")
+
+
+def _normaliser_entete(texte: str) -> str:
+    """Normalise un libellé de colonne : minuscules, sans accents ni ponctuation.
+
+    Args:
+        texte: Libellé brut de la cellule d'en-tête.
+
+    Returns:
+        Libellé normalisé (ex: "P.U. TTC" → "p u ttc").
+    """
+    texte = unicodedata.normalize("NFKD", str(texte or "")).encode("ascii", "ignore").decode()
+    texte = re.sub(r"[^a-z0-9%]+", " ", texte.lower())
+    return texte.strip()
+
+
+def identifier_colonne(entete: str) -> Optional[str]:
+    """Associe un en-tête de tableau à un champ canonique de CHAMPS_LIGNE.
+
+    Args:
+        entete: Libellé brut de la cellule d'en-tête.
+
+    Returns:
+        Nom du champ canonique, ou None si la colonne n'est pas reconnue.
+    """
+    n = _normaliser_entete(entete)
+    mots = n.split()
+    if not n:
+        return None
+    if any(m in n for m in _MOTS_DESIGNATION):
+        return "designation"
+    if mots[0] in _MOTS_QUANTITE:
+        return "quantite"
+    if "pu" in mots or "unitaire" in n:
+        return "pu_ttc" if "ttc" in mots else "pu_ht"
+    if "taux" in mots or "%" in n:
+        return "taux_tva"
+    if "total" in mots or "montant" in mots:
+        if "ttc" in mots:
+            return "total_ttc"
+        if "tva" in mots:
+            return "montant_tva"
+        return "total_ht"
+    if n == "tva":
+        return "montant_tva"                        # taux si les cellules le confirment (extraire_lignes)
+    if "prix" in mots:
+        return "pu_ttc" if "ttc" in mots else "pu_ht"
+    return None
+
+
+def _colonne_taux(table: list, rang: int, colonnes: list) -> bool:
+    """Indique si une colonne « TVA » porte des taux plutôt que des montants.
+
+    Taux si une cellule contient "%". Sinon, toutes les valeurs doivent être
+    des taux légaux (TAUX_TVA_LEGAUX) et les lignes doivent le confirmer :
+    HT × (1 + taux) = TTC là où HT et TTC sont connus, et, sans TTC, une
+    lecture en montant qui ne donne aucun taux légal. Un cas indécidable
+    (aucune ligne ne départage) est lu en montants.
+
+    Args:
+        table:    Tableau brut (première ligne = en-tête).
+        rang:     Index de la colonne « TVA ».
+        colonnes: Champs canoniques des colonnes (identifier_colonne).
+
+    Returns:
+        True pour une colonne de taux, False pour une colonne de montants.
+    """
+    lignes = [row for row in table[1:] if rang < len(row)]
+    if any("%" in str(row[rang] or "") for row in lignes):
+        return True
+    valeurs = [parser_montant(row[rang]) for row in lignes]
+    if not any(v is not None for v in valeurs) or any(v not in TAUX_TVA_LEGAUX for v in valeurs if v is not None):
+        return False
+
+    def cellule(row: list, champ: str) -> Optional[Decimal]:
+        i = colonnes.index(champ) if champ in colonnes else None
+        return parser_montant(row[i]) if i is not None and i < len(row) else None
+
+    def proche(a: Decimal, b: Decimal) -> bool:
+        return abs(a - b) <= TOLERANCE_CENTIMES
+
+    indices_taux = 0
+    for row, v in zip(lignes, valeurs):
+        qte = cellule(row, "quantite")
+        qte = Decimal("1") if qte is None else qte
+        ht, ttc = cellule(row, "total_ht"), cellule(row, "total_ttc")
+        if ht is None and cellule(row, "pu_ht") is not None:
+            ht = cellule(row, "pu_ht") * qte
+        if ttc is None and cellule(row, "pu_ttc") is not None:
+            ttc = cellule(row, "pu_ttc") * qte
+        if v is None or not ht:
+            continue
+        if ttc is not None:
+            if not proche(ht * (1 + v / 100), ttc):
+                return False                           # HT × taux ≠ TTC : colonne de montants
+            lecture_montant = proche(ht + v, ttc)
+        else:
+            lecture_montant = any(proche(ht * t / 100, v) for t in TAUX_TVA_LEGAUX)
+        indices_taux += not lecture_montant
+    return indices_taux > 0
+
+
+def parser_montant(valeur) -> Optional[Decimal]:
+    """Convertit un montant texte au format français ou anglais en Decimal.
+
+    Gère les symboles monétaires, les espaces insécables et les séparateurs
+    de milliers ("1 234,56 €", "1.234,56", "1,234.56", "120.00 €").
+
+    Args:
+        valeur: Montant brut (str, int, float, Decimal ou None).
+
+    Returns:
+        Montant en Decimal, ou None si la valeur n'est pas un nombre.
+    """
+    if valeur is None:
+        return None
+    if isinstance(valeur, Decimal):
+        return valeur
+    if isinstance(valeur, (int, float)):
+        return Decimal(str(valeur))
+    texte = re.sub(r"[€$£%\s]|EUR|eur", "", str(valeur))
+    if not texte or not re.search(r"\d", texte):
+        return None
+    if "," in texte and "." in texte:
+        if texte.rfind(",") > texte.rfind("."):
+            texte = texte.replace(".", "").replace(",", ".")
+        else:
+            texte = texte.replace(",", "")
+    elif "," in texte:
+        texte = texte.replace(",", ".")
+    elif texte.count(".") > 1:
+        texte = texte.replace(".", "")
+    try:
+        return Decimal(texte)
+    except InvalidOperation:
+        return None
+
+
+def parser_taux_tva(valeur) -> Optional[Decimal]:
+    """Convertit un taux de TVA ("20 %", "5,5", "0.2") en pourcentage Decimal.
+
+    Args:
+        valeur: Taux brut.
+
+    Returns:
+        Taux en pourcentage (ex: Decimal("20")), ou None si illisible.
+    """
+    taux = parser_montant(valeur)
+    if taux is None:
+        return None
+    if Decimal("0") < taux < Decimal("1"):
+        taux = taux * 100
+    return _normaliser_taux(taux)
+
+
+def _normaliser_taux(taux: Decimal) -> Decimal:
+    """Supprime les zéros non significatifs d'un taux sans notation exponentielle."""
+    return taux.quantize(Decimal("1")) if taux == taux.to_integral_value() else taux.normalize()
+
+
+def arrondir(montant: Optional[Decimal]) -> Optional[Decimal]:
+    """Arrondit un montant au centime (arrondi commercial ROUND_HALF_UP).
+
+    Args:
+        montant: Montant Decimal ou None.
+
+    Returns:
+        Montant quantifié à 0.01, ou None.
+    """
+    return montant.quantize(CENTIME, rounding=ROUND_HALF_UP) if montant is not None else None
+
+
+def completer_ligne(ligne: dict) -> dict:
+    """Déduit les montants manquants d'une ligne à partir des montants présents.
+
+    Ordre de déduction : totaux depuis quantité × PU, puis HT ↔ TTC via le taux
+    de TVA, puis PU depuis les totaux. Les montants calculés sont arrondis au centime.
+
+    Args:
+        ligne: Ligne partielle (valeurs Decimal ou None par champ canonique).
+
+    Returns:
+        La ligne complétée (même objet).
+    """
+    qte  = ligne.get("quantite")
+    if qte is None:
+        qte = Decimal("1")
+    taux = ligne.get("taux_tva")
+    ligne["quantite"] = qte
+
+    if ligne.get("total_ht") is None and ligne.get("pu_ht") is not None:
+        ligne["total_ht"] = arrondir(ligne["pu_ht"] * qte)
+    if ligne.get("total_ttc") is None and ligne.get("pu_ttc") is not None:
+        ligne["total_ttc"] = arrondir(ligne["pu_ttc"] * qte)
+
+    ht, ttc, tva = ligne.get("total_ht"), ligne.get("total_ttc"), ligne.get("montant_tva")
+    if taux is not None:
+        coef = 1 + taux / 100
+        if ht is None and ttc is not None:
+            ht = arrondir(ttc / coef)
+        if ttc is None and ht is not None:
+            ttc = arrondir(ht * coef)
+        if tva is None and ht is not None:
+            tva = arrondir(ht * taux / 100)
+    if tva is None and ht is not None and ttc is not None:
+        tva = ttc - ht
+    if ttc is None and ht is not None and tva is not None:
+        ttc = ht + tva
+    if ht is None and ttc is not None and tva is not None:
+        ht = ttc - tva
+    if taux is None and ht and tva is not None:
+        taux = _normaliser_taux(arrondir(tva * 100 / ht))
+
+    ligne.update({"total_ht": ht, "total_ttc": ttc, "montant_tva": tva, "taux_tva": taux})
+    if ligne.get("pu_ht") is None and ht is not None and qte:
+        ligne["pu_ht"] = arrondir(ht / qte)
+    if ligne.get("pu_ttc") is None and ttc is not None and qte:
+        ligne["pu_ttc"] = arrondir(ttc / qte)
+    return ligne
+
+
+def extraire_lignes(tables: list) -> list[dict]:
+    """Transforme les tableaux bruts pdfplumber en lignes de facture typées.
+
+    Seuls les tableaux dont l'en-tête contient une colonne désignation et au
+    moins une colonne montant sont retenus. Une colonne intitulée seulement
+    « TVA » est lue comme montant de TVA, sauf si ses cellules sont des taux
+    confirmés par les montants des lignes (_colonne_taux). Les lignes de
+    total/sous-total du tableau sont ignorées (elles sont recalculées par
+    totaliser()).
+
+    Args:
+        tables: Liste de tableaux (liste de lignes, première ligne = en-tête).
+
+    Returns:
+        Liste de lignes complétées, chaque champ de CHAMPS_LIGNE en Decimal
+        (str pour 'designation'), None si indéterminable.
+    """
+    lignes: list[dict] = []
+    for table in tables:
+        if not table or not table[0]:
+            continue
+        colonnes = [identifier_colonne(c) for c in table[0]]
+        for i, entete in enumerate(table[0]):
+            if _normaliser_entete(entete) == "tva" and _colonne_taux(table, i, colonnes):
+                colonnes[i] = "taux_tva"
+        if "designation" not in colonnes:
+            continue
+        if not set(colonnes) & {"pu_ht", "pu_ttc", "total_ht", "total_ttc"}:
+            continue
+        for row in table[1:]:
+            ligne: dict = {c: None for c in CHAMPS_LIGNE}
+            for champ, cellule in zip(colonnes, row):
+                if champ is None or ligne[champ] is not None:
+                    continue
+                if champ == "designation":
+                    ligne[champ] = str(cellule or "").replace("\n", " ").strip()
+                elif champ == "taux_tva":
+                    ligne[champ] = parser_taux_tva(cellule)
+                else:
+                    ligne[champ] = parser_montant(cellule)
+            designation = ligne["designation"] or ""
+            if _normaliser_entete(designation).startswith(("total", "sous total", "net a payer")):
+                continue
+            if not any(ligne[c] is not None for c in CHAMPS_LIGNE[1:]):
+                continue
+            lignes.append(completer_ligne(ligne))
+    return lignes
+
+
+def totaliser(lignes: list[dict]) -> dict:
+    """Somme les totaux HT, TVA et TTC d'une liste de lignes typées.
+
+    Args:
+        lignes: Lignes produites par extraire_lignes().
+
+    Returns:
+        Dictionnaire {montant_ht, montant_tva, montant_ttc} en Decimal
+        (None si aucune ligne ne porte le montant).
+    """
+    totaux: dict = {}
+    for cle, champ in (("montant_ht", "total_ht"), ("montant_tva", "montant_tva"), ("montant_ttc", "total_ttc")):
+        valeurs = [l[champ] for l in lignes if l.get(champ) is not None]
+        totaux[cle] = arrondir(sum(valeurs, Decimal("0"))) if valeurs else None
+    return totaux
+
+
+def lignes_vers_json(lignes: list[dict]) -> list[dict]:
+    """Sérialise les lignes typées (Decimal → str) pour frontmatter ou JSON.
+
+    Args:
+        lignes: Lignes typées.
+
+    Returns:
+        Lignes sérialisables, montants en chaînes ("120.00"), champs None omis.
+    """
+    return [
+        {k: (str(v) if isinstance(v, Decimal) else v) for k, v in l.items() if v is not None}
+        for l in lignes
+    ]
+
+
+def lignes_depuis_frontmatter(fm: dict) -> list[dict]:
+    """Relit les lignes typées depuis le frontmatter d'un document E3.1.
+
+    Args:
+        fm: Frontmatter parsé (clé 'lignes_facture' optionnelle).
+
+    Returns:
+        Lignes typées (montants en Decimal), liste vide si absentes.
+    """
+    brutes = fm.get("lignes_facture") or []
+    if not isinstance(brutes, list):
+        return []
+    lignes: list[dict] = []
+    for brute in brutes:
+        if not isinstance(brute, dict):
+            continue
+        ligne = {c: None for c in CHAMPS_LIGNE}
+        for champ in CHAMPS_LIGNE:
+            if champ == "designation":
+                ligne[champ] = str(brute.get(champ, ""))
+            else:
+                ligne[champ] = parser_montant(brute.get(champ))
+        lignes.append(ligne)
+    return lignes
+
+
+def _tags(fm: dict) -> list[str]:
+    """Normalise le champ 'tags' du frontmatter en liste de chaînes minuscules."""
+    tags = fm.get("tags", [])
+    if isinstance(tags, str):
+        tags = tags.strip("[]").split(",")
+    return [str(t).strip().strip("'\"").lower() for t in tags if str(t).strip()]
+
+
+def controler_lignes(fm: dict) -> list[str]:
+    """Exécute les contrôles comptables déterministes sur un document E3.1.
+
+    Contrôles :
+        1. HT + TVA = TTC sur les montants d'en-tête (tolérance 0.01 €)
+        2. Somme des lignes typées = montants d'en-tête
+        3. Document tagué 'cadeau' : PU TTC d'une ligne > 73 € (CGI Art. 236)
+
+    Args:
+        fm: Frontmatter parsé du document.
+
+    Returns:
+        Liste de constats textuels (vide si aucun écart détecté).
+    """
+    constats: list[str] = []
+    ht  = parser_montant(fm.get("montant_ht"))
+    tva = parser_montant(fm.get("montant_tva"))
+    ttc = parser_montant(fm.get("montant_ttc"))
+
+    if ht is not None and tva is not None and ttc is not None:
+        ecart = abs(ht + tva - ttc)
+        if ecart > TOLERANCE_CENTIMES:
+            constats.append(
+                f"ECART_HT_TVA_TTC : HT({ht}) + TVA({tva}) ≠ TTC({ttc}) — écart {arrondir(ecart)} €"
+            )
+
+    lignes = lignes_depuis_frontmatter(fm)
+    if lignes:
+        totaux = totaliser(lignes)
+        for cle, entete in (("montant_ht", ht), ("montant_ttc", ttc)):
+            somme = totaux.get(cle)
+            if somme is not None and entete is not None and abs(somme - entete) > TOLERANCE_CENTIMES:
+                constats.append(
+                    f"ECART_LIGNES_ENTETE : somme lignes {cle}={somme} ≠ en-tête {entete}"
+                )
+
+    if "cadeau" in _tags(fm):
+        for ligne in lignes:
+            pu_ttc = ligne.get("pu_ttc")
+            if pu_ttc is not None and pu_ttc > SEUIL_CADEAU_TTC:
+                constats.append(
+                    f"SEUIL_CADEAU_DEPASSE : '{ligne['designation']}' PU TTC {arrondir(pu_ttc)} € "
+                    f"> {SEUIL_CADEAU_TTC} € (CGI Art. 236)"
+                )
+    return constats
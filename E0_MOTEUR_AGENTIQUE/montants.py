@@ -0,0 +1,262 @@
+# ERGO_ID: MONTANTS
+"""
+montants.py
+===========
+ERGO KOS_COMPTA — Moteur monétaire à virgule fixe (centimes entiers)
+
+Les montants produits par le LLM arrivent en flottants JSON ; ils sont
+convertis une seule fois en centimes entiers (int) avec une règle d'arrondi
+explicite, puis additionnés et comparés exactement — plus de tolérance
+`math.isclose` ni de dérive d'arrondi cumulée sur les gros lots.
+
+    en_centimes()        : float / int / Decimal / texte FR-EN → centimes (int)
+    formater()           : centimes → "1234.56" (CSV ERP)
+    vers_json()          : valeur → flottant à 2 décimales exactes (payload E4.2)
+    controler_equilibre(): Σ débits = Σ crédits par fichier et par journal (colonnes du lot)
+
+Règle d'arrondi (KOS_ARRONDI) :
+    commercial (défaut) : demi vers le haut en valeur absolue (ROUND_HALF_UP)
+    bancaire            : demi au pair (ROUND_HALF_EVEN)
+
+Usage :
+    python montants.py --benchmark
+    python montants.py --benchmark --ecritures 500000
+
+ERGO_REGISTRY:
+    role         : Montants en centimes entiers + controle d'equilibre debit/credit par lot
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : lignes_facture.py (parser_montant) ; stdlib decimal
+    entrees      : montants LLM (imputation_recommandee), payloads E4.2
+    sorties      : centimes (int), montants formatés pour le CSV ERP
+    variable_env : KOS_ARRONDI (optionnel : commercial | bancaire)
+"""
+
+import argparse
+import itertools
+import math
+import operator
+import os
+import random
+import time
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Sequence
+
+from lignes_facture import parser_montant
+
+
+CENTIME = Decimal("0.01")
+ARRONDIS = {"commercial": ROUND_HALF_UP, "bancaire": ROUND_HALF_EVEN}
+
+_EPSILON_FLOTTANT = 1e-6
+_CENTIMES_EXACTS  = 1 << 50
+
+
+@lru_cache(maxsize=1)
+def regle_arrondi() -> str:
+    """Règle d'arrondi Decimal active (KOS_ARRONDI, défaut "commercial").
+
+    Raises:
+        ValueError: Si KOS_ARRONDI n'est pas une règle connue.
+    """
+    nom = os.environ.get("KOS_ARRONDI", "commercial").strip().lower()
+    if nom not in ARRONDIS:
+        raise ValueError(f"KOS_ARRONDI inconnu : {nom!r} (attendu : {', '.join(ARRONDIS)})")
+    return ARRONDIS[nom]
+
+
+def en_centimes(valeur) -> int:
+    """Convertit un montant en centimes entiers, arrondi selon KOS_ARRONDI.
+
+    Chemin rapide pour les flottants JSON à 2 décimales (cas nominal) : le
+    produit par 100 est à moins de 1e-6 d'un entier, l'arrondi est exact.
+    Les autres valeurs passent par Decimal (représentation décimale la plus
+    courte du flottant, pas sa valeur binaire : 1.005 → 101 en commercial).
+
+    Args:
+        valeur: Montant (int, float, Decimal, texte "1 234,56 €" ou None).
+
+    Returns:
+        Montant en centimes (0 si la valeur est None ou vide).
+
+    Raises:
+        ValueError: Si la valeur n'est pas un montant lisible ou n'est pas finie.
+    """
+    if type(valeur) is float:
+        if not math.isfinite(valeur):
+            raise ValueError(f"Montant non fini : {valeur!r}")
+        centimes = round(valeur * 100)
+        if -_EPSILON_FLOTTANT < valeur * 100 - centimes < _EPSILON_FLOTTANT:
+            return centimes
+        valeur = Decimal(repr(valeur))
+    elif valeur is None or isinstance(valeur, bool):
+        return 0
+    elif isinstance(valeur, int):
+        return valeur * 100
+    elif not isinstance(valeur, Decimal):
+        lu = parser_montant(valeur)
+        if lu is None:
+            if not str(valeur).strip():
+                return 0
+            raise ValueError(f"Montant illisible : {valeur!r}")
+        valeur = lu
+    if not valeur.is_finite():
+        raise ValueError(f"Montant non fini : {valeur!r}")
+    return int(valeur.quantize(CENTIME, rounding=regle_arrondi()).scaleb(2))
+
+
+def formater(centimes: int) -> str:
+    """Formate des centimes en montant à 2 décimales avec point ("-12.05").
+
+    Args:
+        centimes: Montant en centimes.
+
+    Returns:
+        Montant texte, sans séparateur de milliers (format d'import CEGID).
+    """
+    if -_CENTIMES_EXACTS < centimes < _CENTIMES_EXACTS:
+        return f"{centimes / 100:.2f}"        # erreur binaire < 0,005 : le %.2f retombe sur le centime exact
+    signe = "-" if centimes < 0 else ""
+    euros, reste = divmod(abs(centimes), 100)
+    return f"{signe}{euros}.{reste:02d}"
+
+
+def vers_json(valeur) -> float:
+    """Arrondit un montant au centime pour sérialisation JSON (payload E4.2).
+
+    Le flottant renvoyé est le plus proche de la valeur à 2 décimales : json
+    l'écrit sans résidu binaire (120.1, jamais 120.10000000000001).
+
+    Args:
+        valeur: Montant (voir en_centimes()).
+
+    Returns:
+        Montant en euros arrondi au centime.
+    """
+    return en_centimes(valeur) / 100
+
+
+def controler_equilibre(
+    fichiers: Sequence[str], journaux: Sequence[str], debits: Sequence[int], credits: Sequence[int]
+) -> dict:
+    """Contrôle la partie double d'un lot : Σ débits = Σ crédits par fichier et par journal.
+
+    Le lot est passé en colonnes (une entrée par fichier : journal, total des
+    débits, total des crédits en centimes) ; écarts et totaux sont calculés
+    par map/sum sur les colonnes entières, en entiers exacts.
+
+    Args:
+        fichiers: Noms des fichiers du lot.
+        journaux: Journal de chaque fichier ("ACH").
+        debits:   Somme des débits de chaque fichier (centimes).
+        credits:  Somme des crédits de chaque fichier (centimes).
+
+    Returns:
+        {"fichiers": {fichier: écart débit − crédit} (fichiers déséquilibrés seulement),
+         "journaux": {journal: {"debit": centimes, "credit": centimes}}}.
+    """
+    ecarts = list(map(operator.sub, debits, credits))
+    desequilibres = {fichiers[i]: e for i, e in enumerate(ecarts) if e} if any(ecarts) else {}
+    codes = set(journaux)
+    if len(codes) == 1:
+        totaux = {codes.pop(): {"debit": sum(debits), "credit": sum(credits)}}
+    else:
+        totaux = {}
+        for code in sorted(codes):
+            masque = [j == code for j in journaux]
+            totaux[code] = {"debit": sum(itertools.compress(debits, masque)),
+                            "credit": sum(itertools.compress(credits, masque))}
+    return {"fichiers": desequilibres, "journaux": totaux}
+
+
+# ─────────────────────────────────────────────
+# BENCHMARK
+# ─────────────────────────────────────────────
+
+def _factures_synthetiques(n: int, graine: int = 42) -> list[tuple[float, float, float]]:
+    """Génère n factures (HT, TVA 20 %, TTC) en flottants, comme les renvoie json.loads.
+
+    Environ 1 % des factures ont un TTC décalé d'un centime (TVA recalculée
+    ligne à ligne par le fournisseur) : cas que l'ancienne tolérance acceptait.
+    """
+    rng = random.Random(graine)
+    factures = []
+    for _ in range(n):
+        ht = rng.randrange(100, 5_000_000) / 100
+        tva = float(f"{ht * 0.2:.2f}")
+        decalage = 0.01 if rng.random() < 0.01 else 0.0
+        factures.append((ht, tva, float(f"{ht + tva + decalage:.2f}")))
+    return factures
+
+
+def benchmark(n: int) -> dict:
+    """Compare la chaîne flottante historique aux centimes entiers, à travail égal.
+
+    Les deux chaînes convertissent, contrôlent HT + TVA = TTC, formatent les
+    3 écritures de chaque facture et totalisent débits et crédits du journal.
+
+    Args:
+        n: Nombre de factures synthétiques (3 écritures chacune).
+
+    Returns:
+        {"flottant": {...}, "centimes": {...}} : durée (s), total débit formaté,
+        dérive cumulée par rapport au total exact (centimes), écart D − C du
+        journal exporté, factures rejetées.
+    """
+    factures = _factures_synthetiques(n)
+
+    t0 = time.perf_counter()
+    lignes_f, debit_f, credit_f, rejets_f = [], 0.0, 0.0, 0
+    for ht, tva, ttc in factures:
+        ht, tva, ttc = float(ht), float(tva), float(ttc)
+        if math.isclose(ht + tva, ttc, abs_tol=0.01):
+            lignes_f += [f"{ht:.2f}", f"{tva:.2f}", f"{ttc:.2f}"]
+            debit_f  += ht + tva
+            credit_f += ttc
+        else:
+            rejets_f += 1
+    duree_f = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    lignes_c, debits, credits = [], [], []
+    for ht, tva, ttc in factures:
+        c_ht, c_tva, c_ttc = en_centimes(ht), en_centimes(tva), en_centimes(ttc)
+        if c_ht + c_tva == c_ttc:
+            lignes_c += [formater(c_ht), formater(c_tva), formater(c_ttc)]
+            debits.append(c_ht + c_tva)
+            credits.append(c_ttc)
+    journal = controler_equilibre(range(len(debits)), ["ACH"] * len(debits), debits, credits)["journaux"]["ACH"]
+    duree_c = time.perf_counter() - t0
+
+    exact = journal["debit"]
+    exact_f = sum(en_centimes(ht) + en_centimes(tva) for ht, tva, ttc in factures
+                  if math.isclose(ht + tva, ttc, abs_tol=0.01))
+    return {
+        "flottant": {"duree_s": duree_f, "total": f"{debit_f:.2f}",
+                     "derive_centimes": en_centimes(f"{debit_f:.2f}") - exact_f,
+                     "ecart_dc": f"{debit_f - credit_f:.2f}", "rejets": rejets_f},
+        "centimes": {"duree_s": duree_c, "total": formater(exact), "derive_centimes": 0,
+                     "ecart_dc": formater(exact - journal["credit"]), "rejets": n - len(debits)},
+    }
+
+
+def main() -> None:
+    """Point d'entrée CLI : benchmark flottants vs centimes entiers."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Moteur monétaire en centimes entiers")
+    parser.add_argument("--benchmark", action="store_true", help="Comparer flottants et centimes entiers")
+    parser.add_argument("--ecritures", type=int, default=200_000, help="Nombre de factures synthétiques")
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    resultats = benchmark(args.ecritures)
+    print(f"  {args.ecritures} factures ({args.ecritures * 3} écritures), arrondi {os.environ.get('KOS_ARRONDI', 'commercial')}")
+    for nom, r in resultats.items():
+        print(f"  {nom:9} {r['duree_s'] * 1000:9.1f} ms   total débit {r['total']:>16}   "
+              f"dérive {r['derive_centimes']:+d} centime(s)   D − C {r['ecart_dc']:>6}   rejets {r['rejets']}")
+
+
+if __name__ == "__main__":
+    main()
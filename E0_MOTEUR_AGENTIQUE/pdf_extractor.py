@@ -8,11 +8,15 @@ Extract / Load / Transform
 Format de sortie hybride optimal LLM :
   - En-tête / pied  → texte structuré plat  (tokens minimum)
   - Lignes facture  → tableau Markdown       (clarté colonnes)
+  - Lignes typées   → frontmatter `lignes_facture` + montants (Decimal)
 
 Inputs supportés :
+  - PDF/A-3 Factur-X → XML embarqué extrait en priorité (ni pdfplumber ni OCR) ;
+                      XML embarqué illisible → repli sur le texte du PDF
   - PDF natif       → pdfplumber
   - PDF scanné      → pytesseract (lang=fra)
-  - XML Factur-X    → lxml
+  - XML Factur-X/UBL → facturx_parser (iterparse, champs canoniques) ;
+                      autre XML → texte aplati borné (facturx_parser.aplatir_xml)
 
 Usage :
   python pdf_extractor.py --input facture.pdf
@@ -22,13 +26,16 @@ Usage :
 
 ERGO_REGISTRY:
     role         : ETL sas entrée — PDF/XML → Markdown structuré pour Dropzone
-    version      : 1.0.0
+    version      : 1.7.4
     auteur       : ERGO Capital / Adam
-    dependances  : pdfplumber, pytesseract, pdf2image, Pillow, lxml
-    entrees      : E3.1_Dropzone_Factures/input/*.pdf, *.xml, *.ubl
+    dependances  : pdfplumber, pytesseract, pdf2image, Pillow, lxml, lignes_facture.py,
+                   facturx_parser.py, dedup_ingress.py, journal_kos.py,
+                   system_code_register.py (sequence ERGO), instrumentation.py
+    entrees      : E3.1_Dropzone_Factures/input/*.pdf (dont PDF/A-3 Factur-X), *.xml, *.ubl
     sorties      : E3.1_Dropzone_Factures/{stem}_{timestamp}.md
 """
 
+import io
 import sys
 import os
 import re
@@ -38,10 +45,16 @@ import logging
 from pathlib import Path
 from datetime import datetime
 
+from lignes_facture import extraire_lignes, totaliser, lignes_vers_json, parser_montant
+from facturx_parser import lire_facture_structuree, aplatir_xml
+from dedup_ingress import mode_dedup, empreinte_octets, empreinte_contenu, chercher_doublon, enregistrer
+import journal_kos
+from system_code_register import prochaine_iteration
+import instrumentation
+
 BASE_DIR   = Path(__file__).parent.parent
 INPUT_DIR  = BASE_DIR / "E3_INTERFACES_ACTEURS" / "E3.1_Dropzone_Factures" / "input"
 DROPZONE   = BASE_DIR / "E3_INTERFACES_ACTEURS" / "E3.1_Dropzone_Factures"
-SYSTEM_LOG = Path(__file__).parent / "logs" / "SYSTEM_LOG.json"
 
 CHAMPS_ENTETE = [
     "fournisseur","supplier","vendeur","siret","siren",
@@ -54,6 +67,10 @@ CHAMPS_ENTETE = [
     "mode paiement","iban","bic",
 ]
 
+NOMS_XML_EMBARQUE = {"factur-x.xml", "zugferd-invoice.xml", "zugferd_invoice.xml", "xrechnung.xml"}
+
+CHAMPS_FRONTMATTER_XML = ["numero_facture", "date_facture", "date_echeance", "fournisseur", "fournisseur_tva"]
+
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s] [%(levelname)s] %(message)s",
@@ -83,6 +100,52 @@ def est_pdf_natif(pdf_path: Path, seuil: int = 50) -> bool:
 
 # ── EXTRACT ─────────────────────────────────
 
+def _nom_fichier_pdf(valeur) -> str:
+    """Décode un nom de fichier PDF (chaîne UTF-16 avec BOM ou PDFDocEncoding)."""
+    if isinstance(valeur, bytes):
+        if valeur.startswith((b"\xfe\xff", b"\xff\xfe")):
+            return valeur.decode("utf-16", errors="ignore")
+        return valeur.decode("latin-1")
+    return str(valeur or "")
+
+def extraire_xml_embarque(pdf_path: Path) -> bytes | None:
+    """Retourne le XML Factur-X embarqué d'un PDF/A-3, ou None s'il est absent.
+
+    Parcourt l'arbre /Names/EmbeddedFiles et le tableau /AF du catalogue
+    sans analyser les pages (aucune extraction texte ni OCR).
+    """
+    try:
+        import pdfplumber
+        from pdfminer.pdftypes import resolve1
+    except ImportError:
+        return None
+    try:
+        with pdfplumber.open(str(pdf_path)) as pdf:
+            catalogue = resolve1(pdf.doc.catalog)
+            specs, noeuds = [], []
+            noms = resolve1(catalogue.get("Names")) or {}
+            if noms.get("EmbeddedFiles"):
+                noeuds.append(noms["EmbeddedFiles"])
+            while noeuds:
+                noeud = resolve1(noeuds.pop()) or {}
+                paires = resolve1(noeud.get("Names")) or []
+                specs.extend(paires[1::2])
+                noeuds.extend(resolve1(noeud.get("Kids")) or [])
+            specs.extend(resolve1(catalogue.get("AF")) or [])
+            for spec in specs:
+                spec = resolve1(spec) or {}
+                nom = _nom_fichier_pdf(resolve1(spec.get("UF") or spec.get("F")))
+                if nom.lower() not in NOMS_XML_EMBARQUE:
+                    continue
+                flux = resolve1((resolve1(spec.get("EF")) or {}).get("F"))
+                if flux is not None:
+                    log.info(f"XML embarqué {nom} détecté → {pdf_path.name}")
+                    return flux.get_data()
+    except Exception as e:
+        log.warning(f"Lecture pièces jointes PDF : {e}")
+    return None
+
+
 def extraire_pdf_natif(pdf_path: Path) -> dict:
     import pdfplumber
     log.info(f"pdfplumber → {pdf_path.name}")
@@ -116,27 +179,41 @@ def extraire_pdf_scanne(pdf_path: Path) -> dict:
     return {"methode": "pytesseract", "pages_texte": pages, "tables_brutes": []}
 
 def extraire_xml_facturx(xml_path: Path) -> dict:
+    """Lit un XML Factur-X / UBL ; toute autre racine est aplatie en texte borné."""
+    log.info(f"iterparse Factur-X/UBL → {xml_path.name}")
     try:
-        from lxml import etree
-    except ImportError:
-        raise ImportError("pip install lxml")
-    log.info(f"lxml Factur-X → {xml_path.name}")
-    parser = etree.XMLParser(resolve_entities=False, no_network=True, load_dtd=False)
-    tree = etree.parse(str(xml_path), parser)
-    root = tree.getroot()
-    def strip_ns(tag):
-        return re.sub(r'\{.*?\}', '', tag)
-    def to_dict(el):
-        r = {}
-        for child in el:
-            k = strip_ns(child.tag)
-            r[k] = to_dict(child) if len(child) else child.text
-        return r
+        facturx = lire_facture_structuree(xml_path)
+    except ValueError as e:
+        log.warning(f"{e} → repli texte aplati ({xml_path.name})")
+        return {
+            "methode": "lxml_generique",
+            "pages_texte": ["\n".join(aplatir_xml(xml_path))],
+            "tables_brutes": [],
+        }
     return {
         "methode": "lxml_facturx",
         "pages_texte": [],
         "tables_brutes": [],
-        "xml_data": to_dict(root)
+        "facturx": facturx,
+    }
+
+
+def extraire_pdf_facturx(xml: bytes) -> dict | None:
+    """Lit le XML Factur-X embarqué d'un PDF/A-3, ou None s'il est illisible.
+
+    Un XML malformé ou de racine inconnue est journalisé ; l'appelant se
+    replie alors sur l'extraction texte du PDF (pdfplumber / OCR).
+    """
+    try:
+        facturx = lire_facture_structuree(io.BytesIO(xml))
+    except (SyntaxError, ValueError) as e:          # lxml.etree.XMLSyntaxError dérive de SyntaxError
+        log.warning(f"XML Factur-X embarqué illisible ({e}) → repli sur le texte du PDF")
+        return None
+    return {
+        "methode": "facturx_pdfa3",
+        "pages_texte": [],
+        "tables_brutes": [],
+        "facturx": facturx,
     }
 
 
@@ -172,19 +249,41 @@ def tables_vers_markdown(tables: list) -> str:
         md += "\n"
     return md
 
-def xml_vers_plat(data: dict, prefix: str = "") -> str:
-    lignes = []
-    for k, v in data.items():
-        cle = f"{prefix}.{k}".upper().lstrip(".") if prefix else k.upper()
-        if isinstance(v, dict):
-            lignes.append(xml_vers_plat(v, prefix=cle))
-        else:
-            lignes.append(f"{cle}: {v}")
-    return "\n".join(lignes)
+def frontmatter_montants(imprimes: dict, lignes: list) -> str:
+    """Sérialise montants et lignes typées en champs frontmatter YAML.
+
+    Les totaux imprimés (en-tête PDF ou Factur-X) priment sur la somme recalculée
+    des lignes. Les montants sont écrits entre guillemets pour préserver la précision Decimal.
+    """
+    totaux = totaliser(lignes)
+    for cle in ("montant_ht", "montant_tva", "montant_ttc"):
+        imprime = parser_montant(imprimes.get(cle))
+        if imprime is not None:
+            totaux[cle] = imprime
+    fm = "".join(f'{cle}: "{val}"\n' for cle, val in totaux.items() if val is not None)
+    if lignes:
+        fm += f"lignes_facture: {json.dumps(lignes_vers_json(lignes), ensure_ascii=False)}\n"
+    return fm
 
 def transformer_en_markdown(data: dict, source: Path) -> str:
     ts = datetime.now().isoformat()
     methode = data["methode"]
+    texte_complet = "\n".join(data["pages_texte"])
+    facturx = data.get("facturx")
+    if facturx:
+        champs   = facturx["champs"]
+        lignes   = facturx["lignes"]
+        imprimes = champs
+        fm_extra = "".join(
+            f"{cle}: {json.dumps(champs[cle], ensure_ascii=False)}\n"
+            for cle in CHAMPS_FRONTMATTER_XML if champs.get(cle)
+        )
+    else:
+        champs   = extraire_champs_entete(texte_complet)
+        lignes   = extraire_lignes(data["tables_brutes"])
+        imprimes = {"montant_ht": champs.get("TOTAL_HT"), "montant_tva": champs.get("TOTAL_TVA"),
+                    "montant_ttc": champs.get("TOTAL_TTC")}
+        fm_extra = ""
 
     frontmatter = f"""---
 type: facture_fournisseur
@@ -195,20 +294,17 @@ source_fichier: {source.name}
 extraction_date: {ts}
 methode_extraction: {methode}
 tags: [facture, extrait_automatique, {methode}]
----"""
+{fm_extra}{frontmatter_montants(imprimes, lignes)}---"""
 
     corps = f"\n# Document extrait — {source.name}\n"
     corps += f"> `{methode}` — {ts[:19]}\n"
 
-    if methode == "lxml_facturx" and data.get("xml_data"):
-        corps += "\n## Données Factur-X\n\n"
-        corps += xml_vers_plat(data["xml_data"])
-        corps += "\n"
+    if facturx:
+        corps += f"\n## Données Factur-X ({facturx['syntaxe']})\n\n"
+        for cle, val in champs.items():
+            corps += f"{cle.upper()}: {val}\n"
         return frontmatter + corps
 
-    texte_complet = "\n".join(data["pages_texte"])
-
-    champs = extraire_champs_entete(texte_complet)
     if champs:
         corps += "\n## En-tête\n\n"
         for cle, val in champs.items():
@@ -238,15 +334,9 @@ def charger_en_dropzone(contenu: str, source: Path) -> Path:
 
 # ── LOG SYSTEM ──────────────────────────────
 
-def log_system(fichier: str, action: str, detail: str):
-    entrees = []
-    if SYSTEM_LOG.exists():
-        try:
-            entrees = json.loads(SYSTEM_LOG.read_text(encoding="utf-8"))
-        except Exception:
-            pass
-    n = len(entrees) + 1
-    entrees.append({
+def log_system(fichier: str, action: str, detail: str, etapes: dict = None):
+    n = prochaine_iteration()
+    entree = {
         "iteration": n,
         "timestamp": datetime.now().isoformat(),
         "fichier": fichier,
@@ -254,8 +344,10 @@ def log_system(fichier: str, action: str, detail: str):
         "detail": detail,
         "auteur": "pdf_extractor",
         "ergo_id": f"ERGO_{n:04d}"
-    })
-    SYSTEM_LOG.write_text(json.dumps(entrees, ensure_ascii=False, indent=2), encoding="utf-8")
+    }
+    if etapes:
+        entree["etapes"] = etapes
+    journal_kos.ajouter("SYSTEM_LOG", entree)
 
 
 # ── PIPELINE ────────────────────────────────
@@ -267,25 +359,71 @@ def _valider_chemin(chemin: Path) -> Path:
     return resolu
 
 
-def traiter_fichier(source: Path, force_ocr: bool = False) -> Path:
+def _ecarter_doublon(source: Path, doublon: dict) -> None:
+    log.warning(f"Doublon écarté : {source.name} = {doublon['document']} (critère {doublon['critere']})")
+    log_system(source.name, "DUPLICATE", f"critere={doublon['critere']} | original={doublon['document']}")
+
+
+def traiter_fichier(source: Path, force_ocr: bool = False) -> Path | None:
     source = _valider_chemin(source)
     if not source.exists():
         raise FileNotFoundError(f"Introuvable : {source}")
     log.info(f"═══ ETL START → {source.name} ═══")
-
-    if est_xml(source):
-        data = extraire_xml_facturx(source)
-    elif force_ocr:
-        data = extraire_pdf_scanne(source)
-    elif est_pdf_natif(source):
-        data = extraire_pdf_natif(source)
-    else:
-        log.info("Scanné détecté → pytesseract")
-        data = extraire_pdf_scanne(source)
-
-    contenu = transformer_en_markdown(data, source)
-    out = charger_en_dropzone(contenu, source)
-    log_system(source.name, "EXTRACTED", f"methode={data['methode']} | output={out.name}")
+    with instrumentation.trace(source.name) as t:
+        return _extraire_vers_dropzone(source, force_ocr, t)
+
+
+def _extraire_vers_dropzone(source: Path, force_ocr: bool, t: dict) -> Path | None:
+    mode = mode_dedup()
+    empreinte_source, doublon = None, None
+    if mode != "off":
+        with instrumentation.span("dedup", critere="source") as sp:
+            sp["octets"] = source.stat().st_size
+            empreinte_source = empreinte_octets(source)
+            doublon = chercher_doublon(source.name, source=empreinte_source, etapes=("audit",))
+    if doublon and mode == "skip":
+        _ecarter_doublon(source, doublon)
+        return None
+
+    with instrumentation.span("extraction") as sp:
+        sp["octets"] = source.stat().st_size
+        xml_embarque = None
+        if not est_xml(source) and not force_ocr:
+            xml_embarque = extraire_xml_embarque(source)
+
+        data = None
+        if est_xml(source):
+            data = extraire_xml_facturx(source)
+        elif xml_embarque is not None:
+            data = extraire_pdf_facturx(xml_embarque)
+        if data is None:
+            if force_ocr:
+                data = extraire_pdf_scanne(source)
+            elif est_pdf_natif(source):
+                data = extraire_pdf_natif(source)
+            else:
+                log.info("Scanné détecté → pytesseract")
+                data = extraire_pdf_scanne(source)
+        sp["methode"] = data["methode"]
+
+    with instrumentation.span("markdown") as sp:
+        contenu = transformer_en_markdown(data, source)
+        sp["octets"] = len(contenu.encode("utf-8"))
+    empreinte = None
+    if mode != "off":
+        with instrumentation.span("dedup", critere="contenu"):
+            empreinte = empreinte_contenu(contenu)
+            doublon = doublon or chercher_doublon(source.name, contenu=empreinte, etapes=("audit",))
+    if doublon and mode == "skip":
+        _ecarter_doublon(source, doublon)
+        return None
+
+    with instrumentation.span("depot"):
+        out = charger_en_dropzone(contenu, source)
+        if mode != "off":
+            enregistrer(out.name, "etl", source=empreinte_source, contenu=empreinte)
+    log_system(source.name, "EXTRACTED", f"methode={data['methode']} | output={out.name}",
+               etapes=instrumentation.resumer(t["spans"]))
     log.info(f"═══ ETL OK → {out.name} ═══")
     return out
 
@@ -320,9 +458,11 @@ def main():
 
     if args.batch:
         traiter_batch(Path(args.dir), args.force_ocr)
+        instrumentation.exporter(composant="pdf_extractor")
     elif args.input:
         out = traiter_fichier(Path(args.input), args.force_ocr)
-        print(f"[OK] → {out}", flush=True)
+        instrumentation.exporter(composant="pdf_extractor")
+        print(f"[OK] → {out}" if out else "[DOUBLON] → document déjà ingéré, ignoré", flush=True)
         sys.exit(0)
     else:
         parser.print_help()
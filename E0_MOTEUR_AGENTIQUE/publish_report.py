@@ -8,23 +8,44 @@ Lit les résultats d'audit produits dans E4 et publie un commentaire Markdown
 structuré sur la Merge Request GitLab via l'API REST v4.
 Fonctionne aussi en mode local (affichage console) si aucun contexte MR n'est détecté.
 
+Seules les sorties du run courant sont lues : le manifeste écrit par
+agent_compliance (E4_AUDIT_ET_ROUTAGE/MANIFESTE_RUN.json) liste ses rapports
+et payloads, lus un par un au fil de la construction du commentaire. Le
+temps du stage ne dépend plus de l'historique resté dans E4. Sans manifeste
+(run antérieur) ou avec --tout, les dossiers E4.1 / E4.2 sont parcourus en entier.
+
+Publication sous budget (KOS_MR_NOTE_OCTETS) : une note de synthèse
+(compteurs + index des documents) puis des pages de détail où chaque
+document est un bloc repliable <details> ; une seule note si tout tient.
+Les notes de détail sont postées en parallèle sur une requests.Session
+partagée, avec reprise et attente exponentielle sur erreur transitoire.
+--api-url (ou CI_API_V4_URL) permet de viser une instance GitLab locale.
+
 ERGO_REGISTRY:
     role         : Stage REPORT - publie le verdict de conformite sur GitLab MR
-    version      : 1.0.0
+    version      : 1.3.1
     auteur       : ERGO Capital / Adam
-    dependances  : requests
-    entrees      : E4_AUDIT_ET_ROUTAGE/E4.1_Rapports_Conformite/RAPPORT_*.json
+    dependances  : requests, schema_verdict.py
+    entrees      : E4_AUDIT_ET_ROUTAGE/MANIFESTE_RUN.json (agent_compliance.py)
+                   E4_AUDIT_ET_ROUTAGE/E4.1_Rapports_Conformite/RAPPORT_*.json
                    E4_AUDIT_ET_ROUTAGE/E4.2_Payloads_ERP/PAYLOAD_*.json
-    sorties      : Commentaire GitLab MR (API REST)
-    variable_env : GITLAB_TOKEN, CI_MERGE_REQUEST_IID, CI_PROJECT_ID
+    sorties      : Notes GitLab MR (API REST) : synthèse + pages de détail
+    variable_env : GITLAB_TOKEN, CI_MERGE_REQUEST_IID, CI_PROJECT_ID, CI_API_V4_URL,
+                   KOS_MR_NOTE_OCTETS, KOS_MR_PARALLELISME, KOS_MR_TENTATIVES (optionnels)
 """
 
 import argparse
+import itertools
 import json
 import os
+import random
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Iterable, Iterator, Optional
+from urllib.parse import quote
 
 try:
     import requests
@@ -35,6 +56,8 @@ except ImportError:
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 
+import schema_verdict
+
 
 ICONE: dict[str, str] = {
     "REJET": "🔴",
@@ -50,42 +73,108 @@ RISQUE_ICONE: dict[str, str] = {
 }
 
 
-def lire_rapports(report_dir: Path) -> list[dict]:
-    """Charge tous les rapports JSON depuis E4.1_Rapports_Conformite.
+SCHEMA_MANIFESTE = "kos_compta/manifeste/1"       # agent_compliance.ecrire_manifeste()
+
+# Publication : GitLab refuse les notes de plus de 1 000 000 caractères ;
+# le budget par note reste en deçà (rendu plus rapide des longues MR).
+NOTE_OCTETS_MAX      = int(os.environ.get("KOS_MR_NOTE_OCTETS", "200000"))
+PARALLELISME         = int(os.environ.get("KOS_MR_PARALLELISME", "4"))
+TENTATIVES           = int(os.environ.get("KOS_MR_TENTATIVES", "4"))
+ATTENTE_MAX_S        = 30
+STATUTS_TRANSITOIRES = (429, 502, 503, 504)
+
+
+def lire_manifeste(chemin: Path) -> Optional[dict]:
+    """Charge le manifeste du run écrit par agent_compliance.
 
     Args:
-        report_dir: Chemin vers le dossier E4.1.
+        chemin: Chemin de MANIFESTE_RUN.json.
 
     Returns:
-        Liste de dictionnaires {'fichier': str, 'data': dict} par rapport trouvé.
+        Manifeste {pipeline_id, iteration_id, resume, rapports, payloads}, ou None
+        s'il est absent, illisible ou d'un autre schéma.
     """
-    rapports: list[dict] = []
-    for fichier in sorted(report_dir.glob("RAPPORT_*.json")):
+    try:
+        manifeste = json.loads(chemin.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"  [WARN] Manifeste {chemin.name} illisible : {e}")
+        return None
+    if manifeste.get("schema") != SCHEMA_MANIFESTE:
+        print(f"  [WARN] Manifeste {chemin.name} de schéma inconnu ({manifeste.get('schema')}), ignoré")
+        return None
+    pipeline_id = os.environ.get("CI_PIPELINE_ID")
+    if pipeline_id and manifeste.get("pipeline_id") != pipeline_id:
+        print(f"  [WARN] Manifeste du pipeline {manifeste.get('pipeline_id')} (pipeline courant : {pipeline_id})")
+    return manifeste
+
+
+def _fichiers(dossier: Path, motif: str, noms: Optional[Iterable[str]]) -> Iterator[Path]:
+    """Fichiers à lire : ceux du manifeste (dans l'ordre), sinon tout le dossier trié."""
+    if noms is None:
+        yield from sorted(dossier.glob(motif))
+        return
+    for nom in noms:
+        fichier = dossier / nom
+        if fichier.is_file():
+            yield fichier
+        else:
+            print(f"  [WARN] {nom} listé au manifeste mais introuvable dans {dossier.name}")
+
+
+def lire_rapports(report_dir: Path, noms: Optional[Iterable[str]] = None) -> Iterator[dict]:
+    """Lit paresseusement les rapports JSON de E4.1_Rapports_Conformite.
+
+    Args:
+        report_dir: Chemin vers le dossier E4.1.
+        noms:       Rapports du run (manifeste) ; None = tous les RAPPORT_*.json du dossier.
+
+    Les rapports estampillés par agent_compliance (``schema`` = SCHEMA_ID) ont
+    été validés à l'écriture. Les autres (runs antérieurs) ne sont écartés que
+    sans verdict ni motif : un écart au schéma courant (champ ajouté depuis,
+    ex. confiance) est seulement signalé dans 'ecarts', pour qu'un REJET
+    historique reste publié.
+
+    Yields:
+        Dictionnaire {'fichier': str, 'data': dict, 'ecarts': list[str]} par
+        rapport lisible, un fichier à la fois.
+    """
+    for fichier in _fichiers(report_dir, "RAPPORT_*.json", noms):
         try:
             data = json.loads(fichier.read_text(encoding="utf-8"))
-            rapports.append({"fichier": fichier.name, "data": data})
         except (json.JSONDecodeError, IOError) as e:
             print(f"  [WARN] Impossible de lire {fichier.name} : {e}")
-    return rapports
-
-
-def lire_payloads(payload_dir: Path) -> list[dict]:
-    """Charge tous les payloads ERP JSON depuis E4.2_Payloads_ERP.
+            continue
+        verdict = data.get("verdict") if isinstance(data, dict) else None
+        if not isinstance(verdict, dict) or not isinstance(verdict.get("verdict"), str) \
+                or not isinstance(verdict.get("motif"), str):
+            print(f"  [WARN] {fichier.name} sans verdict ni motif, ignoré")
+            continue
+        ecarts = [] if schema_verdict.est_estampille(data) else schema_verdict.valider(verdict)
+        if ecarts:
+            print(f"  [WARN] {fichier.name} antérieur au schéma verdict courant, publié signalé : "
+                  f"{'; '.join(ecarts[:3])}")
+        yield {"fichier": fichier.name, "data": data, "ecarts": ecarts}
+
+
+def lire_payloads(payload_dir: Path, noms: Optional[Iterable[str]] = None) -> Iterator[dict]:
+    """Lit paresseusement les payloads ERP JSON de E4.2_Payloads_ERP.
 
     Args:
         payload_dir: Chemin vers le dossier E4.2.
+        noms:        Payloads du run (manifeste) ; None = tous les PAYLOAD_*.json du dossier.
 
-    Returns:
-        Liste de dictionnaires {'fichier': str, 'data': dict} par payload trouvé.
+    Yields:
+        Dictionnaire {'fichier': str, 'data': dict} par payload lisible, un fichier à la fois.
     """
-    payloads: list[dict] = []
-    for fichier in sorted(payload_dir.glob("PAYLOAD_*.json")):
+    for fichier in _fichiers(payload_dir, "PAYLOAD_*.json", noms):
         try:
             data = json.loads(fichier.read_text(encoding="utf-8"))
-            payloads.append({"fichier": fichier.name, "data": data})
         except (json.JSONDecodeError, IOError) as e:
             print(f"  [WARN] Impossible de lire {fichier.name} : {e}")
-    return payloads
+            continue
+        yield {"fichier": fichier.name, "data": data}
 
 
 def formater_rapport(rapport: dict) -> str:
@@ -97,29 +186,33 @@ def formater_rapport(rapport: dict) -> str:
     Returns:
         Bloc Markdown formaté pour la Merge Request.
     """
-    data       = rapport["data"]
-    verdict_obj = data.get("verdict", {})
-    v          = verdict_obj.get("verdict", "INCONNU")
-    risque     = verdict_obj.get("niveau_risque", "?")
-    articles   = ", ".join(verdict_obj.get("articles_appliques", [])) or "—"
-    corrections = verdict_obj.get("corrections_requises", [])
-    imputation  = verdict_obj.get("imputation_recommandee", {})
+    data        = rapport["data"]
+    verdict_obj = data["verdict"]               # verdict et motif garantis (lire_rapports)
+    v           = verdict_obj["verdict"]
+    risque      = verdict_obj.get("niveau_risque") or "—"
+    articles    = ", ".join(map(str, verdict_obj.get("articles_appliques") or [])) or "—"
+    corrections = verdict_obj.get("corrections_requises") or []
+    imputation  = verdict_obj.get("imputation_recommandee") or {}
     meta        = verdict_obj.get("_meta", {})
+    ecarts      = rapport.get("ecarts") or []
 
     blocs = [
         f"### {ICONE.get(v, '⚪')} `{v}` — {data.get('document_source', rapport['fichier'])}",
         "",
-        f"**Motif :** {verdict_obj.get('motif', '—')}",
+        f"**Motif :** {verdict_obj['motif']}",
         f"**Articles appliqués :** `{articles}`",
         f"**Niveau de risque :** {RISQUE_ICONE.get(risque, '')} {risque}",
-        f"**Action ERP :** `{verdict_obj.get('action_erp', '—')}`",
+        f"**Action ERP :** `{verdict_obj.get('action_erp') or '—'}`",
     ]
 
+    if ecarts:
+        blocs += ["", f"> ⚠️ *Rapport antérieur au schéma verdict courant : {'; '.join(ecarts[:3])}*"]
+
     if corrections:
         blocs += ["", "**Corrections requises :**"]
         blocs += [f"- {c}" for c in corrections]
 
-    if imputation:
+    if isinstance(imputation, dict) and imputation:
         blocs += ["", "**Imputation recommandée :**", "| Champ | Valeur |", "|---|---|"]
         blocs += [f"| {k} | `{v}` |" for k, v in imputation.items()]
 
@@ -163,53 +256,194 @@ def formater_payload(payload: dict) -> str:
     return "\n".join(blocs)
 
 
-def construire_commentaire(rapports: list[dict], payloads: list[dict]) -> str:
-    """Assemble le commentaire Markdown global pour la Merge Request.
+def _octets(texte: str) -> int:
+    """Taille UTF-8 d'un texte (les limites GitLab portent sur le corps envoyé)."""
+    return len(texte.encode("utf-8"))
 
-    Args:
-        rapports: Liste produite par lire_rapports().
-        payloads: Liste produite par lire_payloads().
 
-    Returns:
-        Commentaire Markdown complet prêt à poster sur GitLab.
-    """
-    ts    = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    total = len(rapports) + len(payloads)
+def _tronquer(texte: str, budget: int) -> str:
+    """Coupe un bloc trop long pour tenir dans `budget` octets, avec mention de la troncature."""
+    if _octets(texte) <= budget:
+        return texte
+    mention = f"\n\n… *(bloc tronqué : {_octets(texte)} octets, limite {budget})*"
+    coupe = texte.encode("utf-8")[:max(0, budget - _octets(mention))].decode("utf-8", errors="ignore")
+    return coupe + mention
+
 
-    lignes = [
-        "## 🤖 ERGO KOS_COMPTA — Rapport de Conformité Comptable",
+def _entete(total: int, titre: str = "Rapport de Conformité Comptable") -> str:
+    """En-tête commun aux notes de la Merge Request."""
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return "\n".join([
+        f"## 🤖 ERGO KOS_COMPTA — {titre}",
         "",
         f"> Audit automatique · {ts} · {total} document(s) analysé(s)",
         f"> *The KOS is the legislator. The LLM is the executor. The CI/CD is the tribunal.*",
         "",
         "---",
         "",
-    ]
+    ])
+
 
-    if not rapports and not payloads:
-        lignes.append("⚠️ **Aucun document trouvé dans E3.1_Dropzone_Factures.**")
-        return "\n".join(lignes)
+def _ligne_index(document: dict, est_rapport: bool) -> str:
+    """Ligne du tableau de synthèse : verdict, document, risque, action ERP."""
+    if est_rapport:
+        data, v = document["data"], document["data"]["verdict"]
+        risque = v.get("niveau_risque") or "—"
+        signal = " ⚠️" if document.get("ecarts") else ""
+        return (f"| {ICONE.get(v['verdict'], '⚪')} `{v['verdict']}`{signal} "
+                f"| {data.get('document_source', document['fichier'])} "
+                f"| {RISQUE_ICONE.get(risque, '')} {risque} | `{v.get('action_erp') or '—'}` |")
+    export = document["data"].get("ergo_pgi_export_v1", {})
+    return f"| 🟢 `CONFORME` | {export.get('document_source', document['fichier'])} | — | `INJECTER` |"
 
-    n_rejets = sum(1 for r in rapports if r["data"].get("verdict", {}).get("verdict") == "REJET")
-    n_avert  = sum(1 for r in rapports if r["data"].get("verdict", {}).get("verdict") == "AVERTISSEMENT")
 
-    lignes += [
+def _bloc_details(document: dict, est_rapport: bool, budget: int) -> str:
+    """Bloc de détail repliable (<details>) d'un document, tronqué au budget."""
+    ligne = _ligne_index(document, est_rapport).strip("| ").split(" | ")
+    corps = formater_rapport(document) if est_rapport else formater_payload(document)
+    ouverture = f"<details>\n<summary>{ligne[0]} — {ligne[1]}</summary>\n\n"
+    fermeture = "\n\n</details>\n"
+    return ouverture + _tronquer(corps, budget - _octets(ouverture + fermeture)) + fermeture
+
+
+def construire_notes(rapports: Iterable[dict], payloads: Iterable[dict], budget: int = None) -> list[str]:
+    """Construit les notes de la Merge Request sous un budget d'octets par note.
+
+    Les documents sont consommés au fil de l'eau : chacun ajoute une ligne au
+    tableau de synthèse et un bloc repliable (<details>) à la page de détail
+    courante, une nouvelle page étant ouverte quand le budget serait dépassé.
+    Si synthèse et détails tiennent ensemble dans le budget, une seule note
+    est produite. Sinon la première note est la synthèse compacte (compteurs
+    et index des documents, tronqué au besoin), suivie des pages de détail.
+
+    Args:
+        rapports: Itérable produit par lire_rapports().
+        payloads: Itérable produit par lire_payloads().
+        budget:   Taille maximale d'une note en octets (défaut : KOS_MR_NOTE_OCTETS).
+
+    Returns:
+        Notes Markdown, synthèse en tête.
+    """
+    budget = budget or NOTE_OCTETS_MAX
+    reserve = min(512, budget // 4)                        # en-têtes de page et pied de note
+    compteurs = {"REJET": 0, "AVERTISSEMENT": 0, "CONFORME": 0}
+    index: list[str] = []
+    pages: list[list[str]] = [[]]
+    taille_page = 0
+    for document, est_rapport in itertools.chain(((r, True) for r in rapports), ((p, False) for p in payloads)):
+        verdict = document["data"]["verdict"]["verdict"] if est_rapport else "CONFORME"
+        compteurs[verdict] = compteurs.get(verdict, 0) + 1
+        index.append(_ligne_index(document, est_rapport))
+        bloc = _bloc_details(document, est_rapport, budget - reserve)
+        if pages[-1] and taille_page + _octets(bloc) > budget - reserve:
+            pages.append([])
+            taille_page = 0
+        pages[-1].append(bloc)
+        taille_page += _octets(bloc)
+
+    total = sum(compteurs.values())
+    if not total:
+        return [_entete(0) + "\n⚠️ **Aucun document trouvé dans E3.1_Dropzone_Factures.**"]
+
+    synthese = _entete(total) + "\n".join([
         "| 🔴 REJETS | 🟡 AVERTISSEMENTS | 🟢 CONFORMES |",
         "|---|---|---|",
-        f"| {n_rejets} | {n_avert} | {len(payloads)} |",
-        "",
-        "---",
+        f"| {compteurs['REJET']} | {compteurs['AVERTISSEMENT']} | {compteurs['CONFORME']} |",
         "",
-    ]
+    ])
+    pied = "\n*Powered by ERGO KOS_COMPTA · Anthropic Claude API · GitLab CI/CD*"
+
+    if len(pages) == 1 and _octets(synthese) + taille_page + _octets(pied) + 2 <= budget:
+        return [synthese + "\n" + "\n".join(pages[0]) + pied]
+
+    lignes = ["| Verdict | Document | Risque | Action ERP |", "|---|---|---|---|"]
+    place = budget - reserve - _octets(synthese)
+    for n, ligne in enumerate(index):
+        place -= _octets(ligne) + 1
+        if place < 0:
+            lignes.append(f"\n… et {len(index) - n} autre(s) document(s) : voir les notes de détail.")
+            break
+        lignes.append(ligne)
+    lignes += ["", f"📄 **Détail par document : {len(pages)} note(s) ci-dessous.**", pied]
+    notes = [synthese + "\n".join(lignes)]
+    notes += [f"### 📄 KOS_COMPTA — Détails ({i}/{len(pages)})\n\n" + "\n".join(page)
+              for i, page in enumerate(pages, start=1)]
+    return notes
+
+
+def _session(token: str) -> requests.Session:
+    """Session HTTP réutilisée par toutes les notes (pool de connexions keep-alive)."""
+    session = requests.Session()
+    session.headers.update({"PRIVATE-TOKEN": token, "Content-Type": "application/json"})
+    adaptateur = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, PARALLELISME))
+    session.mount("https://", adaptateur)
+    session.mount("http://", adaptateur)
+    return session
+
+
+def _poster_note(session: requests.Session, url: str, body: str) -> Optional[int]:
+    """Poste une note, avec reprise sur erreur transitoire et attente exponentielle.
+
+    Sont rejoués : échec de connexion (requête non reçue) et statuts 429 / 502 /
+    503 / 504 (Retry-After respecté). Un délai de lecture dépassé n'est pas
+    rejoué : la note a pu être créée.
 
-    for r in rapports:
-        lignes += [formater_rapport(r), "", "---", ""]
+    Returns:
+        Identifiant de la note créée, ou None en cas d'échec.
+    """
+    for tentative in range(1, TENTATIVES + 1):
+        attente = min(ATTENTE_MAX_S, 2 ** (tentative - 1)) + random.uniform(0, 0.5)
+        try:
+            response = session.post(url, json={"body": body}, timeout=30)
+        except requests.ConnectionError as e:
+            motif = f"connexion : {e}"
+        except requests.RequestException as e:
+            print(f"  [ERROR] Requête GitLab échouée : {e}", file=sys.stderr)
+            return None
+        else:
+            if response.status_code in (200, 201):
+                return response.json().get("id")
+            if response.status_code not in STATUTS_TRANSITOIRES:
+                print(f"  [ERROR] GitLab API {response.status_code} : {response.text[:300]}", file=sys.stderr)
+                return None
+            motif = f"HTTP {response.status_code}"
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                attente = min(ATTENTE_MAX_S, int(retry_after))
+        if tentative < TENTATIVES:
+            print(f"  [WARN] {motif} — nouvelle tentative dans {attente:.1f} s ({tentative}/{TENTATIVES})")
+            time.sleep(attente)
+    print(f"  [ERROR] Note non publiée après {TENTATIVES} tentative(s) : {motif}", file=sys.stderr)
+    return None
+
+
+def publier_notes(project_id: str, mr_iid: str, token: str, notes: list[str], api_url: str = None) -> bool:
+    """Publie les notes d'une Merge Request : synthèse d'abord, puis détails en parallèle.
 
-    for p in payloads:
-        lignes += [formater_payload(p), "", "---", ""]
+    Args:
+        project_id: ID numérique (ou chemin) du projet GitLab.
+        mr_iid:     IID de la Merge Request (numéro interne au projet).
+        token:      Personal Access Token GitLab (PRIVATE-TOKEN).
+        notes:      Notes produites par construire_notes().
+        api_url:    Racine de l'API v4 (défaut : CI_API_V4_URL, sinon gitlab.com).
 
-    lignes += ["", "*Powered by ERGO KOS_COMPTA · Anthropic Claude API · GitLab CI/CD*"]
-    return "\n".join(lignes)
+    Returns:
+        True si toutes les notes ont été publiées.
+    """
+    api_url = (api_url or os.environ.get("CI_API_V4_URL") or "https://gitlab.com/api/v4").rstrip("/")
+    url = f"{api_url}/projects/{quote(str(project_id), safe='')}/merge_requests/{mr_iid}/notes"
+    print(f"  → POST {url} ({len(notes)} note(s))")
+    with _session(token) as session:
+        premiere = _poster_note(session, url, notes[0])
+        if premiere is None:
+            return False
+        print(f"  ✓ Synthèse publiée (note_id={premiere})")
+        with ThreadPoolExecutor(max_workers=max(1, min(PARALLELISME, len(notes) - 1))) as pool:
+            details = list(pool.map(lambda note: _poster_note(session, url, note), notes[1:]))
+    publiees = sum(d is not None for d in details)
+    if details:
+        print(f"  ✓ {publiees}/{len(details)} note(s) de détail publiée(s)")
+    return publiees == len(details)
 
 
 def poster_commentaire_mr(project_id: str, mr_iid: str, token: str, body: str) -> bool:
@@ -224,32 +458,19 @@ def poster_commentaire_mr(project_id: str, mr_iid: str, token: str, body: str) -
     Returns:
         True si le commentaire a été publié avec succès, False sinon.
     """
-    url     = f"https://gitlab.com/api/v4/projects/{project_id}/merge_requests/{mr_iid}/notes"
-    headers = {"PRIVATE-TOKEN": token, "Content-Type": "application/json"}
-
-    print(f"  → POST {url}")
-    try:
-        response = requests.post(url, headers=headers, json={"body": body}, timeout=30)
-        if response.status_code in (200, 201):
-            print(f"  ✓ Commentaire publié (note_id={response.json().get('id', '?')})")
-            return True
-        print(f"  [ERROR] GitLab API {response.status_code} : {response.text[:300]}", file=sys.stderr)
-        return False
-    except requests.RequestException as e:
-        print(f"  [ERROR] Requête GitLab échouée : {e}", file=sys.stderr)
-        return False
+    return publier_notes(project_id, mr_iid, token, [body])
 
 
-def afficher_commentaire_local(body: str) -> None:
-    """Affiche le commentaire en mode local (aucun contexte MR détecté).
+def afficher_commentaire_local(notes: list[str]) -> None:
+    """Affiche les notes en mode local (aucun contexte MR détecté).
 
     Args:
-        body: Corps Markdown du commentaire.
+        notes: Notes Markdown produites par construire_notes().
     """
     print("\n" + "═" * 60)
     print("  RAPPORT (mode local — pas de MR GitLab détectée)")
     print("═" * 60)
-    print(body)
+    print(("\n\n" + "─" * 60 + "\n\n").join(notes))
     print("═" * 60 + "\n")
 
 
@@ -263,6 +484,10 @@ def main() -> None:
     parser.add_argument("--mr-iid",      type=str)
     parser.add_argument("--project-id",  type=str)
     parser.add_argument("--token",       type=str)
+    parser.add_argument("--manifeste",   type=str, help="Manifeste du run (défaut : E4_AUDIT_ET_ROUTAGE/MANIFESTE_RUN.json)")
+    parser.add_argument("--tout",        action="store_true", help="Ignorer le manifeste et lire tout E4.1 / E4.2")
+    parser.add_argument("--api-url",     type=str, help="Racine de l'API GitLab v4 (défaut : CI_API_V4_URL)")
+    parser.add_argument("--octets-max",  type=int, help="Taille maximale d'une note (défaut : KOS_MR_NOTE_OCTETS)")
     args = parser.parse_args()
 
     report_dir  = Path(args.report_dir)  if args.report_dir  else Path("E4_AUDIT_ET_ROUTAGE/E4.1_Rapports_Conformite")
@@ -273,20 +498,31 @@ def main() -> None:
 
     print(f"\n[{datetime.now():%Y-%m-%d %H:%M:%S}] [REPORT] Lecture des résultats d'audit")
 
-    rapports = lire_rapports(report_dir)
-    payloads = lire_payloads(payload_dir)
-
-    print(f"  → {len(rapports)} rapport(s) de rejet/avertissement")
-    print(f"  → {len(payloads)} payload(s) ERP conforme(s)")
+    chemin_manifeste = Path(args.manifeste) if args.manifeste else report_dir.parent / "MANIFESTE_RUN.json"
+    manifeste = None if args.tout else lire_manifeste(chemin_manifeste)
+    if manifeste is not None:
+        print(f"  → Manifeste {manifeste.get('iteration_id') or '(aucun document)'} "
+              f"(pipeline {manifeste.get('pipeline_id')})")
+        rapports = lire_rapports(report_dir, manifeste["rapports"])
+        payloads = lire_payloads(payload_dir, manifeste["payloads"])
+        print(f"  → {len(manifeste['rapports'])} rapport(s) de rejet/avertissement")
+        print(f"  → {len(manifeste['payloads'])} payload(s) ERP conforme(s)")
+    else:
+        if not args.tout:
+            print(f"  [WARN] Pas de manifeste ({chemin_manifeste.name}) — lecture de tout E4.1 / E4.2")
+        rapports = lire_rapports(report_dir)
+        payloads = lire_payloads(payload_dir)
 
-    commentaire = construire_commentaire(rapports, payloads)
+    notes = construire_notes(rapports, payloads, args.octets_max)
+    print(f"  → {len(notes)} note(s), {max(_octets(n) for n in notes)} octets max "
+          f"(budget {args.octets_max or NOTE_OCTETS_MAX})")
 
     if mr_iid and project_id and token:
         print(f"\n[{datetime.now():%Y-%m-%d %H:%M:%S}] [REPORT] Publication sur MR !{mr_iid} (projet {project_id})")
-        sys.exit(0 if poster_commentaire_mr(project_id, mr_iid, token, commentaire) else 1)
+        sys.exit(0 if publier_notes(project_id, mr_iid, token, notes, args.api_url) else 1)
     else:
         print(f"\n[{datetime.now():%Y-%m-%d %H:%M:%S}] [REPORT] Pas de contexte MR — affichage local")
-        afficher_commentaire_local(commentaire)
+        afficher_commentaire_local(notes)
         sys.exit(0)
 
 
@@ -0,0 +1,288 @@
+# ERGO_ID: SCHEMA_VERDICT
+"""
+schema_verdict.py
+=================
+ERGO KOS_COMPTA — Schéma JSON du verdict de conformité (source unique)
+
+Le verdict produit par le LLM est défini une seule fois ici, en JSON Schema
+(draft 2020-12), et partagé par :
+
+    agent_compliance  : sortie structurée imposée (tool use Anthropic, format
+                        JSON Schema des fournisseurs de repli) puis validation
+    export_erp        : valider_structure_json() (bloc imputation_recommandee)
+    publish_report    : contrôle des rapports non estampillés (anciens runs)
+
+Les rapports et payloads écrits par router_verdict() portent "schema":
+SCHEMA_ID ; un document estampillé a déjà été validé et n'est pas revalidé.
+
+Le validateur est « compilé » : le schéma est transformé une fois en
+fermetures Python imbriquées (pas d'interprétation du schéma à chaque
+appel, aucune dépendance). Seuls les mots-clés utilisés par les schémas
+KOS sont pris en charge : type, enum, const, required, properties,
+additionalProperties, items, minItems, maxItems, minimum, maximum,
+minLength, pattern.
+
+Usage :
+    python schema_verdict.py --exporter verdict.schema.json
+    python schema_verdict.py --valider E4_AUDIT_ET_ROUTAGE/E4.1_Rapports_Conformite/RAPPORT_x.json
+
+ERGO_REGISTRY:
+    role         : Schéma JSON unique du verdict LLM + validateur compilé (stdlib)
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : (stdlib uniquement)
+    entrees      : verdicts LLM, rapports E4.1, payloads E4.2
+    sorties      : liste d'erreurs de validation ; export du schéma (--exporter)
+    variable_env : (aucune)
+"""
+
+import argparse
+import json
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable
+
+
+SCHEMA_ID   = "kos_compta/verdict/1"
+OUTIL       = "enregistrer_verdict"
+OUTIL_LOT   = "enregistrer_verdicts"
+
+_MONTANT = {"type": "number", "minimum": 0}
+
+SCHEMA_IMPUTATION: dict = {
+    "type": "object",
+    "description": "Écriture comptable suggérée (montants en euros, TTC = HT + TVA).",
+    "properties": {
+        "compte_debit":       {"type": "string", "description": "Compte PCG de charge ou d'immobilisation."},
+        "compte_credit":      {"type": "string", "description": "Compte PCG fournisseur (ex: 401000)."},
+        "montant_ht":         _MONTANT,
+        "tva_deductible":     _MONTANT,
+        "tva_non_deductible": _MONTANT,
+        "montant_ttc":        _MONTANT,
+    },
+    "required": ["compte_debit", "compte_credit", "montant_ht", "tva_deductible",
+                 "tva_non_deductible", "montant_ttc"],
+}
+
+SCHEMA_VERDICT: dict = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": SCHEMA_ID,
+    "title": "Verdict de conformité KOS_COMPTA",
+    "type": "object",
+    "properties": {
+        "verdict": {"type": "string", "enum": ["CONFORME", "REJET", "AVERTISSEMENT"]},
+        "motif": {"type": "string", "minLength": 1, "description": "Explication courte et précise."},
+        "articles_appliques": {"type": "array", "items": {"type": "string"},
+                               "description": "Références légales citées."},
+        "corrections_requises": {"type": "array", "items": {"type": "string"},
+                                 "description": "Corrections si applicable (liste vide sinon)."},
+        "imputation_recommandee": SCHEMA_IMPUTATION,
+        "niveau_risque": {"type": "string", "enum": ["FAIBLE", "MOYEN", "ELEVE"]},
+        "action_erp": {"type": "string", "enum": ["INJECTER", "BLOQUER", "REVUE_HUMAINE"]},
+        "confiance": {"type": "number", "minimum": 0, "maximum": 1,
+                      "description": "Certitude du verdict ; inférieure à 0.85 si un doute subsiste."},
+    },
+    "required": ["verdict", "motif", "articles_appliques", "corrections_requises",
+                 "imputation_recommandee", "niveau_risque", "action_erp", "confiance"],
+}
+
+VERDICTS = tuple(SCHEMA_VERDICT["properties"]["verdict"]["enum"])
+
+
+def schema_lot() -> dict:
+    """Schéma de la réponse d'un audit groupé : {"verdicts": [verdict + document_id]}.
+
+    Returns:
+        JSON Schema objet (une entrée d'outil doit être un objet).
+    """
+    element = {
+        **{k: v for k, v in SCHEMA_VERDICT.items() if not k.startswith("$") and k != "title"},
+        "properties": {"document_id": {"type": "string", "minLength": 1},
+                       **SCHEMA_VERDICT["properties"]},
+        "required": ["document_id", *SCHEMA_VERDICT["required"]],
+    }
+    return {
+        "$schema": SCHEMA_VERDICT["$schema"],
+        "$id": f"{SCHEMA_ID}/lot",
+        "type": "object",
+        "properties": {"verdicts": {"type": "array", "minItems": 1, "items": element}},
+        "required": ["verdicts"],
+    }
+
+
+# ─────────────────────────────────────────────
+# VALIDATEUR COMPILÉ
+# ─────────────────────────────────────────────
+
+_TYPES: dict[str, Callable[[Any], bool]] = {
+    "object":  lambda v: isinstance(v, dict),
+    "array":   lambda v: isinstance(v, list),
+    "string":  lambda v: isinstance(v, str),
+    "number":  lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null":    lambda v: v is None,
+}
+
+
+def compiler(schema: dict) -> Callable[[Any, str], list[str]]:
+    """Compile un JSON Schema (sous-ensemble KOS) en fonction de validation.
+
+    Args:
+        schema: Schéma à compiler.
+
+    Returns:
+        Fonction (valeur, chemin) → liste des erreurs ("chemin : message"), vide si valide.
+
+    Raises:
+        ValueError: Si le schéma utilise un type inconnu.
+    """
+    controles: list[Callable[[Any, str], list[str]]] = []
+
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        inconnus = [t for t in types if t not in _TYPES]
+        if inconnus:
+            raise ValueError(f"Type JSON Schema non pris en charge : {inconnus}")
+        tests = [_TYPES[t] for t in types]
+        attendu = " | ".join(types)
+
+        def _type(v, chemin):
+            return [] if any(t(v) for t in tests) else [f"{chemin} : type {type(v).__name__}, attendu {attendu}"]
+        controles.append(_type)
+
+    if "enum" in schema:
+        valeurs = schema["enum"]
+        controles.append(lambda v, c: [] if v in valeurs else [f"{c} : {v!r} hors {valeurs}"])
+    if "const" in schema:
+        constante = schema["const"]
+        controles.append(lambda v, c: [] if v == constante else [f"{c} : {v!r} ≠ {constante!r}"])
+
+    nombre = _TYPES["number"]
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+        controles.append(lambda v, c: [f"{c} : {v} < {minimum}"] if nombre(v) and v < minimum else [])
+    if "maximum" in schema:
+        maximum = schema["maximum"]
+        controles.append(lambda v, c: [f"{c} : {v} > {maximum}"] if nombre(v) and v > maximum else [])
+    if "minLength" in schema:
+        longueur = schema["minLength"]
+        controles.append(lambda v, c: [f"{c} : longueur < {longueur}"]
+                         if isinstance(v, str) and len(v) < longueur else [])
+    if "pattern" in schema:
+        motif = re.compile(schema["pattern"])
+        controles.append(lambda v, c: [f"{c} : ne respecte pas {motif.pattern!r}"]
+                         if isinstance(v, str) and not motif.search(v) else [])
+
+    if "required" in schema:
+        requis = tuple(schema["required"])
+        controles.append(lambda v, c: [f"{c}.{k} : champ obligatoire absent" for k in requis if k not in v]
+                         if isinstance(v, dict) else [])
+    if "properties" in schema or "additionalProperties" in schema:
+        proprietes = {k: compiler(s) for k, s in schema.get("properties", {}).items()}
+        supplementaires = schema.get("additionalProperties", True)
+        valider_sup = compiler(supplementaires) if isinstance(supplementaires, dict) else None
+
+        def _proprietes(v, chemin):
+            if not isinstance(v, dict):
+                return []
+            erreurs: list[str] = []
+            for cle, valeur in v.items():
+                sous_chemin = f"{chemin}.{cle}"
+                if cle in proprietes:
+                    erreurs += proprietes[cle](valeur, sous_chemin)
+                elif supplementaires is False:
+                    erreurs.append(f"{sous_chemin} : champ non autorisé")
+                elif valider_sup is not None:
+                    erreurs += valider_sup(valeur, sous_chemin)
+            return erreurs
+        controles.append(_proprietes)
+
+    if "items" in schema:
+        element = compiler(schema["items"])
+        controles.append(lambda v, c: [e for i, x in enumerate(v) for e in element(x, f"{c}[{i}]")]
+                         if isinstance(v, list) else [])
+    if "minItems" in schema:
+        mini = schema["minItems"]
+        controles.append(lambda v, c: [f"{c} : moins de {mini} élément(s)"]
+                         if isinstance(v, list) and len(v) < mini else [])
+    if "maxItems" in schema:
+        maxi = schema["maxItems"]
+        controles.append(lambda v, c: [f"{c} : plus de {maxi} élément(s)"]
+                         if isinstance(v, list) and len(v) > maxi else [])
+
+    def valider(valeur: Any, chemin: str = "$") -> list[str]:
+        erreurs: list[str] = []
+        for controle in controles:
+            erreurs += controle(valeur, chemin)
+            if erreurs and controle is controles[0] and "type" in schema:
+                break                          # type faux : les autres contrôles n'ont pas de sens
+        return erreurs
+
+    return valider
+
+
+@lru_cache(maxsize=None)
+def _validateur(nom: str) -> Callable[[Any, str], list[str]]:
+    """Validateurs compilés une seule fois par processus."""
+    return compiler({"verdict": SCHEMA_VERDICT, "imputation": SCHEMA_IMPUTATION}[nom])
+
+
+def valider(verdict: Any) -> list[str]:
+    """Valide un verdict contre SCHEMA_VERDICT (champs additionnels tolérés : _meta…).
+
+    Args:
+        verdict: Objet JSON décodé.
+
+    Returns:
+        Erreurs de validation (liste vide si le verdict est conforme au schéma).
+    """
+    return _validateur("verdict")(verdict, "$")
+
+
+def valider_imputation(imputation: Any) -> list[str]:
+    """Valide un bloc imputation_recommandee contre SCHEMA_IMPUTATION.
+
+    Args:
+        imputation: Bloc imputation_recommandee décodé.
+
+    Returns:
+        Erreurs de validation (liste vide si valide).
+    """
+    return _validateur("imputation")(imputation, "$.imputation_recommandee")
+
+
+def est_estampille(document: dict) -> bool:
+    """Indique si un rapport / payload a été écrit après validation au schéma courant."""
+    return isinstance(document, dict) and document.get("schema") == SCHEMA_ID
+
+
+# ─────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────
+
+def main() -> None:
+    """Point d'entrée CLI : export du schéma ou validation de fichiers."""
+    parser = argparse.ArgumentParser(description="ERGO KOS_COMPTA — Schéma JSON du verdict de conformité")
+    parser.add_argument("--exporter", type=str, help="Écrire SCHEMA_VERDICT dans ce fichier")
+    parser.add_argument("--valider", type=str, nargs="+", help="Rapports / verdicts JSON à valider")
+    args = parser.parse_args()
+
+    if args.exporter:
+        Path(args.exporter).write_text(json.dumps(SCHEMA_VERDICT, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"  ✓ Schéma exporté : {args.exporter}")
+    invalides = 0
+    for fichier in args.valider or []:
+        data = json.loads(Path(fichier).read_text(encoding="utf-8"))
+        erreurs = valider(data.get("verdict", data) if isinstance(data.get("verdict"), dict) else data)
+        invalides += bool(erreurs)
+        print(f"  {'✗' if erreurs else '✓'} {fichier}")
+        for erreur in erreurs:
+            print(f"      - {erreur}")
+    sys.exit(1 if invalides else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# ERGO_ID: SEQUENCE_KOS
+"""
+sequence_kos.py
+===============
+ERGO KOS_COMPTA — Allocation atomique des identifiants séquentiels
+
+Compteurs nommés (ITER, ERGO, DOC…) dans une petite base SQLite : chaque
+allocation est une transaction `BEGIN IMMEDIATE` (verrou d'écriture pris
+avant la lecture), de sorte que des jobs CI ou des workers d'audit parallèles
+obtiennent toujours des numéros distincts, sans relire ni réécrire un log.
+
+Au premier usage d'un compteur, sa valeur de départ est le plus grand
+identifiant déjà émis (plancher fourni par l'appelant) : la numérotation
+historique ITER_XXXX / ERGO_XXXX / DOC_XXXX continue sans trou ni doublon.
+
+ERGO_REGISTRY:
+    role         : Sequences atomiques ITER_ / ERGO_ / DOC_ (SQLite BEGIN IMMEDIATE)
+    version      : 1.0.0
+    auteur       : ERGO Capital / Adam
+    dependances  : sqlite3 (stdlib)
+    entrees      : plancher calculé par l'appelant (journal, DOC_INDEX)
+    sorties      : E0_MOTEUR_AGENTIQUE/logs/SEQUENCES.sqlite3
+"""
+
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Iterable, Union
+
+
+SEQUENCES_DB = Path(__file__).parent / "logs" / "SEQUENCES.sqlite3"
+
+
+def _connecter() -> sqlite3.Connection:
+    """Ouvre la base des séquences en mode autocommit (transactions explicites)."""
+    SEQUENCES_DB.parent.mkdir(parents=True, exist_ok=True)
+    cnx = sqlite3.connect(SEQUENCES_DB, timeout=30, isolation_level=None)
+    cnx.execute("PRAGMA journal_mode=WAL")
+    cnx.execute("CREATE TABLE IF NOT EXISTS sequences (nom TEXT PRIMARY KEY, valeur INTEGER NOT NULL)")
+    return cnx
+
+
+def max_identifiant(entrees: Iterable[dict], cle: str) -> int:
+    """Plus grand numéro trouvé dans un champ identifiant (ex: "ITER_0042" → 42).
+
+    Args:
+        entrees: Entrées existantes (journal, index).
+        cle:     Champ portant l'identifiant.
+
+    Returns:
+        Numéro maximal, 0 si aucun identifiant exploitable.
+    """
+    maximum = 0
+    for entree in entrees:
+        trouve = re.search(r"(\d+)$", str(entree.get(cle) or ""))
+        if trouve:
+            maximum = max(maximum, int(trouve.group(1)))
+    return maximum
+
+
+def allouer(nom: str, plancher: Union[int, Callable[[], int]] = 0, quantite: int = 1) -> int:
+    """Réserve atomiquement le(s) prochain(s) numéro(s) d'une séquence.
+
+    Args:
+        nom:      Nom de la séquence (ex: "ITER", "ERGO", "DOC").
+        plancher: Plus grand numéro déjà émis hors séquence. Un callable n'est
+                  évalué qu'à la création du compteur (amorçage depuis l'historique).
+        quantite: Nombre de numéros consécutifs à réserver.
+
+    Returns:
+        Premier numéro réservé (les suivants sont premier + 1 … premier + quantite - 1).
+    """
+    with closing(_connecter()) as cnx:
+        cnx.execute("BEGIN IMMEDIATE")
+        try:
+            ligne = cnx.execute("SELECT valeur FROM sequences WHERE nom = ?", (nom,)).fetchone()
+            if ligne is None:
+                courant = plancher() if callable(plancher) else plancher
+            else:
+                courant = max(ligne[0], 0 if callable(plancher) else plancher)
+            cnx.execute(
+                "INSERT INTO sequences (nom, valeur) VALUES (?, ?)"
+                " ON CONFLICT(nom) DO UPDATE SET valeur = excluded.valeur",
+                (nom, courant + quantite),
+            )
+            cnx.execute("COMMIT")
+        except BaseException:
+            cnx.execute("ROLLBACK")
+            raise
+    return courant + 1
+
+
+def identifiant(nom: str, plancher: Union[int, Callable[[], int]] = 0) -> str:
+    """Alloue et formate un identifiant "<NOM>_XXXX" (ex: "ITER_0043").
+
+    Args:
+        nom:      Nom de la séquence, utilisé comme préfixe.
+        plancher: Voir allouer().
+
+    Returns:
+        Identifiant formaté sur 4 chiffres minimum.
+    """
+    return f"{nom}_{allouer(nom, plancher):04d}"
@@ -1,9 +1,10 @@
 # ERGO_ID: CODE_REGISTER
 """
 system_code_register.py
-Greffier CLI — enregistre chaque action de code dans SYSTEM_LOG.json.
+Greffier CLI — enregistre chaque action de code dans le journal SYSTEM_LOG.
 Traçabilité complète de l'infrastructure : qui a créé quoi, quand, pourquoi.
 Appelable directement en CI/CD sans intervention humaine.
+Écriture append-only via journal_kos (SYSTEM_LOG.json : journal_kos.py --export).
 
 Usage :
     python system_code_register.py --fichier agent.py --action CREATED --detail "Pipeline principal"
@@ -12,17 +13,18 @@ Usage :
 """
 
 import argparse
-import json
 import sys
 from pathlib import Path
 from datetime import datetime
 
+import journal_kos
+import sequence_kos
+
 # ─────────────────────────────────────────────
 # CONFIG
 # ─────────────────────────────────────────────
 
 BASE_DIR   = Path(__file__).parent.parent
-SYSTEM_LOG = Path(__file__).parent / "logs" / "SYSTEM_LOG.json"
 
 ACTIONS_VALIDES = [
     "CREATED",      # fichier créé pour la première fois
@@ -40,26 +42,19 @@ ACTIONS_VALIDES = [
 # ─────────────────────────────────────────────
 
 def lire_log() -> list:
-    if not SYSTEM_LOG.exists():
-        return []
-    try:
-        return json.loads(SYSTEM_LOG.read_text(encoding="utf-8"))
-    except json.JSONDecodeError:
-        print("[ERROR] SYSTEM_LOG.json corrompu — réinitialisation", file=sys.stderr)
-        return []
-
-
-def ecrire_log(entrees: list):
-    SYSTEM_LOG.write_text(
-        json.dumps(entrees, ensure_ascii=False, indent=2),
-        encoding="utf-8"
+    return list(journal_kos.lire("SYSTEM_LOG"))
+
+
+def prochaine_iteration() -> int:
+    """Alloue le prochain numéro ERGO (compteur partagé avec pdf_extractor.log_system)."""
+    return sequence_kos.allouer(
+        "ERGO", lambda: sequence_kos.max_identifiant(journal_kos.lire("SYSTEM_LOG"), "ergo_id")
     )
 
 
 def ajouter_entree(fichier: str, action: str, detail: str, auteur: str) -> dict:
-    entrees = lire_log()
-    iteration = len(entrees) + 1
-    entree = {
+    iteration = prochaine_iteration()
+    return journal_kos.ajouter("SYSTEM_LOG", {
         "iteration": iteration,
         "timestamp": datetime.now().isoformat(),
         "fichier": fichier,
@@ -67,10 +62,7 @@ def ajouter_entree(fichier: str, action: str, detail: str, auteur: str) -> dict:
         "detail": detail,
         "auteur": auteur,
         "ergo_id": f"ERGO_{iteration:04d}"
-    }
-    entrees.append(entree)
-    ecrire_log(entrees)
-    return entree
+    })
 
 
 # ─────────────────────────────────────────────
@@ -78,14 +70,14 @@ def ajouter_entree(fichier: str, action: str, detail: str, auteur: str) -> dict:
 # ─────────────────────────────────────────────
 
 def afficher_log(n: int = None):
-    entrees = lire_log()
-    if not entrees:
-        print("[INFO] SYSTEM_LOG.json vide — aucune entrée.")
+    total = journal_kos.compter("SYSTEM_LOG")
+    if not total:
+        print("[INFO] SYSTEM_LOG vide — aucune entrée.")
         return
 
-    affichees = entrees[-n:] if n else entrees
+    affichees = journal_kos.dernieres("SYSTEM_LOG", n) if n else lire_log()
     print(f"\n{'─'*60}")
-    print(f"  SYSTEM_LOG — {len(entrees)} entrées totales")
+    print(f"  SYSTEM_LOG — {total} entrées totales")
     print(f"{'─'*60}")
     for e in affichees:
         ergo_id = e.get('ergo_id', 'SYSTEM')